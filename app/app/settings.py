@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -220,3 +221,63 @@ SOCIAL_AUTH_PIPELINE = (
 
 # Recommendation model settings
 RECOMMENDATION_MODEL_DIR = os.path.join(BASE_DIR, 'recommendation/ml_models/trained_model')
+
+# Per-request latency budget of model recommendations (0 disables it) and
+# how long finished recommendations are served from the cache (they are
+# recomputed in the background after half of that)
+RECOMMENDATION_LATENCY_BUDGET_MS = int(os.environ.get('RECOMMENDATION_LATENCY_BUDGET_MS', 300))
+RECOMMENDATION_CACHE_SECONDS = int(os.environ.get('RECOMMENDATION_CACHE_SECONDS', 300))
+# Leave out-of-stock products out of recommendations
+RECOMMENDATION_IN_STOCK_ONLY = os.environ.get('RECOMMENDATION_IN_STOCK_ONLY', 'false').lower() == 'true'
+
+# Session-based recommendations: products kept per user and idle timeout
+RECOMMENDATION_SESSION_SIZE = int(os.environ.get('RECOMMENDATION_SESSION_SIZE', 20))
+RECOMMENDATION_SESSION_IDLE_SECONDS = int(os.environ.get('RECOMMENDATION_SESSION_IDLE_SECONDS', 1800))
+
+# Trending products settings
+TRENDING_SNAPSHOT_PATH = os.path.join(RECOMMENDATION_MODEL_DIR, 'trending_snapshot.npz')
+TRENDING_FLUSH_SECONDS = int(os.environ.get('TRENDING_FLUSH_SECONDS', 60))
+TRENDING_CACHE_SECONDS = int(os.environ.get('TRENDING_CACHE_SECONDS', 5))
+
+# Autocomplete: popular products kept in the in-process prefix index
+# (0 disables it) and how often it is rebuilt
+AUTOCOMPLETE_PREFIX_SIZE = int(os.environ.get('AUTOCOMPLETE_PREFIX_SIZE', 50000))
+AUTOCOMPLETE_REBUILD_SECONDS = int(os.environ.get('AUTOCOMPLETE_REBUILD_SECONDS', 600))
+
+# Cache of product detail responses, keyed by product version; the
+# backend defaults to per-process memory (use FileBasedCache to share it)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'ecommerce'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 20000)),
+        },
+    },
+}
+PRODUCT_DETAIL_CACHE_SECONDS = int(os.environ.get('PRODUCT_DETAIL_CACHE_SECONDS', 3600))
+
+# Build product list pages as JSON in PostgreSQL instead of serializers
+PRODUCT_LIST_JSON_IN_DATABASE = os.environ.get('PRODUCT_LIST_JSON_IN_DATABASE', 'false').lower() == 'true'
+
+# How often the in-process facet count bitmaps are reloaded
+FACET_INDEX_REBUILD_SECONDS = int(os.environ.get('FACET_INDEX_REBUILD_SECONDS', 60))
+# How long the products matching a name, search or stock filter are reused
+# for facet counts (0 reads them for every request)
+FACET_BASE_BITMAP_SECONDS = int(os.environ.get('FACET_BASE_BITMAP_SECONDS', 5))
+
+# Offline item-to-item index files
+SIMILAR_PRODUCTS_INDEX_PATH = os.path.join(RECOMMENDATION_MODEL_DIR, 'similar_products.npz')
+FREQUENTLY_BOUGHT_TOGETHER_INDEX_PATH = os.path.join(RECOMMENDATION_MODEL_DIR, 'frequently_bought_together.npz')
+FREQUENTLY_BOUGHT_TOGETHER_STATE_PATH = os.path.join(RECOMMENDATION_MODEL_DIR, 'basket_counts.npz')
+
+# Content vectors for cold-start products and their weight against NCF scores
+CONTENT_VECTORS_PATH = os.path.join(RECOMMENDATION_MODEL_DIR, 'content_vectors.npy')
+RECOMMENDATION_CONTENT_WEIGHT = float(os.environ.get('RECOMMENDATION_CONTENT_WEIGHT', 0.5))
+
+# How long a pending order holds the stock of its items before the
+# release_expired_reservations sweep cancels it
+ORDER_RESERVATION_SECONDS = int(os.environ.get('ORDER_RESERVATION_SECONDS', 1800))
+
+# How often the in-process index of active coupons is reloaded
+COUPON_INDEX_SECONDS = int(os.environ.get('COUPON_INDEX_SECONDS', 30))
@@ -22,6 +22,8 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import MetricsView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -41,6 +43,7 @@ urlpatterns = [
     path('api/review/', include('review.urls')),
     path('api/product-history/', include('watched_list.urls')),
     path('api/recommendation/', include('recommendation.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
 if settings.DEBUG:
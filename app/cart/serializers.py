@@ -4,6 +4,7 @@ Serializer for the Cart API.
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
 
+from core.fieldsets import SparseFieldsMixin
 from core.models import (
     Cart,
     CartItem,
@@ -11,6 +12,7 @@ from core.models import (
     ProductVariant,
 )
 
+from product.cards import ProductCardListSerializer, ProductCardMixin
 from product.serializers import (
     ProductDetailSerializer,
     ProductGenericSerializer,
@@ -32,7 +34,8 @@ class CartSerializer(serializers.ModelSerializer):
         ]
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(
+        ProductCardMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for cart."""
     cart = CartSerializer(read_only=True)
     product_detail = ProductDetailSerializer()
@@ -50,16 +53,27 @@ class CartItemSerializer(serializers.ModelSerializer):
             'quantity',
         ]
         read_only_fields = ('id',)
+        list_serializer_class = ProductCardListSerializer
+
+    card_field = 'generic_product_info'
+    collapsed_fields = {
+        'cart': serializers.PrimaryKeyRelatedField(read_only=True),
+        'product_detail': serializers.PrimaryKeyRelatedField(read_only=True),
+        'generic_product_info': serializers.ReadOnlyField(
+            source='product_detail.product_id'),
+    }
+    column_sources = {'generic_product_info': ['product_detail']}
+
+    def card_product_id(self, obj):
+        return obj.product_detail.product_id if obj.product_detail else None
 
     @extend_schema_field(ProductGenericSerializer)
     def get_generic_product_info(self, obj):
         """Get generic product information"""
-        product = obj.product_detail.product if obj.product_detail else None
-        if product is None:
+        card = self.product_card(obj)
+        if not card:
             logger.warning("Product not found for the given product detail.")
-            return {}
-        serializer = ProductGenericSerializer(product, context=self.context)
-        return serializer.data
+        return card
 
     def create(self, validated_data):
         """Create a new cart item if it does not exist"""
@@ -1,11 +1,27 @@
 from rest_framework import (
     viewsets,
 )
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.db.models import Prefetch
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
+
 from cart.serializers import CartItemSerializer
-from core.models import CartItem, Cart
+from core.fieldsets import FIELDSET_PARAMETERS, SparseFieldsViewMixin
+from core.models import CartItem, Cart, Product, ProductDetail
+from product.serializers import ProductGenericSerializer
+from recommendation.associations import frequently_bought_together_index
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class CartItemViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for the Cart API.
     """
@@ -14,7 +30,70 @@ class CartItemViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         cart = Cart.objects.filter(user=self.request.user).first()
-        return CartItem.objects.filter(cart=cart).prefetch_related(
-            'cart',
-            'product_detail__detail_variant',
-        )
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return CartItem.objects.filter(cart=cart).prefetch_related(
+                'cart',
+                'product_detail__detail_variant',
+            )
+
+        queryset = CartItem.objects.filter(cart=cart).only(
+            *self.get_fieldset_columns())
+        if fieldset.expands('cart'):
+            queryset = queryset.prefetch_related('cart')
+        if fieldset.expands('product_detail'):
+            queryset = queryset.prefetch_related(
+                'product_detail__detail_variant')
+        elif fieldset.includes('generic_product_info'):
+            # Only the product ID of the detail is read
+            queryset = queryset.prefetch_related(Prefetch(
+                'product_detail', ProductDetail.objects.only('product')))
+        return queryset
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='limit',
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description='Number of suggestions (default 10)'
+            ),
+        ],
+        responses=ProductGenericSerializer(many=True),
+    )
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='frequently-bought-together',
+        pagination_class=None,
+    )
+    def frequently_bought_together(self, request):
+        """Suggest products often bought with the ones in the cart."""
+        try:
+            limit = max(
+                1, min(int(request.query_params.get('limit', 10)), 100))
+        except ValueError:
+            limit = 10
+
+        in_cart = set(self.get_queryset().values_list(
+            'product_detail__product_id', flat=True))
+        index = frequently_bought_together_index.get()
+        best = {}
+        if index is not None:
+            for product_id in in_cart:
+                for related_id, score in index.similar(product_id):
+                    if related_id not in in_cart \
+                            and score > best.get(related_id, 0):
+                        best[related_id] = score
+        suggested = sorted(best, key=best.get, reverse=True)[:limit]
+
+        products = Product.objects.prefetch_related('images').in_bulk(
+            suggested)
+        serializer = ProductGenericSerializer(
+            [products[pid] for pid in suggested if pid in products],
+            many=True,
+            context=self.get_serializer_context())
+        return Response({
+            'products': serializer.data,
+            'count': len(serializer.data),
+        })
@@ -0,0 +1,120 @@
+"""
+Helpers shared by the ``benchmark_*`` management commands.
+"""
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Return ``{point: value}`` percentiles of timing samples."""
+    if not len(samples):
+        return {point: 0.0 for point in points}
+    values = np.percentile(np.asarray(samples, dtype=np.float64), points)
+    return dict(zip(points, values.tolist()))
+
+
+def format_latency(samples, unit='ms'):
+    """Format p50/p95/p99 of samples given in seconds."""
+    scale = {'s': 1, 'ms': 1e3, 'us': 1e6}[unit]
+    return ' '.join(
+        f"p{point}={value * scale:.2f}{unit}"
+        for point, value in percentiles(samples).items())
+
+
+@contextmanager
+def timer(samples):
+    """Append the elapsed seconds of the block to ``samples``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - started)
+
+
+SEED_PREFIX = 'Benchmark product '
+
+# Words drawn at random into the names and descriptions of seeded products.
+SEED_WORDS = (
+    'cotton', 'leather', 'wool', 'denim', 'silk', 'linen', 'running',
+    'casual', 'formal', 'vintage', 'summer', 'winter', 'shoe', 'boot',
+    'jacket', 'shirt', 'dress', 'skirt', 'scarf', 'hat', 'bag', 'wallet',
+    'black', 'white', 'blue', 'red', 'green', 'slim', 'classic', 'sport',
+)
+
+
+def seed_products(count, batch_size=100000):
+    """Insert ``count`` synthetic products with random sort keys.
+
+    Rows are generated inside PostgreSQL; columns without a random value
+    get their model default. Returns the number of inserted products.
+    """
+    from django.db import connection, transaction
+    from core.models import Product
+
+    words = "ARRAY[{}]".format(', '.join(f"'{w}'" for w in SEED_WORDS))
+    word = f"({words})[1 + floor(random() * {len(SEED_WORDS)})::int]"
+    generated = {
+        'name': f"'{SEED_PREFIX}' || g || ' ' || {word} || ' ' || {word}",
+        'description': " || ' ' || ".join([word] * 12),
+        'price': 'round((random() * 500)::numeric, 2)',
+        'min_price': 'round((random() * 500)::numeric, 2)',
+        'min_price_sale_price': 'round((random() * 400)::numeric, 2)',
+        'min_sale_price': 'round((random() * 400)::numeric, 2)',
+        'max_sale_price': 'round((random() * 500)::numeric, 2)',
+        'average_rating': 'round((random() * 5)::numeric, 2)',
+        'review_count': '(random() * 1000)::int',
+        'updated_at': 'now()',
+    }
+    columns, expressions, params = [], [], []
+    for field in Product._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        columns.append(connection.ops.quote_name(field.column))
+        if field.name in generated:
+            expressions.append(generated[field.name])
+        else:
+            expressions.append('%s')
+            params.append(field.get_db_prep_save(
+                field.get_default(), connection))
+
+    table = connection.ops.quote_name(Product._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"SELECT {', '.join(expressions)} "
+        "FROM generate_series(%s, %s) AS g")
+    inserted = 0
+    with connection.cursor() as cursor:
+        while inserted < count:
+            size = min(batch_size, count - inserted)
+            with transaction.atomic():
+                cursor.execute(sql, params + [inserted + 1, inserted + size])
+            inserted += size
+        cursor.execute(f"ANALYZE {table}")
+    return inserted
+
+
+def delete_seeded_products():
+    """Delete the products created by ``seed_products``.
+
+    Rows referencing them (variants, facets, category links) go first.
+    """
+    from django.db import connection
+    from core.models import Product
+
+    quote = connection.ops.quote_name
+    table = quote(Product._meta.db_table)
+    seeded = f"SELECT id FROM {table} WHERE name LIKE %s"
+    params = [f"{SEED_PREFIX}%"]
+    dependents = [Product.category.through._meta.get_field('product')] + [
+        relation.field for relation in Product._meta.related_objects
+        if relation.one_to_many
+    ]
+    with connection.cursor() as cursor:
+        for field in dependents:
+            cursor.execute(
+                f"DELETE FROM {quote(field.model._meta.db_table)} "
+                f"WHERE {quote(field.column)} IN ({seeded})", params)
+        cursor.execute(f"DELETE FROM {table} WHERE name LIKE %s", params)
+        return cursor.rowcount
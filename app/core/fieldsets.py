@@ -0,0 +1,151 @@
+"""
+Sparse fieldsets for API responses.
+
+``?fields=id,name`` limits a list or detail response to the listed
+top-level fields. With ``fields``, related fields are rendered collapsed
+(as their primary keys) unless they are named in ``?expand=``, and
+views leave the relations and columns that are not rendered out of
+their queries. Without ``fields`` responses are complete.
+"""
+import copy
+
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+
+
+FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        name='fields',
+        type=str,
+        location=OpenApiParameter.QUERY,
+        description='Comma-separated fields to return, e.g. id,name; '
+                    'related fields are returned as IDs unless expanded'
+    ),
+    OpenApiParameter(
+        name='expand',
+        type=str,
+        location=OpenApiParameter.QUERY,
+        description='Comma-separated related fields to return nested '
+                    'when fields is given'
+    ),
+]
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class FieldSet:
+    """Fields requested from the top-level serializer of a response."""
+
+    def __init__(self, fields, expand=()):
+        self.expand = frozenset(expand)
+        self.fields = frozenset(fields) | self.expand
+
+    @classmethod
+    def from_request(cls, request, serializer_class):
+        """Parse ``fields`` and ``expand``; None when fields is not given.
+
+        Unknown names raise ValidationError.
+        """
+        params = request.query_params
+        if 'fields' not in params:
+            return None
+        fields = _names(params['fields'])
+        expand = _names(params.get('expand', ''))
+        serializer = serializer_class()
+        errors = {}
+        unknown = fields - set(serializer.fields)
+        if unknown:
+            errors['fields'] = (
+                f"Unknown fields {sorted(unknown)}. "
+                f"Must be among {list(serializer.fields)}")
+        collapsible = getattr(serializer, 'collapsed_fields', {})
+        unknown = expand - set(collapsible)
+        if unknown:
+            errors['expand'] = (
+                f"Cannot expand {sorted(unknown)}. "
+                f"Must be among {list(collapsible)}")
+        if errors:
+            raise serializers.ValidationError(errors)
+        return cls(fields, expand)
+
+    def includes(self, name):
+        return name in self.fields
+
+    def expands(self, name):
+        return name in self.expand
+
+    def __str__(self):
+        return (
+            f"fields={','.join(sorted(self.fields))};"
+            f"expand={','.join(sorted(self.expand))}")
+
+
+class SparseFieldsMixin:
+    """Serializer mixin applying the ``fieldset`` of its context.
+
+    ``collapsed_fields`` maps related fields to the field rendering them
+    when they are not expanded. ``column_sources`` names the model
+    columns read by fields whose source is not a column, such as method
+    fields; ``get_columns`` uses them to build an ``only()`` list.
+    """
+    collapsed_fields = {}
+    column_sources = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+        for name in list(fields):
+            if not fieldset.includes(name):
+                del fields[name]
+            elif name in self.collapsed_fields \
+                    and not fieldset.expands(name):
+                fields[name] = copy.deepcopy(self.collapsed_fields[name])
+        return fields
+
+    def get_columns(self):
+        """Model columns read by the fields, or None if not known."""
+        opts = self.Meta.model._meta
+        concrete = {field.name for field in opts.concrete_fields}
+        relations = {
+            field.get_accessor_name() if field.auto_created
+            and not field.concrete else field.name
+            for field in opts.get_fields() if field.is_relation
+        }
+        columns = {opts.pk.name}
+        for name, field in self.fields.items():
+            sources = self.column_sources.get(name, [field.source])
+            for source in sources:
+                root = source.split('.')[0]
+                if root in concrete:
+                    columns.add(root)
+                elif root not in relations:
+                    return None
+        return sorted(columns)
+
+
+class SparseFieldsViewMixin:
+    """View mixin reading the fieldset of list and detail requests."""
+    fieldset_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = None
+            if self.action in self.fieldset_actions:
+                self._fieldset = FieldSet.from_request(
+                    self.request, self.get_serializer_class())
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def get_fieldset_columns(self):
+        """Columns the response reads, or None when all are needed."""
+        if self.get_fieldset() is None:
+            return None
+        return self.get_serializer().get_columns()
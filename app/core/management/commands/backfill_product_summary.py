@@ -0,0 +1,43 @@
+"""
+Backfill the denormalized price and image summary of products.
+
+Bulk imports bypass the signals that maintain the summary, so run this
+after importing products, details or images.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from core.models import Product
+from product.signals import update_product_summary
+
+
+class Command(BaseCommand):
+    help = 'Recompute min/max prices and primary image of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Products updated per transaction (default 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Product.objects.aggregate(last=Max('id'))['last'] or 0
+        started = time.perf_counter()
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += update_product_summary(Product.objects.filter(
+                    id__gt=start, id__lte=start + batch_size))
+            self.stdout.write(
+                f"Updated {updated} products "
+                f"({updated / (time.perf_counter() - started):.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {updated} products in "
+            f"{time.perf_counter() - started:.1f}s"))
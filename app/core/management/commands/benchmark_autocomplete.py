@@ -0,0 +1,80 @@
+"""
+Measure autocomplete latency per keystroke.
+"""
+from django.core.management.base import BaseCommand
+
+from core.benchmark import (
+    SEED_WORDS,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product
+from product.autocomplete import Autocomplete, trigram_available
+
+
+class Command(BaseCommand):
+    help = 'Benchmark typeahead suggestions with and without prefix index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Insert this many synthetic products first',
+        )
+        parser.add_argument(
+            '--prefix-size',
+            type=int,
+            default=50000,
+            help='Products in the prefix index (default 50000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per typed text (default 5)',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the synthetic products afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} products...")
+            seed_products(options['seed'])
+        self.stdout.write(
+            f"Catalog: {Product.objects.count()} products, "
+            f"pg_trgm={'yes' if trigram_available() else 'no'}")
+
+        # Every keystroke of a few two-word names, plus typos.
+        phrases = [f"{a} {b}" for a, b in zip(SEED_WORDS, SEED_WORDS[1:])]
+        keystrokes = [
+            phrase[:end] for phrase in phrases[:10]
+            for end in range(1, len(phrase) + 1)]
+        typos = [phrase[:1] + phrase[2:] for phrase in phrases[:10]]
+
+        try:
+            with_index = Autocomplete(prefix_size=options['prefix_size'])
+            with_index.rebuild()
+            without_index = Autocomplete(prefix_size=0)
+            for label, suggester, texts, repeat in (
+                    ('prefix index', with_index, keystrokes,
+                     options['repeat']),
+                    ('database only', without_index, keystrokes, 1),
+                    ('typos', with_index, typos, 1)):
+                samples = []
+                for _ in range(repeat):
+                    for text in texts:
+                        with timer(samples):
+                            suggester.suggest(text)
+                self.stdout.write(
+                    f"{label}: {len(samples)} requests "
+                    f"{format_latency(samples)}")
+        finally:
+            if options['cleanup']:
+                deleted = delete_seeded_products()
+                self.stdout.write(f"Deleted {deleted} synthetic products")
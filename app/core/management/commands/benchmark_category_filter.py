@@ -0,0 +1,111 @@
+"""
+Compare EXISTS and DISTINCT join filtering of large categories.
+
+Synthetic products are linked to two of ``--children`` subcategories of
+one root, so the root covers the whole catalog and a join through the
+category links returns every product twice. A page (sorted by ``id`` and
+by price) and the exact count are timed for the root and one child,
+filtered with the product list's ``EXISTS`` semi-join and with
+``category__in`` plus ``DISTINCT``.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Category, Product
+from product.categories import CategoryProduct, in_subtree, subtree_ids
+
+
+class Command(BaseCommand):
+    help = 'Benchmark category filtering with EXISTS and with DISTINCT'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=200000,
+            help='Synthetic products to insert (default 200000)',
+        )
+        parser.add_argument(
+            '--children',
+            type=int,
+            default=4,
+            help='Subcategories of the benchmark root (default 4)',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Products per page (default 20)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Timed runs per query (default 10)',
+        )
+
+    def handle(self, *args, **options):
+        root = Category.objects.create(name=f"{SEED_PREFIX}root")
+        try:
+            children = self._seed(root, options)
+            for category in (root, children[0]):
+                self._benchmark(category, options)
+        finally:
+            deleted = delete_seeded_products()
+            Category.objects.filter(name__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _seed(self, root, options):
+        self.stdout.write(f"Seeding {options['seed']} products...")
+        seed_products(options['seed'])
+        children = [
+            Category.objects.create(
+                name=f"{SEED_PREFIX}{i}", parent_category=root)
+            for i in range(options['children'])]
+
+        quote = connection.ops.quote_name
+        links = quote(CategoryProduct._meta.db_table)
+        products = quote(Product._meta.db_table)
+        ids = [child.pk for child in children]
+        with connection.cursor() as cursor:
+            # Two distinct children per product
+            cursor.execute(f"""
+                INSERT INTO {links} (product_id, category_id)
+                SELECT id, (%s::bigint[])[1 + id %% %s]
+                FROM {products} WHERE name LIKE %s
+                UNION ALL
+                SELECT id, (%s::bigint[])[1 + (id + 1) %% %s]
+                FROM {products} WHERE name LIKE %s
+            """, [ids, len(ids), f"{SEED_PREFIX}%"] * 2)
+            cursor.execute(f"ANALYZE {links}")
+        return children
+
+    def _benchmark(self, category, options):
+        exists = Product.objects.filter(in_subtree(category.pk))
+        distinct = Product.objects.filter(
+            category__in=subtree_ids(category.pk)).distinct()
+        page_size = options['page_size']
+
+        self.stdout.write(
+            f"{category.name} ({exists.count()} products):")
+        for label, order in (
+                ('newest', ['-id']), ('price', ['min_price', 'id'])):
+            for method, queryset in (
+                    ('EXISTS', exists), ('DISTINCT', distinct)):
+                page = queryset.order_by(*order)[:page_size + 1]
+                pages, counts = [], []
+                for _ in range(options['repeat']):
+                    with timer(pages):
+                        list(page.all())
+                    with timer(counts):
+                        queryset.count()
+                self.stdout.write(
+                    f"  {label:6} {method:8} page {format_latency(pages)} | "
+                    f"count {format_latency(counts)}")
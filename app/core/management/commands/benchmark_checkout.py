@@ -0,0 +1,126 @@
+"""
+Checkout throughput for small and large orders.
+
+Orders of each ``--lines`` size are placed one after the other, through
+the order API and by checking out a cart refilled with that many items,
+against a synthetic product with that many variants and plenty of
+stock. Reports orders per second, latency and the queries of one order.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    timer,
+)
+from core.models import (
+    Cart,
+    CartItem,
+    Product,
+    ProductDetail,
+    ProductVariant,
+)
+from order.views import OrderViewSet
+
+BENCHMARK_EMAIL = 'benchmark-checkout@example.com'
+
+ADDRESS = {
+    'recipient_name': 'Benchmark buyer',
+    'recipient_phone_number': '0123456789',
+    'address_line': '1 Benchmark Street',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark placing orders of 1 and 50 lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines',
+            type=int,
+            nargs='+',
+            default=[1, 50],
+            help='Order sizes to benchmark (default 1 50)',
+        )
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=200,
+            help='Orders placed per size (default 200)',
+        )
+
+    def handle(self, *args, **options):
+        get_user_model().objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = get_user_model().objects.create_user(
+            email=BENCHMARK_EMAIL, password=None)
+        product = Product.objects.create(name=f"{SEED_PREFIX}checkout")
+        variants = ProductVariant.objects.bulk_create(
+            ProductVariant(product=product, size=str(i),
+                           stock_quantity=10 ** 9)
+            for i in range(max(options['lines'])))
+        details = ProductDetail.objects.bulk_create(
+            ProductDetail(product=product, detail_variant=variant,
+                          price=10, sale_price=8)
+            for variant in variants)
+        try:
+            self._benchmark(user, details, options)
+        finally:
+            # Orders and details reference the synthetic variants; delete
+            # them first.
+            user.delete()
+            ProductDetail.objects.filter(product=product).delete()
+            deleted = delete_seeded_products()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _benchmark(self, user, details, options):
+        host = next((
+            host.lstrip('.') for host in settings.ALLOWED_HOSTS
+            if host != '*'), 'localhost')
+        factory = APIRequestFactory()
+        create = OrderViewSet.as_view({'post': 'create'})
+        checkout = OrderViewSet.as_view({'post': 'checkout'})
+        cart, _ = Cart.objects.get_or_create(user=user)
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        for lines in options['lines']:
+            items = [
+                {'product_detail_id': detail.pk, 'quantity': 1}
+                for detail in details[:lines]]
+
+            def fill_cart():
+                CartItem.objects.bulk_create(
+                    CartItem(cart=cart, product_detail=detail,
+                             is_checked=True)
+                    for detail in details[:lines])
+
+            for label, view, payload, prepare in (
+                    ('order API', create,
+                     {'address': ADDRESS, 'items': items}, None),
+                    ('cart checkout', checkout,
+                     {'address': ADDRESS}, fill_cart)):
+                samples = []
+                for _ in range(options['orders']):
+                    if prepare:
+                        prepare()
+                    request = factory.post(
+                        '/', payload, format='json', HTTP_HOST=host)
+                    force_authenticate(request, user)
+                    queries[0] = 0
+                    with connection.execute_wrapper(count_query), \
+                            timer(samples):
+                        response = view(request)
+                        response.render()
+                    assert response.status_code == 201, response.data
+                self.stdout.write(
+                    f"{lines:3} lines, {label:13}: "
+                    f"{len(samples) / sum(samples):.0f} orders/s, "
+                    f"{format_latency(samples)} ({queries[0]} queries)")
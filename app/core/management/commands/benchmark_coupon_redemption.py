@@ -0,0 +1,124 @@
+"""
+Flash-sale load test of coupon redemption.
+
+``--threads`` buyers make ``--attempts`` redemptions of one synthetic
+coupon with ``--limit`` uses, each in its own transaction that stays
+open for ``--hold-ms`` after the redemption, like the rest of a
+checkout. Runs once per ``--shards`` value (0 counts on the coupon row)
+and reports the throughput and latency of redemptions and whether
+exactly the limit was redeemed.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.benchmark import SEED_PREFIX, format_latency
+from core.models import Coupon
+from order import coupons
+
+BENCHMARK_CODE = f"{SEED_PREFIX}flash sale"
+
+
+class Command(BaseCommand):
+    help = 'Load test concurrent redemptions of one coupon'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--attempts',
+            type=int,
+            default=5000,
+            help='Redemptions attempted (default 5000)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=4000,
+            help='Usage limit of the coupon (default 4000)',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=32,
+            help='Concurrent buyers (default 32)',
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            nargs='+',
+            default=[0, 16],
+            help='Counter shards to compare (default 0 16)',
+        )
+        parser.add_argument(
+            '--hold-ms',
+            type=float,
+            default=5,
+            help='Time the checkout transaction stays open (default 5)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            for shards in options['shards']:
+                self._load(shards, options)
+        finally:
+            Coupon.objects.filter(code=BENCHMARK_CODE).delete()
+
+    def _load(self, shards, options):
+        Coupon.objects.filter(code=BENCHMARK_CODE).delete()
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code=BENCHMARK_CODE,
+            discount_percentage=Decimal('10'),
+            usage_limit=options['limit'],
+            start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=1),
+        )
+        coupons.shard_coupon(coupon.pk, shards)
+        hold = options['hold_ms'] / 1000
+        lock = threading.Lock()
+        attempts = iter(range(options['attempts']))
+        samples, refused = [], [0]
+
+        def buy():
+            try:
+                while True:
+                    with lock:
+                        if next(attempts, None) is None:
+                            return
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            coupons.redeem(BENCHMARK_CODE, Decimal('100'))
+                            time.sleep(hold)
+                    except coupons.CouponUnavailable:
+                        with lock:
+                            refused[0] += 1
+                        continue
+                    with lock:
+                        samples.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            for future in [
+                    pool.submit(buy) for _ in range(options['threads'])]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        used = coupons.used_count(Coupon.objects.get(pk=coupon.pk))
+        self.stdout.write(
+            f"{shards:2} shards: {len(samples)} redeemed, {refused[0]} "
+            f"refused in {elapsed:.2f}s "
+            f"({options['attempts'] / elapsed:.0f} checkouts/s), "
+            f"{format_latency(samples)}")
+        expected = min(options['limit'], options['attempts'])
+        if len(samples) != expected or used != expected:
+            raise CommandError(
+                f"Redeemed {len(samples)} times, counted {used}, "
+                f"expected {expected}")
@@ -0,0 +1,103 @@
+"""
+Compare fetching products one by one with one batch request.
+
+``--ids`` synthetic products are fetched with a detail request each and
+with a single ``batch`` request, with the caches cleared before every run
+(cold) and kept (cached).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product, ProductImage
+from product.views import ProductListView
+
+BENCHMARK_EMAIL = 'benchmark-batch@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark single product requests against one batch request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ids',
+            type=int,
+            default=100,
+            help='Products to fetch (default 100)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per variant (default 20)',
+        )
+
+    def handle(self, *args, **options):
+        get_user_model().objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = get_user_model().objects.create_user(
+            email=BENCHMARK_EMAIL, password=None)
+        seed_products(options['ids'])
+        ids = list(Product.objects.filter(
+            name__startswith=SEED_PREFIX).values_list('id', flat=True))
+        ProductImage.objects.bulk_create(
+            ProductImage(product_id=pk, url=f"https://example.com/{pk}.jpg")
+            for pk in ids)
+
+        host = next((
+            host.lstrip('.') for host in settings.ALLOWED_HOSTS
+            if host != '*'), 'localhost')
+        factory = APIRequestFactory()
+        detail = ProductListView.as_view({'get': 'retrieve'})
+        batch = ProductListView.as_view({'get': 'batch'})
+
+        def get(view, params=None, **kwargs):
+            request = factory.get('/', params, HTTP_HOST=host)
+            force_authenticate(request, user)
+            view(request, **kwargs).render()
+
+        def singles():
+            for pk in ids:
+                get(detail, pk=pk)
+
+        def one_batch():
+            get(batch, {'ids': ','.join(map(str, ids))})
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            self.stdout.write(f"{len(ids)} products:")
+            for label, run, clear in (
+                    ('single, cold', singles, True),
+                    ('single, cached', singles, False),
+                    ('batch, cold', one_batch, True),
+                    ('batch, cached', one_batch, False)):
+                run()
+                samples = []
+                for _ in range(options['repeat']):
+                    if clear:
+                        cache.clear()
+                    queries[0] = 0
+                    with connection.execute_wrapper(count_query), \
+                            timer(samples):
+                        run()
+                self.stdout.write(
+                    f"  {label:15} {format_latency(samples)} "
+                    f"({queries[0]} queries)")
+        finally:
+            user.delete()
+            deleted = delete_seeded_products()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
@@ -0,0 +1,126 @@
+"""
+Benchmark cart and watched-list serialization with product cards.
+
+A synthetic user gets a cart and a watched list of ``--items`` products.
+Both lists are serialized with the product cards cold (first render) and
+cached, and compared with serializing every product separately, as the
+lists did before the card store.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from cart.serializers import CartItemSerializer
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import (
+    Cart,
+    CartItem,
+    Product,
+    ProductDetail,
+    ProductImage,
+    UserWatchedProduct,
+)
+from product.serializers import ProductGenericSerializer
+from watched_list.serializers import UserWatchedProductSerializer
+
+BENCHMARK_EMAIL = 'benchmark-cards@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark cart and watched-list latency with product cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            type=int,
+            default=50,
+            help='Products in the cart and watched list (default 50)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Timed runs per variant (default 50)',
+        )
+
+    def handle(self, *args, **options):
+        user = self._seed(options['items'])
+        try:
+            carts = CartItem.objects.filter(
+                cart__user=user).prefetch_related(
+                    'cart', 'product_detail__detail_variant')
+            watched = UserWatchedProduct.objects.filter(user=user)
+            self._benchmark(
+                'cart', carts, CartItemSerializer,
+                lambda item: item.product_detail.product, options)
+            self._benchmark(
+                'watched list', watched, UserWatchedProductSerializer,
+                lambda row: row.product, options)
+        finally:
+            user.delete()
+            deleted = delete_seeded_products()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _seed(self, count):
+        get_user_model().objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = get_user_model().objects.create_user(
+            email=BENCHMARK_EMAIL, password=None)
+        seed_products(count)
+        products = list(Product.objects.filter(
+            name__startswith=SEED_PREFIX).order_by('-id')[:count])
+        details = ProductDetail.objects.bulk_create(
+            ProductDetail(product=p, price=p.min_price, sale_price=p.price)
+            for p in products)
+        ProductImage.objects.bulk_create(
+            ProductImage(product=p, url=f"https://example.com/{p.pk}.jpg")
+            for p in products)
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product_detail=detail) for detail in details)
+        UserWatchedProduct.objects.bulk_create(
+            UserWatchedProduct(user=user, product=p) for p in products)
+        return user
+
+    def _benchmark(self, name, queryset, serializer, product_of, options):
+        def per_product():
+            # Every row loads and serializes its product on its own.
+            return [
+                ProductGenericSerializer(product_of(row)).data
+                for row in queryset.all()
+            ]
+
+        def with_cards():
+            return serializer(queryset.all(), many=True).data
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        results = {}
+        for label, run, clear in (
+                ('per-product', per_product, False),
+                ('cards cold', with_cards, True),
+                ('cards cached', with_cards, False)):
+            samples = []
+            for _ in range(options['repeat']):
+                if clear:
+                    cache.clear()
+                queries[0] = 0
+                with connection.execute_wrapper(count_query), timer(samples):
+                    run()
+            results[label] = (samples, queries[0])
+
+        self.stdout.write(f"{name} ({options['items']} items):")
+        for label, (samples, queries) in results.items():
+            self.stdout.write(
+                f"  {label:13} {format_latency(samples)} "
+                f"({queries} queries)")
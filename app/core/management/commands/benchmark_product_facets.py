@@ -0,0 +1,142 @@
+"""
+Benchmark faceted product listing: a filtered page plus facet counts.
+
+Counts from the in-process bitmaps are compared with computing them live
+with GROUP BY over the facet table.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product, ProductFacet, ProductVariant
+from product.facets import (
+    FacetIndex,
+    filter_products,
+    refresh_product_facets,
+)
+
+COLORS = ('black', 'white', 'blue', 'red', 'green', 'grey', 'beige', 'navy')
+SIZES = ('XS', 'S', 'M', 'L', 'XL')
+MATERIALS = ('cotton', 'leather', 'wool', 'denim', 'silk', 'linen')
+
+QUERIES = (
+    {'color': ['red']},
+    {'color': ['red', 'blue'], 'size': ['M']},
+    {'color': ['black'], 'size': ['S', 'M'], 'price': ['50-100'],
+     'rating': ['4']},
+    {'material': ['wool'], 'price': ['100-200', '200-'], 'size': ['XL']},
+)
+
+
+def seed_facet_sources():
+    """Give seeded products a material and 1-3 color and size variants."""
+    quote = connection.ops.quote_name
+    product = quote(Product._meta.db_table)
+    variant = quote(ProductVariant._meta.db_table)
+
+    def pick(values):
+        array = "ARRAY[{}]".format(', '.join(f"'{v}'" for v in values))
+        return f"({array})[1 + floor(random() * {len(values)})::int]"
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {product} SET material = {pick(MATERIALS)} "
+            "WHERE name LIKE %s", [f"{SEED_PREFIX}%"])
+        cursor.execute(
+            f"INSERT INTO {variant} (product_id, color, size, "
+            "stock_quantity, updated_at) "
+            f"SELECT p.id, {pick(COLORS)}, {pick(SIZES)}, 10, now() "
+            f"FROM {product} p, generate_series(1, 3) AS n "
+            "WHERE p.name LIKE %s AND n <= 1 + p.id %% 3",
+            [f"{SEED_PREFIX}%"])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark multi-facet product pages and facet counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Insert this many synthetic products first',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Products per page (default 20)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per query (default 20)',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the synthetic products afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} products...")
+            seed_products(options['seed'])
+            seed_facet_sources()
+            refresh_product_facets()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "ANALYZE {}".format(connection.ops.quote_name(
+                        ProductFacet._meta.db_table)))
+        try:
+            self._benchmark(options)
+        finally:
+            if options['cleanup']:
+                deleted = delete_seeded_products()
+                self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _benchmark(self, options):
+        loading = []
+        with timer(loading):
+            index = FacetIndex.load()
+        values = sum(len(v) for v in index.sets.values())
+        self.stdout.write(
+            f"Catalog: {len(index.product_ids)} products, {values} facet "
+            f"values; index loaded in {loading[0]:.2f}s")
+
+        for filters in QUERIES:
+            page, bitmaps, group_by = [], [], []
+            for _ in range(options['repeat']):
+                with timer(page):
+                    list(filter_products(
+                        Product.objects.defer('search_vector'), filters,
+                    ).order_by('-id')[:options['page_size']])
+                with timer(bitmaps):
+                    index.counts(filters)
+            for _ in range(max(options['repeat'] // 10, 1)):
+                with timer(group_by):
+                    self._live_counts(filters)
+            self.stdout.write(
+                f"{filters}: page {format_latency(page)} | "
+                f"bitmap counts {format_latency(bitmaps)} | "
+                f"GROUP BY counts {format_latency(group_by)}")
+
+    @staticmethod
+    def _live_counts(filters):
+        """Disjunctive facet counts computed by the database."""
+        counts = {}
+        for facet in ('price', 'color', 'size', 'rating', 'material'):
+            others = {f: v for f, v in filters.items() if f != facet}
+            products = filter_products(Product.objects.all(), others)
+            counts[facet] = dict(ProductFacet.objects.filter(
+                facet=facet, product__in=products.values('pk'),
+            ).values_list('value').annotate(Count('id')))
+        return counts
@@ -0,0 +1,106 @@
+"""
+Compare the CPU cost of product list pages built by serializers and by
+the database.
+
+Every request goes through the list view and renders its body. The
+serializer path is timed with the card cache cleared before each request
+and with cached cards; the database path selects the cards as JSON text
+(``PRODUCT_LIST_JSON_IN_DATABASE``). CPU time is this process's time, so
+the work moved into PostgreSQL shows up in the wall-clock latency only.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmark import (
+    SEED_PREFIX,
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product, ProductImage
+from product.facets import facet_engine
+from product.views import ProductListView
+
+BENCHMARK_EMAIL = 'benchmark-list-json@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product list CPU time with and without database JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1000,
+            help='Synthetic products to insert, with two images each '
+                 '(default 1000)',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=50,
+            help='Products per page (default 50)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=100,
+            help='Timed requests per variant (default 100)',
+        )
+
+    def handle(self, *args, **options):
+        get_user_model().objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = get_user_model().objects.create_user(
+            email=BENCHMARK_EMAIL, password=None)
+        seed_products(options['seed'])
+        ProductImage.objects.bulk_create(
+            ProductImage(
+                product_id=pk, url=f"https://example.com/{pk}/{i}.jpg")
+            for pk in Product.objects.filter(
+                name__startswith=SEED_PREFIX).values_list('id', flat=True)
+            for i in range(2))
+        facet_engine.reload()
+        view = ProductListView.as_view({'get': 'list'})
+        host = next((
+            host.lstrip('.') for host in settings.ALLOWED_HOSTS
+            if host != '*'), 'localhost')
+
+        def get():
+            request = APIRequestFactory().get(
+                '/', {'page_size': options['page_size']}, HTTP_HOST=host)
+            force_authenticate(request, user)
+            response = view(request)
+            if hasattr(response, 'render'):
+                # DRF responses encode their data when rendered.
+                response.render()
+
+        try:
+            for label, in_database, clear in (
+                    ('serializers, cold cards', False, True),
+                    ('serializers, cached cards', False, False),
+                    ('database JSON', True, False)):
+                cpu, wall = [], []
+                with override_settings(
+                        PRODUCT_LIST_JSON_IN_DATABASE=in_database):
+                    get()
+                    for _ in range(options['repeat']):
+                        if clear:
+                            cache.clear()
+                        started = time.process_time()
+                        with timer(wall):
+                            get()
+                        cpu.append(time.process_time() - started)
+                self.stdout.write(
+                    f"{label:26} cpu {format_latency(cpu)} | "
+                    f"wall {format_latency(wall)}")
+        finally:
+            user.delete()
+            deleted = delete_seeded_products()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
@@ -0,0 +1,116 @@
+"""
+Compare keyset and offset pagination latency of the product catalog.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.benchmark import (
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product
+from product.pagination import ProductCursorPagination
+
+
+class Command(BaseCommand):
+    help = 'Benchmark deep pages of the product list with both paginations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Insert this many synthetic products first',
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            nargs='+',
+            default=[1, 100, 10000],
+            help='Page numbers to time (default 1 100 10000)',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=10,
+            help='Products per page (default 10)',
+        )
+        parser.add_argument(
+            '--ordering',
+            choices=[
+                name for name in ProductCursorPagination.orderings
+                if name != 'relevance'],
+            default='price',
+            help='Sort order to page through (default price)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per page (default 20)',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the synthetic products afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} products...")
+            seed_products(options['seed'])
+        self.stdout.write(
+            f"Catalog: {Product.objects.count()} products, "
+            f"ordering={options['ordering']}, "
+            f"page_size={options['page_size']}")
+
+        try:
+            for page in options['pages']:
+                self._benchmark_page(page, options)
+        finally:
+            if options['cleanup']:
+                deleted = delete_seeded_products()
+                self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _request(self, params):
+        host = next((
+            host.lstrip('.') for host in settings.ALLOWED_HOSTS
+            if host != '*'), 'localhost')
+        return Request(APIRequestFactory().get('/', params, HTTP_HOST=host))
+
+    def _benchmark_page(self, page, options):
+        page_size, ordering = options['page_size'], options['ordering']
+        paginator = ProductCursorPagination()
+        field, descending = paginator.orderings[ordering]
+        order_by = [
+            f"-{name}" if descending else name
+            for name in paginator.key_fields(field)]
+        queryset = Product.objects.all()
+        offset = (page - 1) * page_size
+
+        params = {'ordering': ordering, 'page_size': page_size}
+        if offset:
+            # Position a cursor on the last row of the previous page.
+            last = queryset.order_by(*order_by)[offset - 1:offset].first()
+            if last is None:
+                self.stdout.write(f"Page {page}: past the end, skipped")
+                return
+            params['cursor'] = paginator.cursor_token(ordering, last)
+
+        keyset, offset_samples = [], []
+        for _ in range(options['repeat']):
+            with timer(keyset):
+                ProductCursorPagination().paginate_queryset(
+                    queryset, self._request(params))
+            with timer(offset_samples):
+                queryset.count()
+                list(queryset.order_by(*order_by)[
+                    offset:offset + page_size])
+
+        self.stdout.write(
+            f"Page {page}: keyset {format_latency(keyset)} | "
+            f"offset+count {format_latency(offset_samples)}")
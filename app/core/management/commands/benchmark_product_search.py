@@ -0,0 +1,85 @@
+"""
+Compare full-text product search with the ``name__icontains`` filter.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core.benchmark import (
+    delete_seeded_products,
+    format_latency,
+    seed_products,
+    timer,
+)
+from core.models import Product
+from product.search import search_products
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the first page of product search by both methods'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Insert this many synthetic products first',
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['leather', 'running shoe', 'vintage wool jacket'],
+            help='Search terms to time',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=10,
+            help='Products per page (default 10)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per query (default 20)',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the synthetic products afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeding {options['seed']} products...")
+            seed_products(options['seed'])
+            call_command(
+                'rebuild_search_vectors', batch_size=50000, stdout=StringIO())
+        self.stdout.write(
+            f"Catalog: {Product.objects.count()} products, "
+            f"page_size={options['page_size']}")
+
+        try:
+            for text in options['queries']:
+                self._benchmark_query(text, options)
+        finally:
+            if options['cleanup']:
+                deleted = delete_seeded_products()
+                self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _benchmark_query(self, text, options):
+        size = options['page_size']
+        products = Product.objects.defer('search_vector')
+        full_text, icontains = [], []
+        for _ in range(options['repeat']):
+            with timer(full_text):
+                list(search_products(products, text).order_by(
+                    '-search_rank', '-id')[:size])
+            with timer(icontains):
+                list(products.filter(name__icontains=text).order_by(
+                    '-id')[:size])
+
+        self.stdout.write(
+            f"{text!r}: full-text {format_latency(full_text)} | "
+            f"icontains {format_latency(icontains)}")
@@ -0,0 +1,123 @@
+"""
+Load test of stock reservations on one hot variant.
+
+``--threads`` buyers place orders of ``--quantity`` units of a single
+synthetic variant with ``--stock`` units, each order in its own
+transaction as at checkout, until the variant is sold out. Reports the
+throughput and latency of the orders and checks that exactly the stock
+was sold.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.benchmark import SEED_PREFIX, delete_seeded_products, format_latency
+from core.models import (
+    Order,
+    OrderItem,
+    Product,
+    ProductDetail,
+    ProductVariant,
+)
+from order import reservations
+from product.inventory import InsufficientStock
+
+BENCHMARK_EMAIL = 'benchmark-reservation@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Load test concurrent stock reservations of one variant'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stock',
+            type=int,
+            default=2000,
+            help='Units of the hot variant (default 2000)',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=16,
+            help='Concurrent buyers (default 16)',
+        )
+        parser.add_argument(
+            '--quantity',
+            type=int,
+            default=1,
+            help='Units per order (default 1)',
+        )
+
+    def handle(self, *args, **options):
+        get_user_model().objects.filter(email=BENCHMARK_EMAIL).delete()
+        user = get_user_model().objects.create_user(
+            email=BENCHMARK_EMAIL, password=None)
+        variant = ProductVariant.objects.create(
+            product=Product.objects.create(name=f"{SEED_PREFIX}hot"),
+            stock_quantity=options['stock'])
+        detail = ProductDetail.objects.create(
+            product_id=variant.product_id, detail_variant=variant)
+        try:
+            self._load(user, variant, detail, options)
+        finally:
+            # Orders and the detail reference the synthetic variant;
+            # delete them first.
+            user.delete()
+            detail.delete()
+            deleted = delete_seeded_products()
+            self.stdout.write(f"Deleted {deleted} synthetic products")
+
+    def _load(self, user, variant, detail, options):
+        quantity = options['quantity']
+        lock = threading.Lock()
+        samples, refused = [], [0]
+
+        def buy():
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            order = Order.objects.create(user=user)
+                            OrderItem.objects.create(
+                                order=order, product_detail=detail,
+                                quantity=quantity)
+                            reservations.reserve(order)
+                    except InsufficientStock:
+                        with lock:
+                            refused[0] += 1
+                        return
+                    with lock:
+                        samples.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            for future in [
+                    pool.submit(buy) for _ in range(options['threads'])]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        variant.refresh_from_db()
+        sold = len(samples)
+        self.stdout.write(
+            f"{options['threads']} buyers, {options['stock']} units, "
+            f"{quantity} per order:")
+        self.stdout.write(
+            f"  {sold} orders in {elapsed:.2f}s "
+            f"({sold / elapsed:.0f} orders/s), {refused[0]} refused")
+        self.stdout.write(f"  order {format_latency(samples)}")
+        self.stdout.write(f"  stock left {variant.stock_quantity}")
+
+        expected = options['stock'] - sold * quantity
+        if variant.stock_quantity != expected \
+                or variant.stock_quantity >= quantity:
+            raise CommandError(
+                f"Sold {sold * quantity} of {options['stock']} units "
+                f"with {variant.stock_quantity} left")
+        self.stdout.write(self.style.SUCCESS("No oversell"))
@@ -0,0 +1,89 @@
+"""
+Build the content vectors used to recommend cold-start products.
+"""
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import format_latency, timer
+from recommendation.content import ContentIndex, build_content_vectors
+
+
+class Command(BaseCommand):
+    help = 'Build TF-IDF/SVD content vectors for every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dimensions',
+            type=int,
+            default=128,
+            help='Size of the reduced vectors (default 128)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Products read and hashed per batch (default 2000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to hash and embed batches',
+        )
+        parser.add_argument(
+            '--svd-sample',
+            type=int,
+            default=50000,
+            help='Products used to fit the SVD (default 50000)',
+        )
+        parser.add_argument(
+            '--benchmark-queries',
+            type=int,
+            default=0,
+            help='Time this many random similarity queries after building',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=getattr(settings, 'CONTENT_VECTORS_PATH', None),
+            help='Where to write the vectors file',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('No output path configured.')
+        started = time.perf_counter()
+
+        count = build_content_vectors(
+            options['output'],
+            dimensions=options['dimensions'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            svd_sample=options['svd_sample'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Built content vectors for {count} products in "
+            f"{time.perf_counter() - started:.1f}s: {options['output']}"))
+
+        if options['benchmark_queries'] and count:
+            self._benchmark(options['output'], options['benchmark_queries'])
+
+    def _benchmark(self, path, queries):
+        """Report latency of profile + top-20 queries on random products."""
+        index = ContentIndex.load(path)
+        rng = np.random.default_rng(42)
+        samples = []
+        for _ in range(queries):
+            products = rng.choice(index.product_ids, size=min(5, len(index)))
+            with timer(samples):
+                profile = index.profile(products)
+                if profile is not None:
+                    index.top(profile, limit=20, exclude=products)
+        self.stdout.write(
+            f"{queries} queries over {len(index)} products: "
+            f"{format_latency(samples)}")
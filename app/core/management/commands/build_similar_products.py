@@ -0,0 +1,82 @@
+"""
+Build the co-view "similar products" index from UserAction sessions.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendation.similarity import (
+    MEASURES,
+    build_similarity_index,
+    read_sessions,
+)
+
+
+class Command(BaseCommand):
+    help = 'Build the item-to-item similarity index from co-viewed products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=20,
+            help='Neighbours kept per product (default 20)',
+        )
+        parser.add_argument(
+            '--measure',
+            choices=MEASURES,
+            default='cosine',
+            help='Normalization of co-occurrence counts',
+        )
+        parser.add_argument(
+            '--session-gap',
+            type=int,
+            default=1800,
+            help='Idle seconds that end a session (default 1800)',
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=8,
+            help='Number of product shards scored separately',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to score shards in parallel',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=getattr(settings, 'SIMILAR_PRODUCTS_INDEX_PATH', None),
+            help='Where to write the index file',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('No output path configured.')
+        started = time.perf_counter()
+
+        sessions, product_ids = read_sessions(options['session_gap'])
+        self.stdout.write(
+            f"Loaded {len(product_ids)} view/cart events in "
+            f"{sessions.max() + 1 if len(sessions) else 0} sessions "
+            f"({time.perf_counter() - started:.1f}s)")
+
+        index = build_similarity_index(
+            sessions,
+            product_ids,
+            k=options['top_k'],
+            measure=options['measure'],
+            shards=options['shards'],
+            workers=options['workers'],
+        )
+        index.save(options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built similar products for {len(index)} products "
+            f"({len(index.neighbours)} neighbours) in "
+            f"{time.perf_counter() - started:.1f}s: {options['output']}"))
@@ -11,6 +11,7 @@ from core.models import (
     ProductDetailInformation,
     ProductDetail
 )
+from product.inventory import split_stock
 
 def get_or_create_category_hierarchy(breadcrumbs_list):
     parent = None
@@ -138,6 +139,13 @@ class Command(BaseCommand):
                         # and ProductDetail instances
                         colors = {v['color'] for v in variants if 'color' in v}
                         sizes = {v['size'] for v in variants if 'size' in v}
+                        # The product's quantity is spread over its
+                        # variants, which the product total rolls up from
+                        variant_count = (
+                            len(colors) * len(sizes) if colors and sizes
+                            else len(colors) or len(sizes))
+                        stock = iter(split_stock(
+                            product.stock_quantity, max(variant_count, 1)))
 
                         if variants:
                             if colors and sizes:
@@ -147,7 +155,7 @@ class Command(BaseCommand):
                                             product=product,
                                             color=color,
                                             size=size,
-                                            stock_quantity=row['quantity']
+                                            stock_quantity=next(stock)
                                         )
                                         ProductDetail.objects.create(
                                             product=product,
@@ -165,7 +173,7 @@ class Command(BaseCommand):
                                         product=product,
                                         color=color,
                                         size=None,
-                                        stock_quantity=0
+                                        stock_quantity=next(stock)
                                     )
                                     ProductDetail.objects.create(
                                         product=product,
@@ -184,7 +192,7 @@ class Command(BaseCommand):
                                         product=product,
                                         color=color,
                                         size=size,
-                                        stock_quantity=0
+                                        stock_quantity=next(stock)
                                     )
                                     ProductDetail.objects.create(
                                         product=product,
@@ -1,145 +1,213 @@
-import pandas as pd
+"""
+Bulk load user events from CSV files into UserAction.
+
+Files are read in chunks, every column is transformed with vectorized
+pandas/NumPy operations and each chunk is streamed into PostgreSQL with
+COPY in its own transaction. The progress of every file is an
+``ImportCheckpoint`` row updated in that same transaction, so an
+interrupted import resumes after the last committed chunk without
+loading any chunk twice. Chunks are split on line ends and the
+checkpoint keeps the byte offset after the last one, so resuming seeks
+past the imported lines instead of parsing them again.
+"""
+import csv
+import io
+import itertools
+import os
+import time
+
 import numpy as np
-from django.core.management.base import BaseCommand
-from core.models import UserAction, Product
+import pandas as pd
 
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-class Command(BaseCommand):
-    help = 'Import user actions from user_event.csv'
+from core.models import ImportCheckpoint, UserAction, Product
 
-    def add_arguments(self, parser):
-        parser.add_argument('event_file', type=str)
-        parser.add_argument('event_file11', type=str)
 
-    def handle(self, *args, **options):
-        try:
-            event_file = options['event_file']
-            event_file1 = options['event_file11']
-            self.stdout.write(f"Attempting to read file: {event_file}")
-            self.stdout.write(f"Attempting to read file: {event_file1}")
-
-            # Load data
-            events = pd.read_csv(event_file)
-            events1 = pd.read_csv(event_file1)
-            self.stdout.write(
-                f"Successfully loaded CSV with {len(events)} rows")
-            self.stdout.write(
-                f"Successfully loaded CSV with {len(events1)} rows")
-
-            # Get product IDs from the database
-            available_product_ids = list(
-                Product.objects.values_list('id', flat=True))
-
-            if not available_product_ids:
-                self.stdout.write(self.style.ERROR(
-                    'No products found in the database. '
-                    'Please add products first.'
-                ))
-                return
+EVENT_WEIGHTS = {
+    'view': 1.0,
+    'cart': 3.0,
+    'purchase': 5.0,
+    'remove_from_cart': -1.0,
+}
 
-            # Convert IDs to strings to match the format used in UserAction
-            available_product_ids = [str(pid) for pid in available_product_ids]
+COPY_COLUMNS = ('user_id', 'product_id', 'event_type', 'event_time', 'score')
 
-            # Filter valid events
-            valid_events = events[
-                events['event_type'].isin(
-                    ['view', 'cart', 'purchase', 'remove_from_cart']
-                )
-                ]
-            valid_events1 = events1[
-                events1['event_type'].isin(
-                    ['view', 'cart', 'purchase', 'remove_from_cart']
-                )
-                ]
+CSV_COLUMNS = ['event_time', 'event_type', 'user_id']
 
-            self.stdout.write("Mapping valid events to product IDs")
-            # Map product IDs to ASINs
-            np.random.seed(42)
-            valid_events['mapped_product_id'] = np.random.choice(
-                available_product_ids, size=len(valid_events)
-            )
-            valid_events1['mapped_product_id'] = np.random.choice(
-                available_product_ids, size=len(valid_events1)
+CHECKPOINT_COMMAND = 'import_user_actions'
+
+
+def read_chunks(path, chunk_size, offset=0):
+    """Yield ``(chunk, lines, end_offset)`` of a CSV file from ``offset``.
+
+    ``offset`` is a byte offset returned by an earlier chunk, 0 for the
+    start of the file. Fields must not contain line breaks.
+    """
+    with open(path, 'rb') as f:
+        names = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        if offset:
+            f.seek(offset)
+        else:
+            offset = f.tell()
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            offset += sum(len(line) for line in lines)
+            chunk = pd.read_csv(
+                io.BytesIO(b''.join(lines)),
+                header=None,
+                names=names,
+                usecols=CSV_COLUMNS,
+                dtype={'event_type': str, 'user_id': str},
             )
+            yield chunk, len(lines), offset
+
+
+def transform_chunk(chunk, product_ids, rng):
+    """Turn a raw CSV chunk into the rows COPY expects."""
+    chunk = chunk[chunk['event_type'].isin(list(EVENT_WEIGHTS))]
+    chunk = chunk.reset_index(drop=True)
+    return pd.DataFrame({
+        'user_id': chunk['user_id'].astype(str),
+        'product_id': product_ids[
+            rng.integers(0, len(product_ids), size=len(chunk))],
+        'event_type': chunk['event_type'],
+        'event_time': pd.to_datetime(chunk['event_time'], utc=True),
+        'score': chunk['event_type'].map(EVENT_WEIGHTS),
+    })
+
+
+def copy_frame(frame):
+    """Stream a transformed frame into the UserAction table with COPY."""
+    buffer = io.StringIO()
+    frame.to_csv(
+        buffer,
+        columns=list(COPY_COLUMNS),
+        header=False,
+        index=False,
+        sep='\t',
+        date_format='%Y-%m-%d %H:%M:%S%z',
+    )
+    table = connection.ops.quote_name(UserAction._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(c) for c in COPY_COLUMNS)
+    with connection.cursor() as cursor:
+        with cursor.copy(
+                f"COPY {table} ({columns}) FROM STDIN "
+                "WITH (FORMAT csv, DELIMITER E'\\t')") as copy:
+            copy.write(buffer.getvalue())
 
-            # Assign scores
-            event_weights = {
-                'view': 1.0,
-                'cart': 3.0,
-                'purchase': 5.0,
-                'remove_from_cart': -1.0
-            }
-            valid_events['score'] = valid_events[
-                'event_type'].map(event_weights)
-            valid_events1['score'] = valid_events1[
-                'event_type'].map(event_weights)
-
-            self.stdout.write(
-                f"Start to create UserAction objects for "
-                f"{len(valid_events)} valid events")
-            self.stdout.write(
-                f"Start to create UserAction objects for "
-                f"{len(valid_events1)} valid events")
-            # Import to UserAction
-            batch_size = 1000
-            total_created = 0
-
-            user_actions1 = [
-                UserAction(
-                    user_id=str(row['user_id']),
-                    product_id=row['mapped_product_id'],
-                    event_type=row['event_type'],
-                    event_time=pd.to_datetime(row['event_time']),
-                    score=row['score']
-                )
-                for _, row in valid_events1.iterrows()
-            ]
 
-            UserAction.objects.bulk_create(
-                user_actions1, batch_size=len(user_actions1))
+class Command(BaseCommand):
+    help = 'Import user actions from one or more user event CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'event_files',
+            nargs='+',
+            type=str,
+            help='Paths to the user event CSV files to import',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100000,
+            help='Number of CSV rows loaded per COPY transaction',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore any existing checkpoint and import from scratch',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed for mapping events onto existing products',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size must be positive.')
+
+        # Get product IDs from the database, as strings to match UserAction
+        product_ids = np.array(
+            Product.objects.order_by('id').values_list('id', flat=True)
+        ).astype(str)
+        if len(product_ids) == 0:
+            raise CommandError(
+                'No products found in the database. '
+                'Please add products first.'
+            )
+
+        sources = [os.path.abspath(path) for path in options['event_files']]
+        checkpoints = ImportCheckpoint.objects.filter(
+            command=CHECKPOINT_COMMAND, source__in=sources)
+        if options['restart']:
+            checkpoints.delete()
+        started = time.perf_counter()
+        total_created = 0
+
+        for file_index, event_file in enumerate(options['event_files']):
+            progress, _ = ImportCheckpoint.objects.get_or_create(
+                command=CHECKPOINT_COMMAND, source=sources[file_index])
+            if progress.done:
+                self.stdout.write(f"Skipping {event_file}: already imported")
+                continue
+            if progress.chunks:
+                self.stdout.write(
+                    f"Resuming {event_file} after chunk "
+                    f"{progress.chunks} ({progress.lines} lines)")
+            else:
+                self.stdout.write(f"Attempting to read file: {event_file}")
+
+            reader = read_chunks(event_file, chunk_size, progress.offset)
+            for chunk, lines, offset in reader:
+                chunk_started = time.perf_counter()
+                rng = np.random.default_rng(
+                    [options['seed'], file_index, progress.chunks])
+                frame = transform_chunk(chunk, product_ids, rng)
 
-            self.stdout.write(self.style.SUCCESS(
-                'Imported user no.3\'s event actions successfully'))
-
-            del user_actions1
-
-            for batch_start in range(0, len(valid_events), batch_size):
-                batch_end = min(
-                    batch_start + batch_size, len(valid_events))
-                batch = valid_events.iloc[batch_start:batch_end]
-
-                user_actions = [
-                    UserAction(
-                        user_id=str(row['user_id']),
-                        product_id=row['mapped_product_id'],
-                        event_type=row['event_type'],
-                        event_time=pd.to_datetime(row['event_time']),
-                        score=row['score']
-                    )
-                    for _, row in batch.iterrows()
-                ]
-
-                # Create batch and report progress
                 try:
-                    UserAction.objects.bulk_create(
-                        user_actions, batch_size=len(user_actions))
-                    total_created += len(user_actions)
-                    self.stdout.write(
-                        f"Progress: {total_created}/{len(valid_events)}"
-                        " records created "
-                        f"({(total_created/len(valid_events)*100):.1f}%)"
-                    )
+                    with transaction.atomic():
+                        copy_frame(frame)
+                        progress.chunks += 1
+                        progress.lines += lines
+                        progress.offset = offset
+                        progress.created += len(frame)
+                        progress.save(
+                            update_fields=['chunks', 'lines', 'offset',
+                                           'created', 'updated_at'])
                 except Exception as e:
-                    self.stdout.write(self.style.ERROR(
-                        f"Error in batch {batch_start}-{batch_end}: {e}"))
-                    raise  # Re-raise to stop processing and debug
-
-                # Free memory
-                del user_actions
-                del batch
+                    raise CommandError(
+                        f"Error in chunk {progress.chunks} of "
+                        f"{event_file}: {e}. Re-run the command to resume "
+                        "from the last committed chunk."
+                    ) from e
+                total_created += len(frame)
+
+                elapsed = time.perf_counter() - started
+                chunk_elapsed = time.perf_counter() - chunk_started
+                self.stdout.write(
+                    f"Progress: {event_file} chunk {progress.chunks}, "
+                    f"{progress.created} records created "
+                    f"({len(frame) / max(chunk_elapsed, 1e-9):,.0f} rows/s, "
+                    f"overall {total_created / max(elapsed, 1e-9):,.0f} "
+                    "rows/s)"
+                )
 
+            progress.done = True
+            progress.save(update_fields=['done', 'updated_at'])
             self.stdout.write(self.style.SUCCESS(
-                'Imported user actions successfully'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error: {e}"))
-            return
+                f"Imported {progress.created} user actions "
+                f"from {event_file}"))
+
+        checkpoints.delete()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total_created} user actions successfully in "
+            f"{elapsed:.1f}s"))
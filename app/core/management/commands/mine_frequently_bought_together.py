@@ -0,0 +1,81 @@
+"""
+Mine "frequently bought together" product pairs from order baskets.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendation.associations import (
+    RANK_METRICS,
+    BasketCounts,
+    update_counts,
+)
+
+
+class Command(BaseCommand):
+    help = 'Mine frequently bought together product pairs from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Discard saved counts and mine every order again',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=10,
+            help='Pairs kept per product (default 10)',
+        )
+        parser.add_argument(
+            '--min-count',
+            type=int,
+            default=2,
+            help='Minimum number of shared baskets for a pair (default 2)',
+        )
+        parser.add_argument(
+            '--late-window',
+            type=int,
+            default=1000,
+            help='Order IDs below the last mined one read again for '
+                 'orders committed late (default 1000)',
+        )
+        parser.add_argument(
+            '--rank-by',
+            choices=RANK_METRICS,
+            default='confidence',
+            help='Metric used to order the pairs of a product',
+        )
+
+    def handle(self, *args, **options):
+        state_path = getattr(
+            settings, 'FREQUENTLY_BOUGHT_TOGETHER_STATE_PATH', None)
+        index_path = getattr(
+            settings, 'FREQUENTLY_BOUGHT_TOGETHER_INDEX_PATH', None)
+        if not state_path or not index_path:
+            raise CommandError('Frequently bought together paths not set.')
+        started = time.perf_counter()
+
+        counts = BasketCounts.empty() if options['full'] \
+            else BasketCounts.load(state_path)
+        self.stdout.write(
+            f"Mining orders after #{counts.last_order_id} "
+            f"({counts.num_baskets} baskets already counted)")
+
+        added, removed = update_counts(counts, options['late_window'])
+        self.stdout.write(
+            f"Added {added} baskets, removed {removed} cancelled ones")
+
+        index = counts.rules(
+            k=options['top_k'],
+            min_count=options['min_count'],
+            rank_by=options['rank_by'],
+        )
+        counts.save(state_path)
+        index.save(index_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(index.neighbours)} product pairs for "
+            f"{len(index)} products in "
+            f"{time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,26 @@
+"""
+Rebuild the category closure table and subtree product counts.
+
+Bulk imports bypass the signals that maintain them, so run this after
+importing categories or product categories.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product.categories import rebuild_closure, update_product_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute category ancestor links and product counts'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            links = rebuild_closure()
+            categories = update_product_counts()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {links} category links and counts of {categories} "
+            f"categories in {time.perf_counter() - started:.1f}s"))
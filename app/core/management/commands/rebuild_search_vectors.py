@@ -0,0 +1,43 @@
+"""
+Rebuild the full-text search documents of products.
+
+Bulk imports bypass the signals that maintain ``Product.search_vector``,
+so run this after importing products or categories.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from core.models import Product
+from product.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = 'Recompute the search document of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Products updated per transaction (default 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Product.objects.aggregate(last=Max('id'))['last'] or 0
+        started = time.perf_counter()
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += update_search_vector(Product.objects.filter(
+                    id__gt=start, id__lte=start + batch_size))
+            self.stdout.write(
+                f"Updated {updated} products "
+                f"({updated / (time.perf_counter() - started):.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt search vectors of {updated} products in "
+            f"{time.perf_counter() - started:.1f}s"))
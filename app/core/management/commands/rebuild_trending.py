@@ -0,0 +1,76 @@
+"""
+Rebuild the trending products snapshot from UserAction history.
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import UserAction
+from recommendation.trending import (
+    TAUS,
+    WINDOW_NAMES,
+    trending_engine,
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild time-decayed trending scores from user actions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=28,
+            help='How many days of history to replay (default 28)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500000,
+            help='Number of user actions read per chunk',
+        )
+
+    def handle(self, *args, **options):
+        landmark = time.time()
+        since = timezone.now() - timezone.timedelta(days=options['days'])
+        actions = UserAction.objects.filter(
+            event_time__gte=since,
+            product_id__regex=r'^[0-9]+$',
+        ).values_list('product_id', 'event_time', 'score')
+
+        scores = np.zeros((len(WINDOW_NAMES), 0), dtype=np.float64)
+        total = 0
+        chunk = []
+        for row in actions.iterator(chunk_size=options['chunk_size']):
+            chunk.append(row)
+            if len(chunk) >= options['chunk_size']:
+                scores = self._accumulate(scores, chunk, landmark)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f"Progress: {total} user actions replayed")
+        if chunk:
+            scores = self._accumulate(scores, chunk, landmark)
+            total += len(chunk)
+
+        trending_engine.replace(scores, landmark)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt trending scores from {total} user actions "
+            f"covering {scores.shape[1]} product slots"))
+
+    def _accumulate(self, scores, chunk, landmark):
+        """Add the decayed weights of a chunk of actions."""
+        product_ids = np.array([int(row[0]) for row in chunk])
+        ages = landmark - np.array([row[1].timestamp() for row in chunk])
+        weights = np.array([row[2] for row in chunk], dtype=np.float64)
+
+        size = max(scores.shape[1], int(product_ids.max()) + 1)
+        grown = np.zeros((len(WINDOW_NAMES), size), dtype=np.float64)
+        grown[:, :scores.shape[1]] = scores
+        for row, tau in enumerate(TAUS):
+            grown[row] += np.bincount(
+                product_ids,
+                weights=weights * np.exp(-ages / tau),
+                minlength=size)
+        return grown
@@ -0,0 +1,45 @@
+"""
+Cancel pending orders whose stock reservation expired.
+
+Pending orders hold the stock of their items for
+``ORDER_RESERVATION_SECONDS``; this puts the stock of the expired ones
+back and cancels them. Run it from cron, or keep it running with
+``--interval`` to sweep every so many seconds.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from order.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release the stock of pending orders with expired reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Orders released per sweep (default all)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Sweep again every so many seconds (default once)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            released = release_expired(limit=options['limit'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Released the stock of {released} expired orders "
+                f"in {time.perf_counter() - started:.1f}s"))
+            if not options['interval']:
+                return
+            # Do not hold a connection between sweeps.
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+"""
+Spread the redemption counter of a hot coupon over several rows.
+
+Before a promotion, shard its code so that concurrent checkouts take
+different counter rows instead of queueing on the coupon row; run it
+with ``--shards 0`` afterwards to count on the coupon again.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Coupon
+from order.coupons import shard_coupon, used_count
+
+
+class Command(BaseCommand):
+    help = 'Count the redemptions of a coupon on several counter rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', help='Code of the coupon')
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=16,
+            help='Counter rows, 0 to count on the coupon (default 16)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if not 0 <= options['shards'] <= 1000:
+            raise CommandError("--shards must be between 0 and 1000")
+        coupon_id = Coupon.objects.filter(
+            code=options['code']).values_list('id', flat=True).first()
+        if coupon_id is None:
+            raise CommandError(f"No coupon {options['code']}")
+
+        coupon = shard_coupon(coupon_id, options['shards'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Coupon {coupon.code} counts on {coupon.counter_shards} "
+            f"shards, {used_count(coupon)} of {coupon.usage_limit} used, "
+            f"in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,31 @@
+"""
+Render the product cards missing from the cache.
+
+Cards are rendered on first use anyway; run this after a deploy or a
+cache flush to avoid slow first responses.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.cards import warm_product_cards
+
+
+class Command(BaseCommand):
+    help = 'Fill the cache with the card of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Products per cache multi-get (default 1000)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        warmed = warm_product_cards(options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed the cards of {warmed} products "
+            f"in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,95 @@
+"""
+In-process counters and timings.
+
+Each worker keeps its own registry; the staff-only metrics endpoint
+reports the numbers of the worker that serves the request.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from core.benchmark import percentiles
+
+
+class Metrics:
+    """Thread-safe registry of named counters and timings."""
+
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self._counters = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record a duration; only the latest samples are kept."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'recent': deque(maxlen=self.samples),
+                }
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['recent'].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Record the duration of the block under ``name``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Return counters, timing summaries in milliseconds and hit rates.
+
+        A hit rate is reported for every ``<name>.hit``/``<name>.miss``
+        counter pair.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: (t['count'], t['total'], list(t['recent']))
+                for name, t in self._timings.items()
+            }
+        summary = {}
+        for name, (count, total, recent) in timings.items():
+            summary[name] = {
+                'count': count,
+                'mean_ms': total / count * 1e3,
+                **{f"p{point}_ms": value * 1e3
+                   for point, value in percentiles(recent).items()},
+            }
+        hit_rates = {}
+        for name in counters:
+            if name.endswith('.hit'):
+                prefix = name[:-len('.hit')]
+                hits = counters[name]
+                total = hits + counters.get(f"{prefix}.miss", 0)
+                hit_rates[prefix] = hits / total if total else 0.0
+        return {
+            'counters': counters,
+            'timings': summary,
+            'hit_rates': hit_rates,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+# Global instance
+metrics = Metrics()
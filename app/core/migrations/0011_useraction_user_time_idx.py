@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_cartitem_is_checked'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useraction',
+            index=models.Index(fields=['user_id', '-event_time'], name='useraction_user_time_idx'),
+        ),
+    ]
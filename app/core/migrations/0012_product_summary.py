@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_useraction_user_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='max_sale_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price_sale_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_sale_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_url',
+            field=models.URLField(blank=True, default='', max_length=500),
+        ),
+    ]
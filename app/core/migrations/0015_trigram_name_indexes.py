@@ -0,0 +1,38 @@
+# Trigram indexes for typeahead autocomplete. pg_trgm ships with the
+# PostgreSQL contrib modules; where it is not available the indexes are
+# skipped and autocomplete falls back to prefix matching.
+
+from django.db import migrations
+
+
+CREATE_INDEXES = """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'
+    ) THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS product_name_trgm_idx
+            ON core_product USING gin (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS category_name_trgm_idx
+            ON core_category USING gin (name gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+DROP_INDEXES = """
+DROP INDEX IF EXISTS product_name_trgm_idx;
+DROP INDEX IF EXISTS category_name_trgm_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
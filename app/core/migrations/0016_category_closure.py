@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Link every existing category to itself and its ancestors, then count the
+# products of each subtree.
+POPULATE_CLOSURE = """
+INSERT INTO core_categoryclosure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM core_category
+    UNION ALL
+    SELECT tree.ancestor_id, child.id, tree.depth + 1
+    FROM tree
+    JOIN core_category child ON child.parent_category_id = tree.descendant_id
+)
+SELECT ancestor_id, descendant_id, depth FROM tree;
+
+UPDATE core_category SET product_count = counts.count
+FROM (
+    SELECT link.ancestor_id, COUNT(DISTINCT pc.product_id) AS count
+    FROM core_categoryclosure link
+    JOIN core_product_category pc ON pc.category_id = link.descendant_id
+    GROUP BY link.ancestor_id
+) counts
+WHERE counts.ancestor_id = core_category.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_trigram_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='core.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='core.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categoryclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='category_closure_unique'),
+        ),
+        migrations.RunSQL(POPULATE_CLOSURE, migrations.RunSQL.noop),
+    ]
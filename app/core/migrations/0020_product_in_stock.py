@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:43
+
+from django.db import migrations, models
+
+
+# Products with variants hold the total of their variants' stock.
+POPULATE_STOCK = """
+UPDATE core_product product
+SET stock_quantity = totals.total
+FROM (
+    SELECT product_id, SUM(stock_quantity) AS total
+    FROM core_productvariant
+    GROUP BY product_id
+) totals
+WHERE product.id = totals.product_id;
+UPDATE core_product SET in_stock = stock_quantity > 0;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'id'], name='product_in_stock_id_idx'),
+        ),
+        migrations.RunSQL(POPULATE_STOCK, migrations.RunSQL.noop),
+    ]
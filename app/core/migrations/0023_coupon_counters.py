@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CouponCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('usage_limit', models.PositiveIntegerField()),
+                ('used_count', models.PositiveIntegerField(default=0)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='core.coupon')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='couponcounter',
+            constraint=models.UniqueConstraint(fields=('coupon', 'shard'), name='couponcounter_coupon_shard'),
+        ),
+    ]
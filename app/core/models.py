@@ -5,12 +5,15 @@ import uuid
 import os
 
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 
 import random
@@ -119,6 +122,10 @@ class Category(models.Model):
         related_name="subcategories"
     )
     description = models.TextField(blank=True, null=True)
+    # Products in this category or any subcategory, kept up to date by
+    # product.signals
+    product_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         parent_info = "No Parent"
@@ -128,6 +135,36 @@ class Category(models.Model):
         return f"{self.name} ({parent_info})"
 
 
+class CategoryClosure(models.Model):
+    """Ancestor-descendant pair of the category tree.
+
+    Every category is linked to itself (depth 0) and to each of its
+    ancestors, so a subtree is one indexed lookup by ``ancestor``.
+    """
+    ancestor = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name="ancestor_links"
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ancestor', 'descendant'],
+                name='category_closure_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
 class Product(models.Model):
     """Product in the system."""
     name = models.CharField(max_length=1023)
@@ -155,7 +192,10 @@ class Product(models.Model):
         ],
         default="kg",
     )
+    # Total stock of the variants (or of the product if it has none)
+    # and whether it is positive, see product.inventory
     stock_quantity = models.PositiveIntegerField(default=0)
+    in_stock = models.BooleanField(default=False, editable=False)
     node_name = models.CharField(max_length=1023, blank=True, null=True)
     style = models.CharField(max_length=1023, blank=True, null=True)
     currency = models.CharField(
@@ -192,6 +232,131 @@ class Product(models.Model):
     )
     review_count = models.PositiveIntegerField(default=0)
 
+    # Summary of the product details and images for list pages,
+    # kept up to date by product.signals
+    min_price = models.DecimalField(
+        max_digits=100,
+        decimal_places=2,
+        default=0.00,
+    )
+    min_price_sale_price = models.DecimalField(
+        max_digits=100,
+        decimal_places=2,
+        default=0.00,
+    )
+    min_sale_price = models.DecimalField(
+        max_digits=100,
+        decimal_places=2,
+        default=0.00,
+    )
+    max_sale_price = models.DecimalField(
+        max_digits=100,
+        decimal_places=2,
+        default=0.00,
+    )
+    primary_image_url = models.URLField(
+        max_length=500,
+        blank=True,
+        default='',
+    )
+    # Weighted full-text document of the product, see product.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Bumped by product.signals on every change of the product or its
+    # details, variants, images and information, see product.cache
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Sort keys of the catalog's keyset pagination
+        indexes = [
+            GinIndex(
+                fields=['search_vector'],
+                name='product_search_vector_idx',
+            ),
+            models.Index(
+                fields=['min_price', 'id'],
+                name='product_price_id_idx',
+            ),
+            models.Index(
+                fields=['average_rating', 'id'],
+                name='product_rating_id_idx',
+            ),
+            models.Index(
+                fields=['review_count', 'id'],
+                name='product_reviews_id_idx',
+            ),
+            models.Index(
+                fields=['in_stock', 'id'],
+                name='product_in_stock_id_idx',
+            ),
+        ]
+
+    # Columns kept up to date by product.signals with update(); a save()
+    # without update_fields leaves them alone, so that an outdated
+    # instance does not write back old values
+    DERIVED_FIELDS = frozenset({
+        'version',
+        'min_price',
+        'min_price_sale_price',
+        'min_sale_price',
+        'max_sale_price',
+        'primary_image_url',
+        'search_vector',
+        'average_rating',
+        'review_count',
+    })
+
+    VARIANT_STOCK_ERROR = (
+        "The stock of a product with variants is the total of its "
+        "variants; change the stock of the variants instead.")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        product._saved_stock = product.__dict__.get('stock_quantity')
+        return product
+
+    def stock_edited(self):
+        """Whether the stock quantity was set since it was loaded."""
+        if 'stock_quantity' in self.get_deferred_fields():
+            return False
+        saved = getattr(self, '_saved_stock', None)
+        return saved is not None and self.stock_quantity != saved
+
+    def clean(self):
+        super().clean()
+        if self.stock_edited() and self.variants.exists():
+            raise ValidationError({'stock_quantity': self.VARIANT_STOCK_ERROR})
+
+    def save(self, *args, **kwargs):
+        """Save without writing back possibly outdated derived columns.
+
+        A save without ``update_fields`` writes the stock only if it was
+        set since the product was loaded. The in-stock flag follows the
+        stock quantity, which is the total of the variants for products
+        that have any: setting their stock raises ValueError.
+        """
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None \
+                and not kwargs.get('force_insert'):
+            skipped = self.DERIVED_FIELDS | self.get_deferred_fields()
+            if not self.stock_edited():
+                skipped = skipped | {'stock_quantity', 'in_stock'}
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
+        elif update_fields is not None and 'stock_quantity' in update_fields:
+            update_fields = kwargs['update_fields'] = {
+                *update_fields, 'in_stock'}
+        if update_fields is None or 'stock_quantity' in update_fields:
+            if not self._state.adding and self.variants.exists():
+                raise ValueError(self.VARIANT_STOCK_ERROR)
+            self.in_stock = self.stock_quantity > 0
+        super().save(*args, **kwargs)
+        if 'stock_quantity' not in self.get_deferred_fields():
+            self._saved_stock = self.stock_quantity
+
     # Add this method
     def __str__(self):
         return self.name
@@ -207,6 +372,7 @@ class ProductImage(models.Model):
 
     url = models.URLField(max_length=500)
     is_primary = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         """Ensure only one primary image per product."""
@@ -232,6 +398,7 @@ class ProductVariant(models.Model):
     color = models.CharField(max_length=255)
     size = models.TextField(blank=True, null=True)
     stock_quantity = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.product.name} - {self.color} - {self.size}"
@@ -247,6 +414,33 @@ class ProductDetailInformation(models.Model):
     )
     detail_name = models.CharField(max_length=255)
     detail_value = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ProductFacet(models.Model):
+    """Filterable value of a product, such as a color or price range.
+
+    Rows are derived from the product, its variants and categories by
+    product.facets.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="facets"
+    )
+    facet = models.CharField(max_length=32)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['facet', 'value', 'product'],
+                name='product_facet_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.facet}={self.value}"
 
 
 class ProductDetail(models.Model):
@@ -286,6 +480,7 @@ class ProductDetail(models.Model):
         blank=True,
         null=True,
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         variant_info = "No Variant"
@@ -371,11 +566,35 @@ class Coupon(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    # Redemptions of hot coupons are counted on this many CouponCounter
+    # rows, each with a share of the usage limit, so that concurrent
+    # checkouts do not queue on one row; 0 counts on the coupon itself
+    counter_shards = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return self.code
 
 
+class CouponCounter(models.Model):
+    """One shard of the redemption counter of a coupon."""
+    coupon = models.ForeignKey(
+        Coupon,
+        on_delete=models.CASCADE,
+        related_name="counters"
+    )
+    shard = models.PositiveSmallIntegerField()
+    usage_limit = models.PositiveIntegerField()
+    used_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['coupon', 'shard'],
+                name='couponcounter_coupon_shard',
+            ),
+        ]
+
+
 class Order(models.Model):
     """Order of the User."""
     user = models.ForeignKey(
@@ -418,6 +637,27 @@ class Order(models.Model):
         ],
         default="pending",
     )
+    # Until when the order holds the stock of its items; null once the
+    # stock is released or the order shipped
+    reserved_until = models.DateTimeField(null=True, blank=True)
+    # Client key of the checkout request that placed the order, so that
+    # retries return it instead of ordering twice
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['reserved_until'],
+                name='order_reserved_until_idx',
+                condition=models.Q(reserved_until__isnull=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                name='order_user_idempotency_key',
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -614,7 +854,43 @@ class UserAction(models.Model):
     event_time = models.DateTimeField(auto_now_add=True)
     score = models.FloatField(default=1.0)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user_id', '-event_time'],
+                name='useraction_user_time_idx',
+            ),
+        ]
+
     def __str__(self):
         return (f"{self.user_id} - "
                 f"{self.event_type} - "
                 f"{self.product_id}")
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a resumable import of one file.
+
+    Updated in the transaction of every chunk the import commits, so the
+    progress never runs ahead of or behind the imported rows.
+    """
+    command = models.CharField(max_length=100)
+    source = models.CharField(max_length=1024)
+    chunks = models.PositiveIntegerField(default=0)
+    lines = models.PositiveBigIntegerField(default=0)
+    # Byte offset of the first line not imported yet
+    offset = models.PositiveBigIntegerField(default=0)
+    created = models.PositiveBigIntegerField(default=0)
+    done = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['command', 'source'],
+                name='importcheckpoint_command_source',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.command} {self.source}"
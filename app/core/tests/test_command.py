@@ -1,13 +1,19 @@
 """
 Tests custom Django management commands.
 """
+import os
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg import OperationalError as PsycopgError
 
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.models import ImportCheckpoint, Product, UserAction
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -34,3 +40,98 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=["default"])
+
+
+class ImportUserActionsTests(TestCase):
+    """Tests for the import_user_actions command."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.products = [
+            Product.objects.create(name=f'Product {i}') for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_events(self, name, rows):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as f:
+            f.write('event_time,event_type,product_id,user_id\n')
+            for row in rows:
+                f.write(','.join(row) + '\n')
+        return path
+
+    def test_import_multiple_files_in_chunks(self):
+        """Test valid events from every file are copied with scores."""
+        first = self._write_events('first.csv', [
+            ('2019-12-01 00:00:00 UTC', 'view', '1', '3'),
+            ('2019-12-01 00:01:00 UTC', 'cart', '2', '3'),
+            ('2019-12-01 00:02:00 UTC', 'unknown', '2', '3'),
+        ])
+        second = self._write_events('second.csv', [
+            ('2019-12-02 10:00:00 UTC', 'purchase', '1', '7'),
+            ('2019-12-02 10:05:00 UTC', 'remove_from_cart', '1', '7'),
+        ])
+
+        call_command(
+            'import_user_actions', first, second,
+            chunk_size=2, stdout=StringIO())
+
+        actions = UserAction.objects.order_by('event_time')
+        self.assertEqual(actions.count(), 4)
+        self.assertEqual(
+            [a.score for a in actions], [1.0, 3.0, 5.0, -1.0])
+        self.assertEqual(
+            actions[0].event_time,
+            datetime(2019, 12, 1, tzinfo=timezone.utc))
+        product_ids = {str(p.id) for p in self.products}
+        self.assertTrue(all(a.product_id in product_ids for a in actions))
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test committed chunks recorded in the checkpoint are skipped."""
+        path = self._write_events('events.csv', [
+            ('2019-12-01 00:00:00 UTC', 'view', '1', '3'),
+            ('2019-12-01 00:01:00 UTC', 'view', '1', '3'),
+            ('2019-12-01 00:02:00 UTC', 'cart', '1', '4'),
+        ])
+        with open(path, 'rb') as f:
+            offset = sum(len(f.readline()) for _ in range(3))
+        ImportCheckpoint.objects.create(
+            command='import_user_actions', source=os.path.abspath(path),
+            chunks=1, lines=2, offset=offset, created=2)
+
+        call_command(
+            'import_user_actions', path, chunk_size=2, stdout=StringIO())
+
+        actions = UserAction.objects.all()
+        self.assertEqual(actions.count(), 1)
+        self.assertEqual(actions[0].user_id, '4')
+
+    def test_checkpoint_commits_with_chunk(self):
+        """Test a chunk whose checkpoint fails is not imported either."""
+        path = self._write_events('events.csv', [
+            ('2019-12-01 00:00:00 UTC', 'view', '1', '3'),
+            ('2019-12-01 00:01:00 UTC', 'view', '1', '3'),
+            ('2019-12-01 00:02:00 UTC', 'cart', '1', '4'),
+        ])
+        save = ImportCheckpoint.save
+
+        def fail_second_chunk(checkpoint, *args, **kwargs):
+            if checkpoint.chunks == 2:
+                raise OperationalError('connection lost')
+            save(checkpoint, *args, **kwargs)
+
+        with patch.object(ImportCheckpoint, 'save', fail_second_chunk), \
+                self.assertRaises(CommandError):
+            call_command(
+                'import_user_actions', path, chunk_size=2, stdout=StringIO())
+        self.assertEqual(UserAction.objects.count(), 2)
+
+        call_command(
+            'import_user_actions', path, chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(UserAction.objects.values_list('user_id', flat=True)),
+            ['3', '3', '4'])
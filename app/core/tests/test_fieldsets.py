@@ -0,0 +1,124 @@
+"""
+Tests for sparse fieldsets.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Address,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Product,
+    ProductDetail,
+    UserWatchedProduct,
+)
+
+
+CART_URL = reverse('cart:cart-item-list')
+ORDERS_URL = reverse('order:order-list')
+WATCHED_URL = reverse('watched_list:user-watched-product-list')
+
+
+class SparseFieldsetTests(TestCase):
+    """Test fields and expand prune responses and their queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cart = Cart.objects.get(user=self.user)
+        address = Address.objects.create(
+            user=self.user, recipient_name='A', recipient_phone_number='1')
+        self.details = []
+        for i in range(3):
+            product = Product.objects.create(name=f'Product {i}')
+            detail = ProductDetail.objects.create(
+                product=product, price=10, sale_price=8)
+            CartItem.objects.create(cart=cart, product_detail=detail)
+            UserWatchedProduct.objects.create(user=self.user, product=product)
+            order = Order.objects.create(user=self.user, address=address)
+            OrderItem.objects.create(
+                order=order, product_detail=detail, total_price=8)
+            self.details.append(detail)
+
+    def test_cart_collapsed(self):
+        """Test cart items without their nested details or cards."""
+        with self.assertNumQueries(3):
+            res = self.client.get(
+                CART_URL, {'fields': 'id,quantity,product_detail'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(item['product_detail'] for item in res.data['results']),
+            sorted(detail.id for detail in self.details))
+        self.assertEqual(
+            set(res.data['results'][0]), {'id', 'quantity', 'product_detail'})
+
+        with self.assertNumQueries(4):
+            res = self.client.get(CART_URL, {'fields': 'generic_product_info'})
+        self.assertEqual(
+            sorted(item['generic_product_info']
+                   for item in res.data['results']),
+            sorted(detail.product_id for detail in self.details))
+
+    def test_cart_expanded(self):
+        """Test expanded fields are rendered in full."""
+        res = self.client.get(CART_URL, {
+            'fields': 'id', 'expand': 'generic_product_info,product_detail'})
+
+        item = res.data['results'][0]
+        self.assertEqual(
+            set(item), {'id', 'generic_product_info', 'product_detail'})
+        self.assertIn('name', item['generic_product_info'])
+        self.assertIn('detail_variant', item['product_detail'])
+
+    def test_watched_list(self):
+        """Test a watched list of product IDs needs no product cards."""
+        with self.assertNumQueries(2):
+            res = self.client.get(WATCHED_URL, {'fields': 'shown_product'})
+
+        self.assertEqual(
+            sorted(item['shown_product'] for item in res.data['results']),
+            sorted(detail.product_id for detail in self.details))
+
+    def test_orders(self):
+        """Test orders with collapsed and expanded relations."""
+        with self.assertNumQueries(2):
+            res = self.client.get(ORDERS_URL, {'fields': 'id,total_amount'})
+        self.assertEqual(
+            set(res.data['results'][0]), {'id', 'total_amount'})
+
+        res = self.client.get(ORDERS_URL, {'fields': 'address,items'})
+        self.assertIsInstance(res.data['results'][0]['address'], int)
+        self.assertEqual(len(res.data['results'][0]['items']), 1)
+
+        res = self.client.get(
+            ORDERS_URL, {'fields': 'id', 'expand': 'items'})
+        item = res.data['results'][0]['items'][0]
+        self.assertEqual(item['total_price'], '8.00')
+
+    def test_full_responses_by_default(self):
+        """Test responses without fields are unchanged."""
+        res = self.client.get(ORDERS_URL)
+
+        order = res.data['results'][0]
+        self.assertEqual(order['address']['recipient_name'], 'A')
+        self.assertIn('product_detail', order['items'][0])
+
+    def test_unknown_fields_rejected(self):
+        """Test unknown or non-expandable names give 400."""
+        res = self.client.get(CART_URL, {'fields': 'id,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(CART_URL, {'fields': 'id', 'expand': 'id'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
@@ -0,0 +1,55 @@
+"""
+Tests for in-process metrics.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.metrics import Metrics, metrics
+
+
+class MetricsTests(TestCase):
+    """Test counters, timings and the metrics endpoint."""
+
+    def test_snapshot(self):
+        """Test counters add up and timings report percentiles."""
+        registry = Metrics()
+        registry.incr('misses')
+        registry.incr('misses', 2)
+        for seconds in (0.001, 0.002, 0.003):
+            registry.observe('stage', seconds)
+
+        snapshot = registry.snapshot()
+
+        self.assertEqual(snapshot['counters'], {'misses': 3})
+        self.assertEqual(snapshot['timings']['stage']['count'], 3)
+        self.assertAlmostEqual(snapshot['timings']['stage']['p50_ms'], 2.0)
+
+    def test_hit_rates(self):
+        """Test hit rates are derived from hit and miss counters."""
+        registry = Metrics()
+        registry.incr('cache.hit', 3)
+        registry.incr('cache.miss')
+
+        self.assertEqual(registry.snapshot()['hit_rates'], {'cache': 0.75})
+
+    def test_endpoint_staff_only(self):
+        """Test only staff users can read the metrics."""
+        client = APIClient()
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='userpass123')
+        admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='adminpass123')
+        metrics.incr('test.counter')
+
+        client.force_authenticate(user)
+        self.assertEqual(
+            client.get(reverse('metrics')).status_code,
+            status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(admin)
+        res = client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(res.data['counters']['test.counter'], 1)
@@ -0,0 +1,16 @@
+"""
+Views for the core app.
+"""
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.metrics import metrics
+
+
+class MetricsView(APIView):
+    """API View reporting the counters and timings of this worker"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
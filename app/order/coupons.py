@@ -0,0 +1,229 @@
+"""
+Coupon redemption.
+
+A coupon is checked against an in-process index of the active coupons
+(dates, ``is_active`` and minimum order amount), which is reloaded every
+``COUPON_INDEX_SECONDS`` and whenever a coupon is saved in this process,
+so checkouts read no coupon row. Redeeming it then takes one conditional
+increment (``used_count < usage_limit``) in the order's transaction,
+which never lets redemptions pass the usage limit.
+
+The increment locks its row until the order commits, so during a
+promotion every checkout with the same code would queue on the coupon
+row. ``shard_coupon`` spreads the remaining redemptions of such codes
+over ``CouponCounter`` rows, each with a share of the limit; a
+redemption takes any shard that is not locked, and the number used is
+the coupon's ``used_count`` plus the sum of its shards.
+
+Cancelling an order gives its redemption back with ``give_back`` in the
+transaction that releases its stock.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from core.models import Coupon, CouponCounter
+from product.inventory import split_stock
+
+
+logger = logging.getLogger(__name__)
+
+
+class CouponUnavailable(Exception):
+    """A coupon cannot be redeemed for an order."""
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {'counter': quote(CouponCounter._meta.db_table)}
+
+
+class ActiveCoupons:
+    """The active, unexpired coupons by code, reloaded when stale."""
+
+    def __init__(self, reload_seconds=30):
+        self.reload_seconds = reload_seconds
+        self._coupons = None
+        self._loaded = 0.0
+        self._loading = False
+        # Incremented by invalidate(), so a load that began before it is
+        # not kept
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, code):
+        """The coupon with ``code``, or None if it is not active.
+
+        The coupons are read outside the lock: while one checkout reloads
+        them, the others use the previous ones.
+        """
+        with self._lock:
+            coupons = self._coupons
+            load = coupons is None or (
+                not self._loading
+                and time.monotonic() - self._loaded > self.reload_seconds)
+            if load:
+                self._loading = True
+                generation = self._generation
+        if load:
+            try:
+                coupons = self._load(generation)
+            finally:
+                with self._lock:
+                    self._loading = False
+        return coupons.get(code)
+
+    def _load(self, generation):
+        coupons = {
+            coupon.code: coupon for coupon in Coupon.objects.filter(
+                is_active=True, end_date__gte=timezone.now())}
+        with self._lock:
+            if generation == self._generation:
+                self._coupons = coupons
+                self._loaded = time.monotonic()
+        logger.info(f"Loaded {len(coupons)} active coupons")
+        return coupons
+
+    def invalidate(self):
+        with self._lock:
+            self._coupons = None
+            self._generation += 1
+
+
+def check(coupon, subtotal, now=None):
+    """Raise CouponUnavailable if ``coupon`` does not apply to an order."""
+    now = now or timezone.now()
+    if coupon is None or not coupon.is_active:
+        raise CouponUnavailable("Coupon is not valid")
+    if now < coupon.start_date:
+        raise CouponUnavailable(f"Coupon {coupon.code} is not valid yet")
+    if now > coupon.end_date:
+        raise CouponUnavailable(f"Coupon {coupon.code} has expired")
+    if subtotal < coupon.min_order_amount:
+        raise CouponUnavailable(
+            f"Coupon {coupon.code} needs an order of "
+            f"{coupon.min_order_amount}")
+
+
+def _take_free_shard(coupon_id, step):
+    """Add ``step`` to a shard no other checkout holds."""
+    condition = 'used_count < usage_limit' if step > 0 else 'used_count > 0'
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE {counter} SET used_count = used_count + %s
+            WHERE id = (
+                SELECT id FROM {counter}
+                WHERE coupon_id = %s AND {condition}
+                ORDER BY random() LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+        """.format(condition=condition, **_tables()), [step, coupon_id])
+        return cursor.rowcount == 1
+
+
+def _count_on_shard(coupon_id, step):
+    """Add ``step`` (1 or -1) to a shard; False if no shard can take it."""
+    if _take_free_shard(coupon_id, step):
+        return True
+    # All shards that can take the step are held: wait for one of them.
+    # Updating a single row keeps waiters from holding each other's.
+    shards = CouponCounter.objects.filter(coupon_id=coupon_id)
+    shards = shards.filter(used_count__lt=F('usage_limit')) if step > 0 \
+        else shards.filter(used_count__gt=0)
+    while True:
+        shard_id = shards.order_by('?').values_list('id', flat=True).first()
+        if shard_id is None:
+            return False
+        if shards.filter(pk=shard_id).update(
+                used_count=F('used_count') + step):
+            return True
+
+
+def _count(coupon_id, sharded):
+    if not sharded:
+        return bool(Coupon.objects.filter(
+            pk=coupon_id, counter_shards=0, used_count__lt=F('usage_limit'),
+        ).update(used_count=F('used_count') + 1))
+    return _count_on_shard(coupon_id, 1)
+
+
+def _increment(coupon):
+    """Count one redemption of ``coupon``; False once its limit is reached."""
+    if _count(coupon.pk, coupon.counter_shards):
+        return True
+    # The index may predate (un)sharding the coupon in another process.
+    shards = Coupon.objects.values_list(
+        'counter_shards', flat=True).get(pk=coupon.pk)
+    return bool(shards) != bool(coupon.counter_shards) \
+        and _count(coupon.pk, shards)
+
+
+def redeem(code, subtotal, now=None):
+    """Check a coupon for an order of ``subtotal`` and use it up once.
+
+    Call it in the order's transaction, which gives the redemption back
+    if it rolls back. Returns the coupon; raises CouponUnavailable.
+    """
+    coupon = active_coupons.get(code)
+    if coupon is None:
+        raise CouponUnavailable(f"Coupon {code} is not valid")
+    check(coupon, subtotal, now)
+    if not _increment(coupon):
+        raise CouponUnavailable(f"Coupon {code} has been used up")
+    return coupon
+
+
+def give_back(coupon_id):
+    """Take back one redemption of a coupon, as for a cancelled order.
+
+    Call it in the transaction cancelling the order. The redemption is
+    taken off a shard that counted one, else off the coupon's own count
+    (where ``shard_coupon`` moves the redemptions made before sharding).
+    """
+    if not _count_on_shard(coupon_id, -1):
+        Coupon.objects.filter(pk=coupon_id, used_count__gt=0).update(
+            used_count=F('used_count') - 1)
+
+
+def used_count(coupon):
+    """How many times ``coupon`` was redeemed."""
+    if not coupon.counter_shards:
+        return coupon.used_count
+    return coupon.used_count + (coupon.counters.aggregate(
+        used=Sum('used_count'))['used'] or 0)
+
+
+def shard_coupon(coupon_id, shards):
+    """Count the redemptions of a coupon on ``shards`` counter rows.
+
+    The redemptions used so far move to ``Coupon.used_count`` and the
+    ones left are split over the shards; 0 shards counts on the coupon
+    again. A new ``usage_limit`` of a sharded coupon takes effect when it
+    is sharded again. Returns the coupon.
+    """
+    with transaction.atomic():
+        coupon = Coupon.objects.select_for_update().get(pk=coupon_id)
+        counters = CouponCounter.objects.filter(coupon=coupon)
+        used = coupon.used_count + sum(
+            counters.select_for_update().values_list('used_count', flat=True))
+        counters.delete()
+        if shards:
+            left = max(coupon.usage_limit - used, 0)
+            CouponCounter.objects.bulk_create(
+                CouponCounter(coupon=coupon, shard=shard, usage_limit=limit)
+                for shard, limit in enumerate(split_stock(left, shards)))
+        coupon.used_count = used
+        coupon.counter_shards = shards
+        coupon.save(update_fields=['used_count', 'counter_shards'])
+    return coupon
+
+
+# Global instance
+active_coupons = ActiveCoupons(
+    reload_seconds=getattr(settings, 'COUPON_INDEX_SECONDS', 30),
+)
@@ -0,0 +1,140 @@
+"""
+Stock reservations of orders.
+
+Creating an order takes the stock of its items' variants at once with
+``product.inventory.change_stock``, so two buyers of the last unit cannot
+both get it: the second conditional update finds no stock and the whole
+order is refused. A pending order holds its stock until
+``reserved_until``; cancelling it, or the ``release_expired_reservations``
+sweep once that time has passed, puts the stock back and gives the
+order's coupon redemption back with it. Shipping an order keeps the
+stock taken and ends the reservation. Status changes go through
+``change_status``, which refuses to move an order out of ``cancelled``
+since its stock may already be sold again.
+
+Items whose product detail has no variant have no tracked stock and are
+not reserved.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Order, OrderItem
+from order import coupons
+from product.inventory import change_stock
+
+
+# Statuses an order may move to from each status
+TRANSITIONS = {
+    'pending': {'pending', 'shipped', 'delivered', 'cancelled'},
+    'shipped': {'shipped', 'delivered'},
+    'delivered': {'delivered'},
+    'cancelled': {'cancelled'},
+}
+
+
+class InvalidTransition(Exception):
+    """An order cannot move to the requested status."""
+
+
+def reservation_seconds():
+    return getattr(settings, 'ORDER_RESERVATION_SECONDS', 1800)
+
+
+def item_quantities(order):
+    """``{variant_id: quantity}`` of the order's items."""
+    quantities = {}
+    items = OrderItem.objects.filter(
+        order=order, product_detail__detail_variant__isnull=False,
+    ).values_list('product_detail__detail_variant_id', 'quantity')
+    for variant_id, quantity in items:
+        quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+    return quantities
+
+
+def reserve(order, quantities=None):
+    """Take the stock of a new order's items and start its reservation.
+
+    ``quantities`` (``{variant_id: quantity}``) saves reading the items
+    back when the caller has them. Raises InsufficientStock if a variant
+    lacks stock; called in the order's transaction, the order is then
+    rolled back with it.
+    """
+    if quantities is None:
+        quantities = item_quantities(order)
+    change_stock({
+        variant_id: -quantity
+        for variant_id, quantity in quantities.items()})
+    order.reserved_until = timezone.now() + timedelta(
+        seconds=reservation_seconds())
+    order.save(update_fields=['reserved_until'])
+
+
+def release(order, status=None):
+    """Put the stock and coupon redemption of a reserved order back, once.
+
+    The order row is locked so a cancellation racing the sweep releases
+    them only once; ``status`` is set in the same transaction if it is.
+    Returns whether stock was released.
+    """
+    with transaction.atomic():
+        reserved = Order.objects.select_for_update().filter(
+            pk=order.pk, order_status='pending',
+            reserved_until__isnull=False).exists()
+        if not reserved:
+            return False
+        change_stock(item_quantities(order))
+        if order.coupon_id is not None:
+            coupons.give_back(order.coupon_id)
+        order.reserved_until = None
+        fields = ['reserved_until']
+        if status is not None:
+            order.order_status = status
+            fields.append('order_status')
+        order.save(update_fields=fields)
+    return True
+
+
+def fulfil(order):
+    """End the reservation of a shipped order, keeping its stock taken."""
+    Order.objects.filter(pk=order.pk).update(reserved_until=None)
+    order.reserved_until = None
+
+
+def change_status(order, status):
+    """Move an order to ``status``, releasing or keeping its stock.
+
+    The order row is locked and its status read again, so a change
+    racing the expiry sweep or another update sees the status the other
+    one set. Raises InvalidTransition for moves not in TRANSITIONS.
+    """
+    with transaction.atomic():
+        current = Order.objects.select_for_update().values_list(
+            'order_status', flat=True).get(pk=order.pk)
+        if status not in TRANSITIONS[current]:
+            raise InvalidTransition(
+                f"An order cannot go from {current} to {status}")
+        if status == 'cancelled':
+            release(order)
+        elif status in ('shipped', 'delivered'):
+            fulfil(order)
+        Order.objects.filter(pk=order.pk).update(order_status=status)
+    order.order_status = status
+
+
+def release_expired(now=None, limit=None):
+    """Cancel pending orders whose reservation expired and free their stock.
+
+    Each order is released in its own transaction. Returns the number of
+    orders cancelled.
+    """
+    expired = Order.objects.filter(
+        order_status='pending',
+        reserved_until__lt=now or timezone.now(),
+    ).order_by('reserved_until')
+    released = 0
+    for order in expired[:limit].iterator():
+        released += release(order, status='cancelled')
+    return released
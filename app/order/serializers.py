@@ -1,10 +1,12 @@
 from rest_framework import serializers
+from core.fieldsets import SparseFieldsMixin
 from core.models import (
     Order,
     OrderItem,
     Address,
     Coupon,
 )
+from order import coupons, reservations, services
 from product.serializers import ProductDetailSerializer
 
 
@@ -31,6 +33,8 @@ class AddressSerializer(serializers.ModelSerializer):
 
 class CouponSerializer(serializers.ModelSerializer):
     """Serializer for Coupon model"""
+    used_count = serializers.SerializerMethodField()
+
     class Meta:
         model = Coupon
         fields = [
@@ -47,10 +51,14 @@ class CouponSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
+    def get_used_count(self, coupon) -> int:
+        return coupons.used_count(coupon)
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     order = serializers.PrimaryKeyRelatedField(read_only=True)
-    product_detail = ProductDetailSerializer()
+    product_detail = ProductDetailSerializer(read_only=True)
+    product_detail_id = serializers.IntegerField(write_only=True)
 
     class Meta:
         model = OrderItem
@@ -58,16 +66,20 @@ class OrderItemSerializer(serializers.ModelSerializer):
             'id',
             'order',
             'product_detail',
+            'product_detail_id',
             'quantity',
             'total_price',
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'total_price']
+        extra_kwargs = {'quantity': {'min_value': 1}}
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
-    address = AddressSerializer(required=True)
-    coupon = CouponSerializer(required=False, allow_null=True)
+    address = AddressSerializer(required=False)
+    address_id = serializers.IntegerField(write_only=True, required=False)
+    coupon = CouponSerializer(read_only=True)
+    coupon_code = serializers.CharField(write_only=True, required=False)
     items = OrderItemSerializer(many=True, required=True)
 
     class Meta:
@@ -76,66 +88,50 @@ class OrderSerializer(serializers.ModelSerializer):
             'id',
             'user',
             'address',
+            'address_id',
             'coupon',
+            'coupon_code',
             'items',
             'order_date',
             'total_amount',
             'discount_amount',
             'order_status',
         ]
-        read_only_fields = ['id']
+        read_only_fields = [
+            'id', 'total_amount', 'discount_amount', 'order_status']
 
-    def _get_product_variant_price(self, product_detail):
-        """Get the price of the product variant"""
-        original_price = product_detail.price
-        sale_price = product_detail.sale_price
-        if not sale_price:
-            if not original_price:
-                return 0
-            else:
-                return original_price
-        else:
-            if not original_price:
-                return sale_price
-            else:
-                return min(sale_price, original_price)
+    collapsed_fields = {
+        'address': serializers.PrimaryKeyRelatedField(read_only=True),
+        'coupon': serializers.PrimaryKeyRelatedField(read_only=True),
+        'items': serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+    }
 
-    def create(self, validated_data):
-        """Create a new order"""
-        address_data = validated_data.pop('address')
-        coupon_data = validated_data.pop('coupon', None)
-        items_data = validated_data.pop('items')
-
-        address_serializer = AddressSerializer(data=address_data)
-        address_serializer.is_valid(raise_exception=True)
-        address = address_serializer.save(user=self.context['request'].user)
-
-        if coupon_data:
-            coupon_serializer = CouponSerializer(data=coupon_data)
-            coupon_serializer.is_valid(raise_exception=True)
-            coupon = coupon_serializer.save()
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError("An order needs items")
+        return items
 
-        order = Order.objects.create(
+    def create(self, validated_data):
+        """Place a new order, priced and reserved server-side"""
+        order = services.place_order(
             user=self.context['request'].user,
-            address=address,
-            coupon=coupon if coupon_data else None,
-            **validated_data
+            items=validated_data['items'],
+            address=validated_data.get('address'),
+            address_id=validated_data.get('address_id'),
+            coupon_code=validated_data.get('coupon_code'),
         )
+        # Read it back with its relations for the response
+        return Order.objects.select_related(
+            'address', 'coupon').prefetch_related(
+                'items__product_detail__detail_variant').get(pk=order.pk)
 
-        for item in items_data:
-            product_detail = item.get('product_detail')
-            quantity = item.get('quantity')
-
-            OrderItem.objects.create(
-                order=order,
-                product_detail=product_detail,
-                quantity=quantity,
-                total_price=self._get_product_variant_price(
-                    product_detail
-                    ) * quantity
-            )
 
-        return order
+class CheckoutSerializer(serializers.Serializer):
+    """Where to ship the checked cart items, and an optional coupon"""
+    address = AddressSerializer(required=False)
+    address_id = serializers.IntegerField(required=False)
+    coupon_code = serializers.CharField(required=False)
 
 
 class OrderUpdateSerializer(serializers.ModelSerializer):
@@ -161,11 +157,14 @@ class OrderUpdateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
     def update(self, instance, validated_data):
-        """Update the order status"""
+        """Update the order status, releasing or keeping its stock"""
         order_status = validated_data.get(
             'order_status',
             instance.order_status
         )
-        instance.order_status = order_status
-        instance.save()
+        try:
+            reservations.change_status(instance, order_status)
+        except reservations.InvalidTransition as error:
+            raise serializers.ValidationError(
+                {'order_status': str(error)})
         return instance
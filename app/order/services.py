@@ -0,0 +1,181 @@
+"""
+Order placement.
+
+``place_order`` writes an order in one transaction with a fixed number
+of queries whatever its number of lines: the address is looked up (and
+only created when the user has no identical one), the coupon redeemed
+with order.coupons, all product details are fetched at once, the items
+are inserted with ``bulk_create`` and their stock is reserved at once.
+Prices, totals and discounts are computed here, never taken from the
+client.
+
+``checkout_cart`` places an order of the checked items of the user's
+cart and removes them from the cart in the same transaction. An
+idempotency key makes retries of a checkout return its order.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework import serializers
+
+from core.models import (
+    Address,
+    CartItem,
+    Order,
+    OrderItem,
+    ProductDetail,
+)
+from order import coupons, reservations
+from product.inventory import InsufficientStock
+
+CENTS = Decimal('0.01')
+
+# Address fields that identify an address of a user
+ADDRESS_FIELDS = (
+    'recipient_name',
+    'recipient_phone_number',
+    'address_line',
+    'country',
+    'city',
+    'state',
+    'postal_code',
+)
+
+
+def unit_price(detail):
+    """The lower of a product detail's price and sale price."""
+    prices = [price for price in (detail.price, detail.sale_price) if price]
+    return min(prices, default=Decimal(0))
+
+
+def coupon_discount(coupon, subtotal):
+    """The discount of a coupon on a subtotal; 0 if it does not apply.
+
+    A ``max_discount_amount`` of 0 means no cap.
+    """
+    if coupon is None or subtotal < coupon.min_order_amount:
+        return Decimal(0)
+    discount = (subtotal * coupon.discount_percentage / 100).quantize(CENTS)
+    if coupon.max_discount_amount:
+        discount = min(discount, coupon.max_discount_amount)
+    return discount
+
+
+def _address(user, address_id, address_data):
+    if address_id is not None:
+        address = Address.objects.filter(pk=address_id, user=user).first()
+        if address is None:
+            raise serializers.ValidationError(
+                {'address_id': f"No address {address_id}"})
+        return address
+    if address_data is None:
+        address = Address.objects.filter(user=user, is_default=True).first()
+        if address is None:
+            raise serializers.ValidationError(
+                {'address': "An address or address_id is required"})
+        return address
+    lookup = {
+        field: address_data.get(field) for field in ADDRESS_FIELDS}
+    address = Address.objects.filter(user=user, **lookup).first()
+    if address is None:
+        address = Address.objects.create(
+            user=user, is_default=address_data.get('is_default', False),
+            **lookup)
+    return address
+
+
+def place_order(user, items, address=None, address_id=None,
+                coupon_code=None, idempotency_key=None):
+    """Create an order of ``items`` (``product_detail_id``, ``quantity``).
+
+    The order goes to ``address_id``, to the user's address matching
+    ``address`` (created if there is none) or to their default address.
+    ``coupon_code`` must name an active coupon with redemptions left
+    whose minimum amount the order reaches. Raises ValidationError,
+    writing nothing, for unknown details, invalid coupons and variants
+    without enough stock.
+    """
+    quantities = {}
+    for item in items:
+        detail_id = item['product_detail_id']
+        quantities[detail_id] = quantities.get(detail_id, 0) \
+            + item['quantity']
+
+    with transaction.atomic():
+        details = ProductDetail.objects.only(
+            'id', 'detail_variant_id', 'price', 'sale_price',
+        ).in_bulk(list(quantities))
+        unknown = sorted(set(quantities) - set(details))
+        if unknown:
+            raise serializers.ValidationError(
+                {'items': f"Unknown product details {unknown}"})
+
+        lines = [
+            OrderItem(
+                product_detail_id=detail_id,
+                quantity=quantity,
+                total_price=unit_price(details[detail_id]) * quantity,
+            )
+            for detail_id, quantity in quantities.items()]
+        subtotal = sum((line.total_price for line in lines), Decimal(0))
+
+        coupon = None
+        if coupon_code:
+            try:
+                coupon = coupons.redeem(coupon_code, subtotal)
+            except coupons.CouponUnavailable as error:
+                raise serializers.ValidationError(
+                    {'coupon_code': str(error)})
+        discount = coupon_discount(coupon, subtotal)
+
+        order = Order.objects.create(
+            user=user,
+            address=_address(user, address_id, address),
+            coupon=coupon,
+            total_amount=subtotal - discount,
+            discount_amount=discount,
+            idempotency_key=idempotency_key,
+        )
+        for line in lines:
+            line.order = order
+        OrderItem.objects.bulk_create(lines)
+
+        stock = {}
+        for detail_id, quantity in quantities.items():
+            variant_id = details[detail_id].detail_variant_id
+            if variant_id is not None:
+                stock[variant_id] = stock.get(variant_id, 0) + quantity
+        try:
+            reservations.reserve(order, stock)
+        except InsufficientStock as error:
+            raise serializers.ValidationError(
+                {'items': f"Variant {error.variant_id} is out of stock"})
+    return order
+
+
+def checkout_cart(user, idempotency_key=None, **placement):
+    """Order the checked items of the user's cart and clear them.
+
+    ``placement`` takes the address and coupon arguments of
+    ``place_order``. The checked items are locked first, so concurrent
+    retries of one checkout run one after the other; a retry with the
+    ``idempotency_key`` of a placed order returns that order. Returns the
+    order and whether it was created.
+    """
+    with transaction.atomic():
+        items = list(CartItem.objects.select_for_update().filter(
+            cart__user=user, is_checked=True,
+        ).values('id', 'product_detail_id', 'quantity'))
+        if idempotency_key is not None:
+            placed = Order.objects.filter(
+                user=user, idempotency_key=idempotency_key).first()
+            if placed is not None:
+                return placed, False
+        if not items:
+            raise serializers.ValidationError(
+                {'items': "No checked items in the cart"})
+        order = place_order(
+            user, items, idempotency_key=idempotency_key, **placement)
+        CartItem.objects.filter(
+            pk__in=[item['id'] for item in items]).delete()
+    return order, True
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Coupon
+from order.coupons import active_coupons
+
+
+@receiver([post_save, post_delete], sender=Coupon)
+def reload_active_coupons(sender, **kwargs):
+    """Reload the active coupon index after a coupon changes."""
+    active_coupons.invalidate()
@@ -0,0 +1,151 @@
+"""
+Tests for coupon redemption.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.models import Coupon, CouponCounter
+from order import coupons
+
+
+def create_coupon(code='SALE', **params):
+    now = timezone.now()
+    defaults = {
+        'discount_percentage': Decimal('10'),
+        'usage_limit': 10,
+        'start_date': now - timedelta(days=1),
+        'end_date': now + timedelta(days=1),
+    }
+    defaults.update(params)
+    return Coupon.objects.create(code=code, **defaults)
+
+
+def redemptions(coupon):
+    return coupons.used_count(Coupon.objects.get(pk=coupon.pk))
+
+
+class RedeemTests(TestCase):
+    """Test coupons are checked and their limit kept."""
+
+    def test_redeem(self):
+        """Test a valid coupon is returned and counted."""
+        coupon = create_coupon()
+
+        self.assertEqual(coupons.redeem('SALE', Decimal('5')).pk, coupon.pk)
+        self.assertEqual(redemptions(coupon), 1)
+
+    def test_invalid_coupons(self):
+        """Test unknown, inactive, early, expired and too large coupons."""
+        now = timezone.now()
+        create_coupon('OFF', is_active=False)
+        create_coupon('SOON', start_date=now + timedelta(hours=1))
+        create_coupon('OLD', end_date=now - timedelta(hours=1))
+        create_coupon('BIG', min_order_amount=Decimal('100'))
+
+        for code in ('NONE', 'OFF', 'SOON', 'OLD', 'BIG'):
+            with self.assertRaises(coupons.CouponUnavailable):
+                coupons.redeem(code, Decimal('50'))
+
+        self.assertEqual(
+            sum(Coupon.objects.values_list('used_count', flat=True)), 0)
+
+    def test_usage_limit(self):
+        """Test redemptions stop at the usage limit."""
+        coupon = create_coupon(usage_limit=2)
+
+        coupons.redeem('SALE', Decimal('5'))
+        coupons.redeem('SALE', Decimal('5'))
+        with self.assertRaises(coupons.CouponUnavailable):
+            coupons.redeem('SALE', Decimal('5'))
+
+        self.assertEqual(redemptions(coupon), 2)
+
+    def test_saved_coupon_reloads_index(self):
+        """Test deactivating a coupon takes effect at once."""
+        coupon = create_coupon()
+        coupons.redeem('SALE', Decimal('5'))
+
+        coupon.is_active = False
+        coupon.save()
+
+        with self.assertRaises(coupons.CouponUnavailable):
+            coupons.redeem('SALE', Decimal('5'))
+
+    def test_stale_index_served_while_reloading(self):
+        """Test a checkout uses the loaded coupons while another reloads."""
+        create_coupon()
+        index = coupons.ActiveCoupons(reload_seconds=0)
+        self.assertEqual(index.get('SALE').code, 'SALE')
+        index._loading = True
+
+        with self.assertNumQueries(0):
+            self.assertEqual(index.get('SALE').code, 'SALE')
+
+    def test_sharded_counter(self):
+        """Test shards take the redemptions left and are summed."""
+        coupon = create_coupon(usage_limit=10, used_count=3)
+
+        out = StringIO()
+        call_command('shard_coupon', 'SALE', shards=4, stdout=out)
+
+        self.assertIn('counts on 4 shards, 3 of 10 used', out.getvalue())
+        self.assertEqual(
+            sorted(coupon.counters.values_list('usage_limit', flat=True)),
+            [1, 2, 2, 2])
+        for _ in range(7):
+            coupons.redeem('SALE', Decimal('5'))
+        with self.assertRaises(coupons.CouponUnavailable):
+            coupons.redeem('SALE', Decimal('5'))
+        self.assertEqual(redemptions(coupon), 10)
+
+        coupons.shard_coupon(coupon.pk, 0)
+        self.assertFalse(CouponCounter.objects.exists())
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).used_count, 10)
+
+    def test_stale_index_counts_on_shards(self):
+        """Test a coupon sharded after the index loaded is still kept."""
+        coupon = create_coupon(usage_limit=2)
+        stale = Coupon.objects.get(pk=coupon.pk)
+        coupons.shard_coupon(coupon.pk, 2)
+
+        self.assertTrue(coupons._increment(stale))
+        self.assertTrue(coupons._increment(stale))
+        self.assertFalse(coupons._increment(stale))
+        self.assertEqual(redemptions(coupon), 2)
+
+
+class ConcurrentRedeemTests(TransactionTestCase):
+    """Test concurrent checkouts never pass the usage limit."""
+
+    def redeem(self, _):
+        try:
+            with transaction.atomic():
+                coupons.redeem('SALE', Decimal('5'))
+            return True
+        except coupons.CouponUnavailable:
+            return False
+        finally:
+            connection.close()
+
+    def assert_limit_kept(self, shards):
+        coupon = create_coupon(usage_limit=25)
+        coupons.shard_coupon(coupon.pk, shards)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            redeemed = sum(pool.map(self.redeem, range(60)))
+
+        self.assertEqual(redeemed, 25)
+        self.assertEqual(redemptions(coupon), 25)
+
+    def test_single_counter(self):
+        self.assert_limit_kept(shards=0)
+
+    def test_sharded_counter(self):
+        self.assert_limit_kept(shards=4)
@@ -0,0 +1,231 @@
+"""
+Tests for placing orders.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Address,
+    Cart,
+    CartItem,
+    Coupon,
+    Order,
+    Product,
+    ProductDetail,
+    ProductVariant,
+)
+from order.services import place_order
+
+
+ORDERS_URL = reverse('order:order-list')
+CHECKOUT_URL = reverse('order:order-checkout')
+
+ADDRESS = {
+    'recipient_name': 'Ann Buyer',
+    'recipient_phone_number': '0123456789',
+    'address_line': '1 Main Street',
+    'country': 'VN',
+    'city': 'Hanoi',
+}
+
+
+def create_details(count, price='10.00', sale_price='8.00', stock=5):
+    """Product details of ``count`` variants of one product."""
+    product = Product.objects.create(name='Tee')
+    return [
+        ProductDetail.objects.create(
+            product=product,
+            detail_variant=ProductVariant.objects.create(
+                product=product, size=str(i), stock_quantity=stock),
+            price=Decimal(price),
+            sale_price=Decimal(sale_price),
+        )
+        for i in range(count)]
+
+
+class PlaceOrderTests(TestCase):
+    """Test orders are priced, addressed and written server-side."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.details = create_details(2)
+
+    def payload(self, **extra):
+        return {
+            'address': ADDRESS,
+            'items': [
+                {'product_detail_id': self.details[0].pk, 'quantity': 2},
+                {'product_detail_id': self.details[1].pk, 'quantity': 1},
+            ],
+            **extra,
+        }
+
+    def test_create_order(self):
+        """Test totals come from the product details, not the client."""
+        res = self.client.post(
+            ORDERS_URL, self.payload(total_amount='0.01'), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['total_amount'], '24.00')
+        self.assertEqual(res.data['discount_amount'], '0.00')
+        self.assertEqual(
+            sorted(item['total_price'] for item in res.data['items']),
+            ['16.00', '8.00'])
+        self.assertEqual(res.data['order_status'], 'pending')
+
+    def test_address_is_reused(self):
+        """Test an identical address is looked up instead of copied."""
+        for _ in range(2):
+            self.client.post(ORDERS_URL, self.payload(), format='json')
+
+        self.assertEqual(Address.objects.filter(user=self.user).count(), 1)
+
+    def test_coupon_discount(self):
+        """Test a coupon gives its capped discount and is used up."""
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code='TEN', discount_percentage=Decimal('50'),
+            max_discount_amount=Decimal('5.00'), usage_limit=1,
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1))
+
+        res = self.client.post(
+            ORDERS_URL, self.payload(coupon_code='TEN'), format='json')
+        again = self.client.post(
+            ORDERS_URL, self.payload(coupon_code='TEN'), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['discount_amount'], '5.00')
+        self.assertEqual(res.data['total_amount'], '19.00')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+
+    def test_rejected_order_writes_nothing(self):
+        """Test unknown details and missing stock leave no order behind."""
+        unknown = self.payload()
+        unknown['items'][0]['product_detail_id'] = 0
+        too_many = self.payload()
+        too_many['items'][1]['quantity'] = 6
+
+        for payload in (unknown, too_many):
+            res = self.client.post(ORDERS_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('items', res.data)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Address.objects.exists())
+        self.assertEqual(
+            ProductVariant.objects.get(
+                pk=self.details[0].detail_variant_id).stock_quantity, 5)
+
+    def test_queries_do_not_grow_with_lines(self):
+        """Test an order of 20 lines takes as many queries as one line."""
+        details = create_details(20)
+        Address.objects.create(user=self.user, **ADDRESS)
+        counts = []
+        for lines in (details[:1], details):
+            with CaptureQueriesContext(connection) as queries:
+                place_order(
+                    self.user,
+                    [{'product_detail_id': detail.pk, 'quantity': 1}
+                     for detail in lines],
+                    address=ADDRESS)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 13)
+
+
+class CheckoutTests(TestCase):
+    """Test checking out the checked items of the cart."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.get(user=self.user)
+        self.details = create_details(3)
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product_detail=self.details[0],
+                     quantity=2, is_checked=True),
+            CartItem(cart=self.cart, product_detail=self.details[1],
+                     quantity=1, is_checked=True),
+            CartItem(cart=self.cart, product_detail=self.details[2],
+                     quantity=1, is_checked=False),
+        ])
+
+    def checkout(self, key=None, **payload):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            CHECKOUT_URL, {'address': ADDRESS, **payload}, format='json',
+            **headers)
+
+    def test_checkout(self):
+        """Test checked items become the order and leave the cart."""
+        res = self.checkout()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['total_amount'], '24.00')
+        self.assertEqual(
+            sorted(item['product_detail']['id'] for item in res.data['items']),
+            [self.details[0].pk, self.details[1].pk])
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_detail', flat=True)),
+            [self.details[2].pk])
+
+    def test_retry_returns_placed_order(self):
+        """Test a retried checkout neither orders nor reserves twice."""
+        first = self.checkout(key='checkout-1')
+        CartItem.objects.filter(cart=self.cart).update(is_checked=True)
+        retry = self.checkout(key='checkout-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 1)
+        self.assertEqual(
+            ProductVariant.objects.get(
+                pk=self.details[0].detail_variant_id).stock_quantity, 3)
+
+    def test_empty_checkout(self):
+        """Test a cart without checked items is refused."""
+        CartItem.objects.update(is_checked=False)
+
+        res = self.checkout()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_queries_do_not_grow_with_cart(self):
+        """Test checking out 20 items takes as many queries as one."""
+        Address.objects.create(user=self.user, **ADDRESS)
+        counts = []
+        for details in (create_details(1), create_details(20)):
+            CartItem.objects.bulk_create(
+                CartItem(cart=self.cart, product_detail=detail,
+                         is_checked=True)
+                for detail in details)
+            CartItem.objects.filter(
+                cart=self.cart).exclude(
+                    product_detail__in=details).update(is_checked=False)
+            with CaptureQueriesContext(connection) as queries:
+                res = self.checkout()
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
@@ -0,0 +1,247 @@
+"""
+Tests for the stock reservations of orders.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    Coupon,
+    Order,
+    OrderItem,
+    Product,
+    ProductDetail,
+    ProductVariant,
+)
+from order import coupons, reservations
+from product.inventory import InsufficientStock, change_stock
+
+
+def order_url(order_id):
+    return reverse('order:order-detail', args=[order_id])
+
+
+def create_order(user, *items):
+    """An order with ``(variant, quantity)`` items."""
+    order = Order.objects.create(user=user)
+    for variant, quantity in items:
+        OrderItem.objects.create(
+            order=order,
+            product_detail=ProductDetail.objects.create(
+                product_id=variant.product_id, detail_variant=variant),
+            quantity=quantity,
+        )
+    return order
+
+
+def stock(*variants):
+    return [
+        ProductVariant.objects.get(pk=variant.pk).stock_quantity
+        for variant in variants]
+
+
+class ReservationTests(TestCase):
+    """Test orders take and give back the stock of their items."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', password='testpass123')
+        self.product = Product.objects.create(name='Tee')
+        self.red = ProductVariant.objects.create(
+            product=self.product, color='Red', stock_quantity=3)
+        self.blue = ProductVariant.objects.create(
+            product=self.product, color='Blue', stock_quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reserve(self):
+        """Test a new order takes its stock until it expires."""
+        order = create_order(self.user, (self.red, 2), (self.blue, 1))
+
+        reservations.reserve(order)
+
+        self.assertEqual(stock(self.red, self.blue), [1, 0])
+        self.assertEqual(
+            Product.objects.get(pk=self.product.pk).in_stock, True)
+        self.assertGreater(order.reserved_until, timezone.now())
+
+    def test_reserve_insufficient_stock(self):
+        """Test an order taking too much stock changes no variant."""
+        order = create_order(self.user, (self.red, 2), (self.blue, 2))
+
+        with self.assertRaises(InsufficientStock) as raised, \
+                transaction.atomic():
+            reservations.reserve(order)
+
+        self.assertEqual(raised.exception.variant_id, self.blue.pk)
+        self.assertEqual(stock(self.red, self.blue), [3, 1])
+
+    def test_cancel_releases_once(self):
+        """Test cancelling an order gives its stock back once."""
+        order = create_order(self.user, (self.red, 2))
+        reservations.reserve(order)
+
+        for _ in range(2):
+            res = self.client.patch(
+                order_url(order.pk), {'order_status': 'cancelled'},
+                format='json')
+            self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(stock(self.red), [3])
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, 'cancelled')
+        self.assertIsNone(order.reserved_until)
+
+    def test_cancel_gives_coupon_back(self):
+        """Test cancelling an order gives back its coupon redemption."""
+        now = timezone.now()
+        for shards in (0, 2):
+            coupon = Coupon.objects.create(
+                code=f'SALE{shards}', discount_percentage=Decimal('10'),
+                usage_limit=1, start_date=now - timedelta(days=1),
+                end_date=now + timedelta(days=1))
+            coupons.shard_coupon(coupon.pk, shards)
+            order = create_order(self.user, (self.red, 1))
+            order.coupon = coupons.redeem(coupon.code, Decimal('10'))
+            order.save(update_fields=['coupon'])
+            reservations.reserve(order)
+
+            for _ in range(2):
+                self.client.patch(
+                    order_url(order.pk), {'order_status': 'cancelled'},
+                    format='json')
+
+            self.assertEqual(
+                coupons.used_count(Coupon.objects.get(pk=coupon.pk)), 0)
+            self.assertEqual(
+                coupons.redeem(coupon.code, Decimal('10')).pk, coupon.pk)
+
+    def test_cancelled_order_stays_cancelled(self):
+        """Test a cancelled order cannot take back its released stock."""
+        order = create_order(self.user, (self.red, 2))
+        reservations.reserve(order)
+        self.client.patch(
+            order_url(order.pk), {'order_status': 'cancelled'},
+            format='json')
+
+        for status in ('pending', 'shipped', 'delivered'):
+            res = self.client.patch(
+                order_url(order.pk), {'order_status': status},
+                format='json')
+            self.assertEqual(res.status_code, 400)
+            self.assertIn('order_status', res.data)
+
+        self.assertEqual(
+            Order.objects.get(pk=order.pk).order_status, 'cancelled')
+        self.assertEqual(stock(self.red), [3])
+
+    def test_shipped_order_cannot_go_back(self):
+        """Test shipped orders only move on to delivered."""
+        order = create_order(self.user, (self.red, 1))
+        reservations.change_status(order, 'shipped')
+
+        for status in ('pending', 'cancelled'):
+            with self.assertRaises(reservations.InvalidTransition):
+                reservations.change_status(order, status)
+        reservations.change_status(order, 'delivered')
+
+        self.assertEqual(
+            Order.objects.get(pk=order.pk).order_status, 'delivered')
+
+    def test_update_after_sweep_is_refused(self):
+        """Test shipping an order the sweep cancelled meanwhile fails."""
+        order = create_order(self.user, (self.red, 2))
+        reservations.reserve(order)
+        stale = Order.objects.get(pk=order.pk)
+
+        reservations.release_expired(now=timezone.now() + timedelta(days=1))
+        with self.assertRaises(reservations.InvalidTransition):
+            reservations.change_status(stale, 'shipped')
+
+        self.assertEqual(stock(self.red), [3])
+
+    def test_shipped_order_keeps_stock(self):
+        """Test shipping ends the reservation without giving stock back."""
+        order = create_order(self.user, (self.red, 2))
+        reservations.reserve(order)
+
+        self.client.patch(
+            order_url(order.pk), {'order_status': 'shipped'}, format='json')
+        released = reservations.release_expired(
+            now=timezone.now() + timedelta(days=1))
+
+        self.assertEqual(released, 0)
+        self.assertEqual(stock(self.red), [1])
+
+    def test_sweep_releases_expired_orders(self):
+        """Test the sweep cancels expired pending orders only."""
+        expired = create_order(self.user, (self.red, 1))
+        reservations.reserve(expired)
+        Order.objects.filter(pk=expired.pk).update(
+            reserved_until=timezone.now() - timedelta(seconds=1))
+        current = create_order(self.user, (self.red, 1))
+        reservations.reserve(current)
+
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+
+        self.assertIn('Released the stock of 1 expired orders',
+                      out.getvalue())
+        self.assertEqual(stock(self.red), [2])
+        self.assertEqual(
+            Order.objects.get(pk=expired.pk).order_status, 'cancelled')
+        self.assertEqual(
+            Order.objects.get(pk=current.pk).order_status, 'pending')
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Test concurrent buyers of the same variants."""
+
+    def setUp(self):
+        self.first = ProductVariant.objects.create(
+            product=Product.objects.create(name='First'), stock_quantity=10)
+        self.second = ProductVariant.objects.create(
+            product=Product.objects.create(name='Second'), stock_quantity=10)
+
+    def take(self, deltas):
+        try:
+            change_stock(deltas)
+            return True
+        except InsufficientStock:
+            return False
+        finally:
+            connection.close()
+
+    def test_no_oversell(self):
+        """Test more buyers than units sell exactly the stock."""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sold = sum(pool.map(
+                lambda _: self.take({self.first.pk: -1}), range(30)))
+
+        self.assertEqual(sold, 10)
+        self.assertEqual(stock(self.first), [0])
+        self.assertEqual(
+            Product.objects.values_list('stock_quantity', 'in_stock').get(
+                pk=self.first.product_id), (0, False))
+
+    def test_overlapping_orders_do_not_deadlock(self):
+        """Test orders listing the same variants in any order all run."""
+        forward = {self.first.pk: -1, self.second.pk: -1}
+        backward = dict(reversed(forward.items()))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sold = sum(pool.map(
+                lambda i: self.take(forward if i % 2 else backward),
+                range(16)))
+
+        self.assertEqual(sold, 10)
+        self.assertEqual(stock(self.first, self.second), [0, 0])
@@ -1,19 +1,30 @@
-from rest_framework import viewsets
+from django.db.models import Prefetch
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
 from order.serializers import (
     AddressSerializer,
+    CheckoutSerializer,
     CouponSerializer,
     OrderSerializer,
     OrderUpdateSerializer
 )
+from order.services import checkout_cart
 
+from core.fieldsets import FIELDSET_PARAMETERS, SparseFieldsViewMixin
 from core.models import (
     Address,
     Order,
+    OrderItem,
     Coupon,
 )
 
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
 
 
 class AddressViewSet(viewsets.ModelViewSet):
@@ -41,7 +52,10 @@ class CouponViewSet(viewsets.ReadOnlyModelViewSet):
         return Coupon.objects.filter(is_active=True).order_by('-id')
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class OrderViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Order model"""
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
@@ -51,7 +65,8 @@ class OrderViewSet(viewsets.ModelViewSet):
             OpenApiParameter(
                 name='order_status',
                 type=str,
-            )
+            ),
+            *FIELDSET_PARAMETERS,
         ]
     )
     def list(self, request, *args, **kwargs):
@@ -61,19 +76,68 @@ class OrderViewSet(viewsets.ModelViewSet):
         """Return the list of orders for the authenticated user"""
         user = self.request.user
         order_status = self.request.query_params.get('order_status')
+        queryset = Order.objects.filter(user=user).order_by('-order_date')
         if order_status:
-            return Order.objects.filter(
-                user=user,
-                order_status=order_status
-            ).order_by('-order_date')
-        return Order.objects.filter(user=user).order_by('-order_date')
+            queryset = queryset.filter(order_status=order_status)
+
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return queryset.select_related(
+                'address', 'coupon').prefetch_related(
+                    'items__product_detail__detail_variant')
+
+        queryset = queryset.only(*self.get_fieldset_columns())
+        related = [name for name in ('address', 'coupon')
+                   if fieldset.expands(name)]
+        if related:
+            queryset = queryset.select_related(*related)
+        if fieldset.expands('items'):
+            queryset = queryset.prefetch_related(
+                'items__product_detail__detail_variant')
+        elif fieldset.includes('items'):
+            queryset = queryset.prefetch_related(
+                Prefetch('items', OrderItem.objects.only('order')))
+        return queryset
 
     def get_serializer_class(self):
         """Return the appropriate serializer class based on the action"""
         if self.action == 'update' or self.action == 'partial_update':
             return OrderUpdateSerializer
+        if self.action == 'checkout':
+            return CheckoutSerializer
         return self.serializer_class
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='Idempotency-Key',
+                type=str,
+                location=OpenApiParameter.HEADER,
+                description='Client key of the checkout; retries with the '
+                            'same key return the order already placed'
+            ),
+        ],
+        responses={201: OrderSerializer, 200: OrderSerializer},
+    )
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """Order the checked items of the cart and remove them from it."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        key = request.headers.get('Idempotency-Key') or None
+        if key is not None and len(key) > 255:
+            return Response(
+                {'detail': 'Idempotency-Key is longer than 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        order, created = checkout_cart(
+            request.user, idempotency_key=key, **serializer.validated_data)
+        order = self.get_queryset().get(pk=order.pk)
+        return Response(
+            OrderSerializer(
+                order, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     def perform_create(self, serializer):
         """Create a new order for the authenticated user"""
         serializer.save(user=self.request.user)
@@ -0,0 +1,219 @@
+"""
+Typeahead suggestions for the search box.
+
+Suggestions come from an in-process prefix index of the most reviewed
+products and all categories, which answers most keystrokes without a
+query. When it has too few matches, or the text has a typo, the database
+is searched by trigram word similarity on ``pg_trgm`` GIN indexes (plain
+prefix matching where the extension is not installed).
+"""
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+
+from core.models import Category, Product
+
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+
+_trigram_available = {}
+
+
+def trigram_available():
+    """Whether the pg_trgm extension is installed in the database."""
+    key = connection.settings_dict['NAME']
+    if key not in _trigram_available:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[key] = cursor.fetchone() is not None
+    return _trigram_available[key]
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+class PrefixIndex:
+    """Sorted word prefixes of popular product names and categories.
+
+    Every word of a name is an entry, so "boo" finds "Leather boot".
+    Matches are ranked by popularity (review count) and name length.
+    """
+
+    def __init__(self, products, categories):
+        # products: (id, name, thumbnail, popularity); categories: (id, name)
+        self.products = products
+        self.categories = categories
+        self.product_words, self.product_rows = self._entries(
+            [name for _, name, _, _ in products])
+        self.category_words, self.category_rows = self._entries(
+            [name for _, name in categories])
+        self.popularity = np.array(
+            [popularity for *_, popularity in products], dtype=np.float64)
+
+    @staticmethod
+    def _entries(names):
+        entries = sorted(
+            (word, row)
+            for row, name in enumerate(names)
+            for word in set(WORD_RE.findall(name.lower())))
+        words = np.array([word for word, _ in entries], dtype=str)
+        rows = np.array([row for _, row in entries], dtype=np.int64)
+        return words, rows
+
+    @classmethod
+    def build(cls, size):
+        products = list(Product.objects.order_by(
+            '-review_count', '-id').values_list(
+                'id', 'name', 'primary_image_url', 'review_count')[:size])
+        categories = list(Category.objects.values_list('id', 'name'))
+        return cls(products, categories)
+
+    @staticmethod
+    def _match(words, rows, text):
+        """Rows having every word of ``text``, the last as a prefix."""
+        terms = normalize(text).split()
+        if not terms or not len(words):
+            return np.array([], dtype=np.int64)
+        *full, last = terms
+        # The last word is still being typed; the others are complete.
+        lo = np.searchsorted(words, last, 'left')
+        hi = np.searchsorted(words, last + '\uffff', 'left')
+        matches = np.unique(rows[lo:hi])
+        for term in full:
+            lo = np.searchsorted(words, term, 'left')
+            hi = np.searchsorted(words, term, 'right')
+            matches = np.intersect1d(matches, rows[lo:hi])
+        return matches
+
+    def products_for(self, text, limit):
+        rows = self._match(self.product_words, self.product_rows, text)
+        if len(rows) > limit:
+            rows = rows[np.argpartition(
+                -self.popularity[rows], limit - 1)[:limit]]
+        rows = sorted(rows, key=lambda row: (
+            -self.popularity[row], len(self.products[row][1])))
+        return [
+            {'id': pk, 'name': name, 'thumbnail': thumbnail}
+            for pk, name, thumbnail, _ in (self.products[r] for r in rows)
+        ]
+
+    def categories_for(self, text, limit):
+        rows = self._match(self.category_words, self.category_rows, text)
+        rows = sorted(
+            rows, key=lambda row: len(self.categories[row][1]))[:limit]
+        return [
+            {'id': self.categories[r][0], 'name': self.categories[r][1]}
+            for r in rows
+        ]
+
+
+class Autocomplete:
+    """Suggestions from the prefix index, completed by the database."""
+
+    def __init__(self, prefix_size=50000, rebuild_seconds=600):
+        self.prefix_size = prefix_size
+        self.rebuild_seconds = rebuild_seconds
+        self._index = None
+        self._built = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+
+    def index(self):
+        """Return the prefix index, rebuilding it in the background.
+
+        The first call builds it synchronously; later rebuilds keep
+        serving the previous index until the new one is ready.
+        """
+        if not self.prefix_size:
+            return None
+        stale = time.monotonic() - self._built > self.rebuild_seconds
+        if self._index is None:
+            self.rebuild()
+        elif stale:
+            with self._lock:
+                start = not self._building
+                self._building = True
+            if start:
+                threading.Thread(
+                    target=self._rebuild_in_background, daemon=True).start()
+        return self._index
+
+    def rebuild(self):
+        started = time.perf_counter()
+        index = PrefixIndex.build(self.prefix_size)
+        with self._lock:
+            self._index = index
+            self._built = time.monotonic()
+        logger.info(
+            f"Built autocomplete index of {len(index.products)} products "
+            f"in {time.perf_counter() - started:.2f}s")
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"Error rebuilding autocomplete index: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+            connection.close()
+
+    def suggest(self, text, limit=8, category_limit=3):
+        """Return ``{'products': [...], 'categories': [...]}``."""
+        index = self.index()
+        products, categories = [], []
+        if index is not None:
+            products = index.products_for(text, limit)
+            categories = index.categories_for(text, category_limit)
+        # Too few popular matches, possibly a typo: ask the database.
+        fallback = len(products) < limit
+        if fallback:
+            seen = {product['id'] for product in products}
+            products += [
+                product for product in self.search_products(
+                    text, limit + len(seen))
+                if product['id'] not in seen
+            ][:limit - len(products)]
+        if index is None or fallback and not categories:
+            categories = self.search_categories(text, category_limit)
+        return {'products': products, 'categories': categories}
+
+    @staticmethod
+    def _search(queryset, text):
+        if trigram_available():
+            return queryset.filter(
+                name__trigram_word_similar=text,
+            ).annotate(
+                similarity=TrigramWordSimilarity(text, 'name'),
+            ).order_by('-similarity', 'id')
+        return queryset.filter(name__istartswith=text).order_by('id')
+
+    def search_products(self, text, limit):
+        rows = self._search(Product.objects.all(), text).values_list(
+            'id', 'name', 'primary_image_url')[:limit]
+        return [
+            {'id': pk, 'name': name, 'thumbnail': thumbnail}
+            for pk, name, thumbnail in rows
+        ]
+
+    def search_categories(self, text, limit):
+        rows = self._search(Category.objects.all(), text).values_list(
+            'id', 'name')[:limit]
+        return [{'id': pk, 'name': name} for pk, name in rows]
+
+
+# Global instance
+autocomplete = Autocomplete(
+    prefix_size=getattr(settings, 'AUTOCOMPLETE_PREFIX_SIZE', 50000),
+    rebuild_seconds=getattr(settings, 'AUTOCOMPLETE_REBUILD_SECONDS', 600),
+)
@@ -0,0 +1,48 @@
+"""
+Versioned response cache of product details.
+
+Every product has a ``version`` bumped by product.signals whenever the
+product or one of its details, variants, images or information rows
+changes. Cached responses are keyed by product ID and version, so a
+change makes the old entry unreachable in every worker without deleting
+it, and a request costs one primary key lookup of the current version.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from core.metrics import metrics
+from core.models import Product
+
+
+DETAIL_CACHE_SECONDS = getattr(settings, 'PRODUCT_DETAIL_CACHE_SECONDS', 3600)
+
+
+def bump_versions(product_ids):
+    """Invalidate the cached responses of products."""
+    return Product.objects.filter(pk__in=product_ids).update(
+        version=F('version') + 1, updated_at=timezone.now())
+
+
+def detail_key(product_id, version):
+    return f"product-detail:{product_id}:{version}"
+
+
+def get_product_detail(product_id, version, build):
+    """Return the cached detail of a product, or ``build()`` it.
+
+    Hits and misses are counted in the ``product_detail_cache`` metrics.
+    """
+    if not DETAIL_CACHE_SECONDS:
+        return build()
+
+    key = detail_key(product_id, version)
+    data = cache.get(key)
+    if data is not None:
+        metrics.incr('product_detail_cache.hit')
+        return data
+    metrics.incr('product_detail_cache.miss')
+    data = build()
+    cache.set(key, data, DETAIL_CACHE_SECONDS)
+    return data
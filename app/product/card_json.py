@@ -0,0 +1,88 @@
+"""
+Product cards assembled as JSON by PostgreSQL.
+
+The optional fast path of the product list (``PRODUCT_LIST_JSON_IN_DATABASE``)
+selects every card as JSON text built with ``json_build_object`` and a
+``json_agg`` subquery of the images, and splices the texts into the
+response body, so no model instance or serializer is involved. The
+cards equal the ``ProductGenericSerializer`` output once parsed:
+decimals rendered as strings by DRF are cast to text, the others are
+JSON numbers.
+"""
+import json
+
+from django.db import connection
+from django.db.models import TextField
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse
+
+from core.models import Product, ProductImage
+
+
+# Columns selected with the card: the pagination keys and the version.
+PAGE_FIELDS = ('id', 'version', 'min_price', 'average_rating', 'review_count')
+
+
+def card_sql():
+    quote = connection.ops.quote_name
+    product = quote(Product._meta.db_table)
+    image = quote(ProductImage._meta.db_table)
+    return f"""
+        json_build_object(
+            'id', {product}.id,
+            'name', {product}.name,
+            'images', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', image.id,
+                    'url', image.url,
+                    'product', image.product_id,
+                    'is_primary', image.is_primary
+                ) ORDER BY image.id)
+                FROM {image} image
+                WHERE image.product_id = {product}.id
+            ), '[]'::json),
+            'thumbnail', {product}.primary_image_url,
+            'average_rating', {product}.average_rating::text,
+            'review_count', {product}.review_count,
+            'price', {product}.price::text,
+            'original_price', {product}.min_price,
+            'sale_price', {product}.min_price_sale_price,
+            'min_sale_price', {product}.min_sale_price::text,
+            'max_sale_price', {product}.max_sale_price::text,
+            'in_stock', {product}.in_stock
+        )::text
+    """
+
+
+def with_card_json(queryset):
+    """Select dicts of the page fields and the ``card`` JSON text."""
+    fields = list(PAGE_FIELDS)
+    if 'search_rank' in queryset.query.annotations:
+        fields.append('search_rank')
+    return queryset.annotate(
+        card=RawSQL(card_sql(), [], output_field=TextField()),
+    ).values(*fields, 'card')
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def paginated_response(paginator, page, **extra):
+    """Response of a keyset page of ``with_card_json`` rows.
+
+    The envelope has the keys and order of the paginator's response,
+    followed by ``extra``.
+    """
+    body = [
+        '{"next":', _dumps(paginator.get_next_link()),
+        ',"previous":', _dumps(paginator.get_previous_link()),
+        ',"results":[', ','.join(row['card'] for row in page), ']',
+    ]
+    if paginator.total is not None:
+        extra = {'approximate_count': paginator.total, **extra}
+    for key, value in extra.items():
+        body += [',', _dumps(key), ':', _dumps(value)]
+    body.append('}')
+    return HttpResponse(
+        ''.join(body).encode(), content_type='application/json')
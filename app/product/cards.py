@@ -0,0 +1,112 @@
+"""
+Product cards: the ``ProductGenericSerializer`` output of a product.
+
+Cards are shown by product lists, carts, watched lists and
+recommendations. They are stored in the cache keyed by product ID and
+version, so catalog writes (which bump the version, see product.cache)
+replace them, and a response gathers all its cards with one multi-get.
+Missing cards are rendered together with one images query and stored.
+"""
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from rest_framework import serializers
+
+from core.metrics import metrics
+from core.models import Product
+from product.serializers import ProductGenericSerializer
+
+
+CARD_CACHE_SECONDS = 24 * 60 * 60
+
+
+def card_key(product_id, version):
+    return f"product-card:{product_id}:{version}"
+
+
+def _cached(versions):
+    """Return the cached ``{id: card}`` and keys of ``{id: version}``."""
+    keys = {pk: card_key(pk, version) for pk, version in versions.items()}
+    found = cache.get_many(list(keys.values())) if keys else {}
+    cards = {pk: found[key] for pk, key in keys.items() if key in found}
+    metrics.incr('product_card_cache.hit', len(cards))
+    metrics.incr('product_card_cache.miss', len(keys) - len(cards))
+    return cards, keys
+
+
+def _render(products, keys):
+    """Render and store the cards of products with prefetched images."""
+    cards = {
+        card['id']: dict(card)
+        for card in ProductGenericSerializer(products, many=True).data
+    }
+    cache.set_many(
+        {keys[pk]: card for pk, card in cards.items()}, CARD_CACHE_SECONDS)
+    return cards
+
+
+def product_cards(products):
+    """Return the cards of already loaded products, in order."""
+    products = list(products)
+    cards, keys = _cached({p.pk: p.version for p in products})
+    missing = [p for p in products if p.pk not in cards]
+    if missing:
+        prefetch_related_objects(missing, 'images')
+        cards.update(_render(missing, keys))
+    return [cards[p.pk] for p in products]
+
+
+def get_product_cards(product_ids):
+    """Return ``{product_id: card}`` of the existing products."""
+    versions = dict(Product.objects.filter(
+        pk__in=product_ids).values_list('id', 'version'))
+    cards, keys = _cached(versions)
+    missing = [pk for pk in versions if pk not in cards]
+    if missing:
+        cards.update(_render(
+            Product.objects.filter(pk__in=missing).defer(
+                'search_vector').prefetch_related('images'),
+            keys))
+    return cards
+
+
+def warm_product_cards(batch_size=1000):
+    """Fetch the cards of every product, rendering the missing ones."""
+    warmed, last_id = 0, 0
+    while True:
+        batch = list(Product.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return warmed
+        warmed += len(get_product_cards(batch))
+        last_id = batch[-1]
+
+
+class ProductCardListSerializer(serializers.ListSerializer):
+    """List serializer fetching the product cards of all rows at once.
+
+    The child serializer defines ``card_product_id(obj)`` and reads its
+    card with ``self.product_card(obj)``. No cards are fetched when a
+    sparse fieldset leaves out or collapses the child's ``card_field``.
+    """
+
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        fieldset = self.context.get('fieldset')
+        if fieldset is None or fieldset.expands(self.child.card_field):
+            self.context['product_cards'] = get_product_cards(
+                {self.child.card_product_id(row) for row in rows} - {None})
+        return super().to_representation(rows)
+
+
+class ProductCardMixin:
+    """Serializer mixin giving the product card of a row."""
+    card_field = None
+
+    def product_card(self, obj):
+        product_id = self.card_product_id(obj)
+        if product_id is None:
+            return {}
+        cards = self.context.get('product_cards')
+        if cards is None or product_id not in cards:
+            cards = get_product_cards([product_id])
+        return cards.get(product_id, {})
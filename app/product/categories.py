@@ -0,0 +1,117 @@
+"""
+Category tree helpers.
+
+``CategoryClosure`` stores every (ancestor, descendant, depth) pair of the
+tree so that products of a whole subtree are found with one indexed
+semi-join. The links are maintained by product.signals on category writes
+and can be rebuilt from ``Category.parent_category`` with
+``rebuild_closure``. ``Category.product_count`` counts the distinct
+products of each subtree for navigation menus.
+"""
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Category, CategoryClosure, Product
+
+
+CategoryProduct = Product.category.through
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'closure': quote(CategoryClosure._meta.db_table),
+        'category': quote(Category._meta.db_table),
+    }
+
+
+def rebuild_closure():
+    """Recompute all closure links from the parent pointers."""
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {closure}".format(**_tables()))
+        cursor.execute("""
+            INSERT INTO {closure} (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM {category}
+                UNION ALL
+                SELECT tree.ancestor_id, child.id, tree.depth + 1
+                FROM tree
+                JOIN {category} child
+                    ON child.parent_category_id = tree.descendant_id
+            )
+            SELECT ancestor_id, descendant_id, depth FROM tree
+        """.format(**_tables()))
+        return cursor.rowcount
+
+
+def subtree_ids(category_id):
+    """IDs of a category and all its descendants."""
+    return list(CategoryClosure.objects.filter(
+        ancestor_id=category_id).values_list('descendant_id', flat=True))
+
+
+def ancestor_ids(category_ids):
+    """IDs of the given categories and all their ancestors."""
+    return list(CategoryClosure.objects.filter(
+        descendant_id__in=category_ids).values_list(
+            'ancestor_id', flat=True).distinct())
+
+
+def attach(category, created):
+    """Link a saved category below its (possibly new) parent.
+
+    A moved category takes its whole subtree along: the links from the
+    old ancestors are dropped and the new ancestors are linked to every
+    category of the subtree.
+    """
+    with connection.cursor() as cursor:
+        if created:
+            cursor.execute(
+                "INSERT INTO {closure} (ancestor_id, descendant_id, depth) "
+                "VALUES (%s, %s, 0)".format(**_tables()),
+                [category.pk, category.pk])
+        else:
+            cursor.execute("""
+                DELETE FROM {closure} link
+                USING {closure} sub
+                WHERE sub.ancestor_id = %s
+                    AND link.descendant_id = sub.descendant_id
+                    AND link.ancestor_id NOT IN (
+                        SELECT descendant_id FROM {closure}
+                        WHERE ancestor_id = %s)
+            """.format(**_tables()), [category.pk, category.pk])
+        if category.parent_category_id is not None:
+            cursor.execute("""
+                INSERT INTO {closure} (ancestor_id, descendant_id, depth)
+                SELECT up.ancestor_id, sub.descendant_id,
+                    up.depth + sub.depth + 1
+                FROM {closure} up, {closure} sub
+                WHERE up.descendant_id = %s AND sub.ancestor_id = %s
+            """.format(**_tables()),
+                [category.parent_category_id, category.pk])
+
+
+def update_product_counts(category_ids=None):
+    """Recount the subtree products of categories (all if None)."""
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    counts = CategoryProduct.objects.filter(
+        category__ancestor_links__ancestor=OuterRef('pk'),
+    ).order_by().values(
+        'category__ancestor_links__ancestor',
+    ).annotate(
+        count=Count('product', distinct=True),
+    ).values('count')
+    return categories.update(
+        product_count=Coalesce(Subquery(counts), 0), updated_at=timezone.now())
+
+
+def in_subtree(category_id):
+    """Condition matching products in a category or its subcategories."""
+    return Exists(CategoryProduct.objects.filter(
+        product=OuterRef('pk'),
+        category__ancestor_links__ancestor=category_id,
+    ))
@@ -0,0 +1,41 @@
+"""
+HTTP conditional GET for catalog responses.
+
+Validators are derived from version counters and ``updated_at`` columns,
+so a revalidation is answered with 304 Not Modified before anything is
+serialized.
+"""
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def timestamp(updated_at):
+    """Microsecond timestamp of a modification time, for ETags."""
+    return int(updated_at.timestamp() * 1e6)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Add the ETag (and Last-Modified) headers to a response."""
+    response.headers['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(
+            last_modified.timestamp())
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 response if the client's copy is current, else None.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``; failed
+    ``If-Match`` preconditions give 412.
+    """
+    response = get_conditional_response(
+        request,
+        etag=quote_etag(etag),
+        last_modified=int(last_modified.timestamp())
+        if last_modified is not None else None,
+    )
+    if isinstance(response, HttpResponseNotModified):
+        set_validators(response, etag, last_modified)
+    return response
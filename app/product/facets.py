@@ -0,0 +1,372 @@
+"""
+Faceted filtering.
+
+Every filterable value of a product (price range, color, size, minimum
+rating, material, currency and each category of its subtree path) is a
+row of ``ProductFacet``, derived in SQL from the product, its variants and
+categories. The rows are kept current by product.signals and rebuilt by
+the ``rebuild_product_facets`` command.
+
+Pages are filtered in the database with one indexed semi-join per facet.
+Facet counts come from ``FacetIndex``, in-process bitmaps (one bit per
+product for each facet value) reloaded periodically: values of one facet
+are OR-ed, facets are AND-ed, and each facet is counted with
+the filters of all *other* facets so shoppers see how many products each
+additional choice would give. Products narrowed by other filters (name,
+search, stock) become a bitmap of IDs PostgreSQL sends as one string.
+The bitmap is reused for ``FACET_BASE_BITMAP_SECONDS`` (0 disables
+it), so for that long after a stock or name change the counts of such
+pages may disagree with their results.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from core.models import (
+    CategoryClosure,
+    Product,
+    ProductFacet,
+    ProductVariant,
+)
+
+
+logger = logging.getLogger(__name__)
+
+FACETS = ('price', 'color', 'size', 'rating', 'material', 'currency',
+          'category')
+
+# Product fields the facet values are derived from
+FACET_FIELDS = ('material', 'currency', 'average_rating', 'min_price')
+
+# (label, lower bound, upper bound) of the price ranges on min_price
+PRICE_RANGES = (
+    ('0-25', 0, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100-200', 100, 200),
+    ('200-', 200, None),
+)
+
+# Minimum rating values: a 4.5 star product has 4, 3, 2 and 1. Values
+# are plain numbers so they need no escaping in query strings ("+" is a
+# space there).
+MIN_RATINGS = (4, 3, 2, 1)
+
+
+def _facet_rows_sql():
+    """SELECT of (product_id, facet, value) rows for ``{products}``."""
+    quote = connection.ops.quote_name
+    product = quote(Product._meta.db_table)
+    variant = quote(ProductVariant._meta.db_table)
+    closure = quote(CategoryClosure._meta.db_table)
+    category = quote(Product.category.through._meta.db_table)
+    price = ' '.join(
+        f"WHEN min_price >= {low}"
+        + (f" AND min_price < {high}" if high else '')
+        + f" THEN '{label}'"
+        for label, low, high in PRICE_RANGES)
+    ratings = ', '.join(str(r) for r in MIN_RATINGS)
+    return f"""
+        SELECT id, 'price', CASE {price} END
+        FROM {product} WHERE id {{products}} AND min_price >= 0
+        UNION
+        SELECT id, 'rating', r::text
+        FROM {product}, unnest(ARRAY[{ratings}]) AS r
+        WHERE id {{products}} AND average_rating >= r
+        UNION
+        SELECT id, 'material', left(lower(trim(material)), 255)
+        FROM {product}
+        WHERE id {{products}} AND trim(coalesce(material, '')) <> ''
+        UNION
+        SELECT id, 'currency', currency
+        FROM {product} WHERE id {{products}} AND currency <> ''
+        UNION
+        SELECT product_id, 'color', left(lower(trim(color)), 255)
+        FROM {variant}
+        WHERE product_id {{products}} AND trim(color) <> ''
+        UNION
+        SELECT product_id, 'size', left(trim(size), 255)
+        FROM {variant}
+        WHERE product_id {{products}} AND trim(coalesce(size, '')) <> ''
+        UNION
+        SELECT link.product_id, 'category', closure.ancestor_id::text
+        FROM {category} link
+        JOIN {closure} closure ON closure.descendant_id = link.category_id
+        WHERE link.product_id {{products}}
+    """
+
+
+def refresh_product_facets(product_ids=None):
+    """Recompute the facet rows of products (all if None)."""
+    table = connection.ops.quote_name(ProductFacet._meta.db_table)
+    if product_ids is None:
+        where, params, rows_params = '', [], []
+        products = "IS NOT NULL"
+    else:
+        product_ids = [int(pk) for pk in product_ids]
+        where, params = " WHERE product_id = ANY(%s)", [product_ids]
+        products = "= ANY(%s)"
+        rows_params = [product_ids] * 7
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}{where}", params)
+        cursor.execute(
+            f"INSERT INTO {table} (product_id, facet, value) "
+            + _facet_rows_sql().format(products=products),
+            rows_params)
+        return cursor.rowcount
+
+
+def parse_filters(query_params):
+    """Return ``{facet: [values]}`` from ``?color=red,blue&size=M``."""
+    filters = {}
+    for facet in FACETS:
+        values = [
+            value.strip()
+            for param in query_params.getlist(facet)
+            for value in param.split(',') if value.strip()
+        ]
+        if values:
+            filters[facet] = values
+    return filters
+
+
+def filter_products(queryset, filters):
+    """Filter products having any of the values of every facet."""
+    for facet, values in filters.items():
+        queryset = queryset.filter(Exists(ProductFacet.objects.filter(
+            product=OuterRef('pk'),
+            facet=facet,
+            value__in=[v.lower() if facet in ('color', 'material') else v
+                       for v in values],
+        )))
+    return queryset
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        return int(np.bitwise_count(words).sum())
+else:
+    _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], np.uint8)
+
+    def _popcount(words):
+        return int(_BYTE_BITS[words.view(np.uint8)].sum(dtype=np.int64))
+
+
+class FacetIndex:
+    """Product sets of every facet value.
+
+    Products are numbered by their position in ``product_ids``. Values
+    held by at least 1/32 of the products are bitmaps of uint64 words;
+    rarer ones (most categories) are sorted position arrays, which take
+    less memory and are counted by probing the bits of the filter mask.
+    """
+
+    def __init__(self, product_ids, sets):
+        # product_ids: sorted array; sets: {facet: {value: array}}
+        self.product_ids = product_ids
+        self.sets = sets
+        self.words = (len(product_ids) + 63) // 64
+        # {(sql, params): (time, bitmap)} of the products of base querysets
+        self.bases = {}
+
+    @classmethod
+    def load(cls):
+        """Read the products of every facet value out of PostgreSQL.
+
+        Each value's product IDs arrive as one comma-separated string,
+        which is much cheaper to transfer and parse than one row each.
+        """
+        table = connection.ops.quote_name(ProductFacet._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT facet, value, string_agg(product_id::text, ',') "
+                f"FROM {table} GROUP BY facet, value")
+            rows = cursor.fetchall()
+        if not rows:
+            return cls(np.array([], dtype=np.int64), {})
+        members = [np.fromstring(ids, dtype=np.int64, sep=',')
+                   for _, _, ids in rows]
+        return cls.from_codes(
+            np.concatenate(members),
+            np.repeat(np.arange(len(rows)), [len(m) for m in members]),
+            [(facet, value) for facet, value, _ in rows])
+
+    @classmethod
+    def from_rows(cls, product_ids, facets, values):
+        """Build the index from (product_id, facet, value) columns."""
+        codes, keys = pd.factorize(pd.MultiIndex.from_arrays(
+            [np.asarray(facets), np.asarray(values)]))
+        return cls.from_codes(np.asarray(product_ids), codes, list(keys))
+
+    @classmethod
+    def from_codes(cls, product_ids, codes, keys):
+        """Build the index from product IDs and their ``keys`` indexes."""
+        unique_ids, positions = np.unique(product_ids, return_inverse=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+        words = (len(unique_ids) + 63) // 64
+
+        sets = {}
+        for code, (facet, value) in enumerate(keys):
+            members = np.sort(positions[order[bounds[code]:bounds[code + 1]]])
+            if len(members) * 32 >= len(unique_ids):
+                bits = np.zeros(words * 64, dtype=bool)
+                bits[members] = True
+                members = np.packbits(bits, bitorder='little').view(np.uint64)
+            sets.setdefault(facet, {})[value] = members
+        return cls(unique_ids, sets)
+
+    def _bitmap(self, members):
+        if members.dtype == np.uint64:
+            return members
+        bits = np.zeros(self.words * 64, dtype=bool)
+        bits[members] = True
+        return np.packbits(bits, bitorder='little').view(np.uint64)
+
+    @staticmethod
+    def _count(members, mask):
+        if mask is None:
+            return _popcount(members) if members.dtype == np.uint64 \
+                else len(members)
+        if members.dtype == np.uint64:
+            return _popcount(members & mask)
+        shifts = (members & 63).astype(np.uint64)
+        return int(((mask[members >> 6] >> shifts) & np.uint64(1)).sum())
+
+    def _union(self, facet, values):
+        union = np.zeros(self.words, dtype=np.uint64)
+        for value in values:
+            members = self.sets.get(facet, {}).get(value)
+            if members is not None:
+                union |= self._bitmap(members)
+        return union
+
+    def counts(self, filters, base=None):
+        """Return ``{facet: {value: count}}`` for the given filters.
+
+        Each facet is counted under the filters of the other facets (and
+        ``base``, a bitmap of products allowed by non-facet filters).
+        """
+        selected = {
+            facet: self._union(facet, values)
+            for facet, values in filters.items()
+        }
+        result = {}
+        for facet, values in self.sets.items():
+            mask = base
+            for other, bitmap in selected.items():
+                if other != facet:
+                    mask = bitmap if mask is None else mask & bitmap
+            counts = (
+                (value, self._count(members, mask))
+                for value, members in values.items()
+            )
+            result[facet] = dict(sorted(
+                ((value, count) for value, count in counts if count),
+                key=lambda item: (-item[1], item[0])))
+        return result
+
+    def bitmap_of(self, product_ids):
+        """Bitmap of the given products; unindexed ones are ignored."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self.product_ids):
+            return self._bitmap(np.array([], dtype=np.int64))
+        rows = np.searchsorted(self.product_ids, product_ids)
+        rows = np.minimum(rows, len(self.product_ids) - 1)
+        return self._bitmap(rows[self.product_ids[rows] == product_ids])
+
+
+class FacetEngine:
+    """Lazily loaded ``FacetIndex`` refreshed in the background."""
+
+    def __init__(self, rebuild_seconds=60, base_seconds=5, base_bitmaps=256):
+        self.rebuild_seconds = rebuild_seconds
+        self.base_seconds = base_seconds
+        self.base_bitmaps = base_bitmaps
+        self._index = None
+        self._built = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+        # Incremented on every reload, for validators of cached counts
+        self.generation = 0
+
+    def index(self):
+        """Return the facet index; a stale one is served while reloading."""
+        if self._index is None:
+            self.reload()
+        elif time.monotonic() - self._built > self.rebuild_seconds:
+            with self._lock:
+                start = not self._building
+                self._building = True
+            if start:
+                threading.Thread(
+                    target=self._reload_in_background, daemon=True).start()
+        return self._index
+
+    def reload(self):
+        started = time.perf_counter()
+        index = FacetIndex.load()
+        with self._lock:
+            self._index = index
+            self._built = time.monotonic()
+            self.generation += 1
+        logger.info(
+            f"Loaded facets of {len(index.product_ids)} products "
+            f"in {time.perf_counter() - started:.2f}s")
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"Error reloading facet index: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+            connection.close()
+
+    def counts(self, filters, products=None):
+        """Facet counts, restricted to the ``products`` queryset if given."""
+        index = self.index()
+        base = self._base(index, products) if products is not None else None
+        return index.counts(filters, base)
+
+    def _base(self, index, products):
+        """Bitmap of a queryset's products, reused for ``base_seconds``."""
+        sql, params = products.order_by().values_list(
+            'pk', flat=True).query.sql_with_params()
+        key = (sql, repr(params))
+        now = time.monotonic()
+        with self._lock:
+            cached = index.bases.get(key)
+        if cached is not None and now - cached[0] < self.base_seconds:
+            return cached[1]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT string_agg(id::text, ',') "
+                f"FROM ({sql}) AS products (id)", params)
+            ids = cursor.fetchone()[0]
+        bitmap = index.bitmap_of(
+            np.fromstring(ids, dtype=np.int64, sep=',') if ids
+            else np.array([], dtype=np.int64))
+        if self.base_seconds:
+            with self._lock:
+                if len(index.bases) >= self.base_bitmaps:
+                    index.bases = {
+                        other: entry for other, entry in index.bases.items()
+                        if now - entry[0] < self.base_seconds}
+                if len(index.bases) < self.base_bitmaps:
+                    index.bases[key] = (now, bitmap)
+        return bitmap
+
+
+# Global instance
+facet_engine = FacetEngine(
+    rebuild_seconds=getattr(settings, 'FACET_INDEX_REBUILD_SECONDS', 60),
+    base_seconds=getattr(settings, 'FACET_BASE_BITMAP_SECONDS', 5),
+)
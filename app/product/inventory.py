@@ -0,0 +1,231 @@
+"""
+Product inventory.
+
+``ProductVariant.stock_quantity`` is the authoritative stock of a variant.
+``Product.stock_quantity`` holds the total of the product's variants
+(products without variants keep their own figure) and ``Product.in_stock``
+whether it is positive; the flag is indexed for list filters and
+recommendation masking.
+
+Stock changes go through ``adjust_stock``, ``change_stock`` and
+``set_stock``, which update variants and their product's total in one
+transaction with relative updates, so concurrent changes never overwrite
+each other. Variants saved
+through the ORM are rolled up by product.signals, and ``reconcile_stock``
+recomputes totals that drifted after bulk writes.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Product, ProductVariant
+
+
+class InsufficientStock(Exception):
+    """A stock change would take a variant below zero."""
+
+    def __init__(self, message, variant_id=None):
+        super().__init__(message)
+        self.variant_id = variant_id
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'product': quote(Product._meta.db_table),
+        'variant': quote(ProductVariant._meta.db_table),
+    }
+
+
+def adjust_stock(variant_id, delta):
+    """Add ``delta`` (negative to take stock) to a variant's stock.
+
+    The product total, in-stock flag and version follow in the same
+    statement. Returns the new stock of the variant; raises
+    InsufficientStock, changing nothing, if it would be negative.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            WITH variant AS (
+                UPDATE {variant}
+                SET stock_quantity = stock_quantity + %(delta)s,
+                    updated_at = now()
+                WHERE id = %(variant_id)s
+                    AND stock_quantity + %(delta)s >= 0
+                RETURNING product_id, stock_quantity
+            ), product AS (
+                UPDATE {product} product
+                SET stock_quantity = GREATEST(
+                        product.stock_quantity + %(delta)s, 0),
+                    in_stock = product.stock_quantity + %(delta)s > 0,
+                    version = product.version + 1,
+                    updated_at = now()
+                FROM variant
+                WHERE product.id = variant.product_id
+            )
+            SELECT stock_quantity FROM variant
+        """.format(**_tables()), {'variant_id': variant_id, 'delta': delta})
+        row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+    if not ProductVariant.objects.filter(pk=variant_id).exists():
+        raise ProductVariant.DoesNotExist(f"No variant {variant_id}")
+    raise InsufficientStock(
+        f"Variant {variant_id} has less than {-delta} in stock", variant_id)
+
+
+def change_stock(deltas):
+    """Apply ``{variant_id: delta}`` to several variants, all or nothing.
+
+    The variants, then their products, are locked in ID order, like
+    ``adjust_stock`` locks them, so concurrent changes of overlapping
+    variants wait for each other instead of deadlocking. Variants are
+    changed with one conditional update that refuses to go below zero,
+    and product totals with one more, whatever the number of variants.
+    Raises InsufficientStock, changing nothing, if a variant lacks stock;
+    returns the new stock per variant.
+    """
+    if not deltas:
+        return {}
+    tables = _tables()
+    variant_ids = sorted(deltas)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT id, product_id FROM {variant}
+            WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+        """.format(**tables), [variant_ids])
+        products = dict(cursor.fetchall())
+        for variant_id in variant_ids:
+            if variant_id not in products:
+                raise ProductVariant.DoesNotExist(f"No variant {variant_id}")
+
+        cursor.execute("""
+            UPDATE {variant} variant
+            SET stock_quantity = variant.stock_quantity + change.delta,
+                updated_at = now()
+            FROM unnest(%s::bigint[], %s::integer[]) AS change(id, delta)
+            WHERE variant.id = change.id
+                AND variant.stock_quantity + change.delta >= 0
+            RETURNING variant.id, variant.stock_quantity
+        """.format(**tables), [
+            variant_ids, [deltas[pk] for pk in variant_ids]])
+        stock = dict(cursor.fetchall())
+        for variant_id in variant_ids:
+            if variant_id not in stock:
+                raise InsufficientStock(
+                    f"Variant {variant_id} has less than "
+                    f"{-deltas[variant_id]} in stock", variant_id)
+
+        totals = {}
+        for variant_id in variant_ids:
+            product_id = products[variant_id]
+            totals[product_id] = totals.get(product_id, 0) + deltas[variant_id]
+        product_ids = sorted(totals)
+        cursor.execute("""
+            SELECT id FROM {product}
+            WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+        """.format(**tables), [product_ids])
+        cursor.execute("""
+            UPDATE {product} product
+            SET stock_quantity = GREATEST(
+                    product.stock_quantity + change.delta, 0),
+                in_stock = product.stock_quantity + change.delta > 0,
+                version = product.version + 1,
+                updated_at = now()
+            FROM unnest(%s::bigint[], %s::integer[]) AS change(id, delta)
+            WHERE product.id = change.id
+        """.format(**tables), [
+            product_ids, [totals[pk] for pk in product_ids]])
+    return stock
+
+
+def set_stock(variant_id, quantity):
+    """Set a variant's stock, e.g. after a stock count."""
+    if quantity < 0:
+        raise InsufficientStock("Stock cannot be negative")
+    with transaction.atomic():
+        current = ProductVariant.objects.select_for_update().values_list(
+            'stock_quantity', flat=True).get(pk=variant_id)
+        return adjust_stock(variant_id, quantity - current)
+
+
+def _reconcile(condition, params):
+    """Fix the totals and flags of products matching a SQL condition.
+
+    Only drifted products are written (and get a new version). Returns
+    their number.
+    """
+    tables = _tables()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE {product} product
+            SET stock_quantity = totals.total,
+                in_stock = totals.total > 0,
+                version = product.version + 1,
+                updated_at = now()
+            FROM (
+                SELECT product_id, SUM(stock_quantity) AS total
+                FROM {variant}
+                WHERE {condition}
+                GROUP BY product_id
+            ) totals
+            WHERE product.id = totals.product_id
+                AND (product.stock_quantity <> totals.total
+                     OR product.in_stock <> (totals.total > 0))
+        """.format(condition=condition.format(id='product_id'), **tables),
+            params)
+        fixed = cursor.rowcount
+        # Products without variants keep their stock; fix their flag.
+        cursor.execute("""
+            UPDATE {product} product
+            SET in_stock = stock_quantity > 0,
+                version = version + 1,
+                updated_at = now()
+            WHERE {condition}
+                AND in_stock <> (stock_quantity > 0)
+                AND NOT EXISTS (
+                    SELECT 1 FROM {variant} variant
+                    WHERE variant.product_id = product.id)
+        """.format(condition=condition.format(id='id'), **tables), params)
+        return fixed + cursor.rowcount
+
+
+def update_stock_totals(product_ids):
+    """Roll the variant stock of products up to their totals."""
+    return _reconcile("{id} = ANY(%s)", [list(product_ids)])
+
+
+def clear_stock_totals(product_ids):
+    """Zero the totals of products whose last variant was deleted.
+
+    Products that never had variants cannot be told apart, so only the
+    callers deleting variants use this. Returns the number changed.
+    """
+    return Product.objects.filter(
+        pk__in=product_ids, variants__isnull=True,
+    ).exclude(
+        stock_quantity=0, in_stock=False,
+    ).update(
+        stock_quantity=0,
+        in_stock=False,
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+    )
+
+
+def reconcile_stock(low_id, high_id):
+    """Fix the stock totals of products with IDs in [low_id, high_id]."""
+    return _reconcile("{id} BETWEEN %s AND %s", [low_id, high_id])
+
+
+def in_stock_ids(product_ids):
+    """The in-stock products among ``product_ids``, in the same order."""
+    available = set(Product.objects.filter(
+        pk__in=product_ids, in_stock=True).values_list('id', flat=True))
+    return [pk for pk in product_ids if pk in available]
+
+
+def split_stock(total, parts):
+    """Spread a stock figure over ``parts`` variants as evenly as possible."""
+    share, extra = divmod(total, parts)
+    return [share + (i < extra) for i in range(parts)]
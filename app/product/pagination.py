@@ -0,0 +1,303 @@
+"""
+Keyset pagination for the product catalog.
+
+Pages are selected with a row comparison on the sort column and the
+product ID, ``(min_price, id) > (%s, %s)``, which walks a composite index
+instead of counting and skipping rows, so deep pages cost the same as the
+first one. Cursors are opaque base64 tokens holding the sort key of the
+last (or first) row of a page.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def approximate_count(queryset):
+    """Estimate the number of rows of a queryset without counting them.
+
+    An unfiltered table uses the planner statistics in ``pg_class``, a
+    filtered queryset the row estimate of its query plan.
+    """
+    model = queryset.model
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table])
+            row = cursor.fetchone()
+            return max(row[0], 0) if row else 0
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over ``(sort field, id)`` keys.
+
+    Subclasses define ``orderings`` mapping an ``ordering`` query value to
+    ``(field, descending)``; ties are broken by the primary key in the
+    same direction. ``?include_total=true`` adds an approximate count.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    total_query_param = 'include_total'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    orderings = {'newest': ('id', True)}
+    default_ordering = 'newest'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset)
+        field, descending = self.orderings[self.ordering]
+        cursor = self.decode_cursor(request)
+        backwards = cursor is not None and cursor['previous']
+
+        self.total = None
+        if request.query_params.get(self.total_query_param) in (
+                '1', 'true'):
+            self.total = approximate_count(queryset)
+
+        # Walk the index backwards to fetch the page before a cursor.
+        reverse = descending != backwards
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.after(queryset, field, cursor['key'], reverse))
+        queryset = queryset.order_by(*(
+            f"-{name}" if reverse else name
+            for name in self.key_fields(field)))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    @staticmethod
+    def key_fields(field):
+        """Fields of the sort key: the sort field, then the ID."""
+        return list(dict.fromkeys((field, 'id')))
+
+    def after(self, queryset, field, key, reverse):
+        """Condition selecting the rows after ``key`` in sort order."""
+        names = self.key_fields(field)
+        if len(key) != len(names):
+            raise NotFound(self.invalid_cursor_message)
+        if field in queryset.query.annotations:
+            return self.after_annotation(field, key, reverse)
+
+        opts = queryset.model._meta
+        quote = connection.ops.quote_name
+        fields = [opts.get_field(name) for name in names]
+        try:
+            values = [f.to_python(value) for f, value in zip(fields, key)]
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        columns = ', '.join(
+            f"{quote(opts.db_table)}.{quote(f.column)}" for f in fields)
+        placeholders = ', '.join(['%s'] * len(values))
+        return RawSQL(
+            f"({columns}) {'<' if reverse else '>'} ({placeholders})",
+            values,
+            output_field=BooleanField())
+
+    def after_annotation(self, field, key, reverse):
+        """Like ``after`` for a computed (float) sort key."""
+        try:
+            value, pk = float(key[0]), int(key[1])
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        lookup = 'lt' if reverse else 'gt'
+        return Q(**{f"{field}__{lookup}": value}) | Q(
+            **{field: value, f"pk__{lookup}": pk})
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset):
+        ordering = request.query_params.get(
+            self.ordering_query_param, self.default_ordering)
+        if ordering not in self.available_orderings(queryset):
+            raise ValidationError({
+                self.ordering_query_param:
+                    "Must be one of "
+                    f"{list(self.available_orderings(queryset))}"})
+        return ordering
+
+    def available_orderings(self, queryset):
+        """Orderings whose sort field is a column or annotation."""
+        return [
+            name for name, (field, _) in self.orderings.items()
+            if field in queryset.query.annotations
+            or field in self.model_fields(queryset)
+        ]
+
+    @staticmethod
+    def model_fields(queryset):
+        return {f.name for f in queryset.model._meta.concrete_fields}
+
+    def decode_cursor(self, request):
+        """Return ``{'key', 'previous'}`` of the cursor, or None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if data['o'] != self.ordering or not isinstance(data['k'], list):
+                raise ValueError('Cursor of another ordering')
+            return {'key': data['k'], 'previous': bool(data.get('p'))}
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_token(self, ordering, row, previous=False):
+        """Opaque cursor positioned on ``row`` in the given ordering."""
+        field, _ = self.orderings[ordering]
+        data = {
+            'o': ordering,
+            'k': [str(_value(row, name)) for name in self.key_fields(field)],
+        }
+        if previous:
+            data['p'] = 1
+        return urlsafe_b64encode(json.dumps(
+            data, separators=(',', ':')).encode('ascii')).decode('ascii')
+
+    def encode_cursor(self, row, previous=False):
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.cursor_token(self.ordering, row, previous))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], previous=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            response['approximate_count'] = self.total
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+                'approximate_count': {
+                    'type': 'integer',
+                    'description': 'Only with include_total=true',
+                },
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.ordering_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Sort order of the results.',
+                'schema': {
+                    'type': 'string',
+                    'enum': list(self.orderings),
+                    'default': self.default_ordering,
+                },
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.total_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Add an approximate total count.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+
+class ProductCursorPagination(KeysetPagination):
+    """Keyset pagination of the product catalog.
+
+    Search results (annotated with ``search_rank``) default to relevance.
+    """
+    orderings = {
+        'relevance': ('search_rank', True),
+        'newest': ('id', True),
+        'price': ('min_price', False),
+        '-price': ('min_price', True),
+        'rating': ('average_rating', True),
+        'reviews': ('review_count', True),
+    }
+
+    def get_ordering(self, request, queryset):
+        if self.ordering_query_param not in request.query_params \
+                and 'search_rank' in queryset.query.annotations:
+            return 'relevance'
+        return super().get_ordering(request, queryset)
@@ -0,0 +1,75 @@
+"""
+Full-text product search.
+
+Each product stores a weighted ``tsvector`` of its name (A), material,
+style and category names (B) and description (C) in
+``Product.search_vector``, refreshed by product.signals and indexed with
+GIN. Queries use websearch syntax (quoted phrases, ``or``, ``-word``) and
+are ranked by text relevance boosted by review count and rating.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import (
+    F,
+    FloatField,
+    OuterRef,
+    QuerySet,
+    Subquery,
+)
+from django.db.models.functions import Cast, Ln
+
+from core.models import Category, Product
+
+
+SEARCH_CONFIG = 'english'
+
+# Relevance is multiplied by (1 + weight * signal) for each signal.
+REVIEW_COUNT_WEIGHT = 0.1
+RATING_WEIGHT = 0.1
+
+# Product fields in the search document; saving any of them refreshes it.
+SEARCH_FIELDS = ('name', 'description', 'material', 'style')
+
+
+def search_vector():
+    """Expression building the search document of a product row."""
+    category_names = Category.objects.filter(
+        products=OuterRef('pk'),
+    ).order_by().values('products').annotate(
+        names=StringAgg('name', ' '),
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('material', 'style', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(category_names), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(products):
+    """Refresh the search document of products in one UPDATE.
+
+    ``products`` is a product ID, a list of IDs or a Product queryset.
+    """
+    if isinstance(products, int):
+        products = [products]
+    if not isinstance(products, QuerySet):
+        products = Product.objects.filter(pk__in=products)
+    return products.update(search_vector=search_vector())
+
+
+def search_products(queryset, text):
+    """Filter products matching ``text``, annotated with ``search_rank``."""
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    relevance = SearchRank(F('search_vector'), query)
+    popularity = 1 + REVIEW_COUNT_WEIGHT * Ln(
+        Cast(F('review_count'), FloatField()) + 1)
+    rating = 1 + RATING_WEIGHT * Cast(F('average_rating'), FloatField())
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=Cast(relevance, FloatField()) * popularity * rating,
+    )
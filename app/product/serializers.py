@@ -4,6 +4,7 @@ Serializers for Product API.
 from rest_framework import serializers
 from typing import List
 
+from core.fieldsets import SparseFieldsMixin
 from core.models import (
     ProductVariant,
     ProductDetailInformation,
@@ -30,8 +31,9 @@ class CategorySerializer(serializers.ModelSerializer):
             'name',
             'parent_category',
             'description',
+            'product_count',
         ]
-        read_only_fields = ('id',)
+        read_only_fields = ('id', 'product_count')
 
 
 class ProductVariantSerializer(serializers.ModelSerializer):
@@ -111,12 +113,28 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ProductGenericSerializer(serializers.ModelSerializer):
+class ProductGenericSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     """Serializer for general product information."""
     images = ProductImageSerializer(many=True)
-    original_price = serializers.SerializerMethodField()
-    sale_price = serializers.SerializerMethodField()
+    original_price = serializers.DecimalField(
+        source='min_price',
+        max_digits=100,
+        decimal_places=2,
+        coerce_to_string=False,
+        read_only=True,
+    )
+    sale_price = serializers.DecimalField(
+        source='min_price_sale_price',
+        max_digits=100,
+        decimal_places=2,
+        coerce_to_string=False,
+        read_only=True,
+    )
+    thumbnail = serializers.CharField(
+        source='primary_image_url',
+        read_only=True,
+    )
 
     class Meta:
         model = Product
@@ -124,29 +142,25 @@ class ProductGenericSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'images',
+            'thumbnail',
             'average_rating',
             'review_count',
             'price',
             'original_price',
-            'sale_price'
+            'sale_price',
+            'min_sale_price',
+            'max_sale_price',
+            'in_stock',
         ]
+        read_only_fields = ('min_sale_price', 'max_sale_price', 'in_stock')
 
-    def get_original_price(self, obj) -> float:
-        """Get original price of the product."""
-        if not obj.product_details.exists():
-            return 0.0
+    collapsed_fields = {
+        'images': serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+    }
 
-        return obj.product_details.order_by('price').first().price
 
-    def get_sale_price(self, obj) -> float:
-        """Get sale price of the product."""
-        if not obj.product_details.exists():
-            return 0.0
-
-        return obj.product_details.order_by('price').first().sale_price
-
-
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for product."""
     product_details = ProductDetailSerializer(many=True)
     detail_information = ProductDetailInformationSerializer(
@@ -175,6 +189,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'weight',
             'weight_unit',
             'stock_quantity',
+            'in_stock',
             'node_name',
             'product_details',
             'style',
@@ -187,6 +202,21 @@ class ProductSerializer(serializers.ModelSerializer):
 
         read_only_fields = ('id',)
 
+    collapsed_fields = {
+        'images': serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'product_details': serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'detail_information': serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+    }
+    column_sources = {
+        'sale_price': ['min_price_sale_price'],
+        'colors': ['variants'],
+        'sizes': ['variants'],
+        'categories': ['category'],
+    }
+
     def get_colors(self, obj) -> List[str]:
         variants = obj.variants.all()
         colors = [variant.color for variant in variants if variant.color]
@@ -201,7 +231,4 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_sale_price(self, obj) -> float:
         """Get sale price of the product."""
-        if not obj.product_details.exists():
-            return 0.0
-
-        return obj.product_details.order_by('price').first().sale_price
+        return obj.min_price_sale_price
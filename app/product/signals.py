@@ -1,7 +1,47 @@
-from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
-from django.db.models import Avg, Count
-from core.models import Review
+from django.db.models import (
+    Avg,
+    Count,
+    DecimalField,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    QuerySet,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from core.models import (
+    Category,
+    Product,
+    ProductDetail,
+    ProductDetailInformation,
+    ProductImage,
+    ProductVariant,
+    Review,
+)
+from product.cache import bump_versions
+from product.categories import (
+    ancestor_ids,
+    attach,
+    in_subtree,
+    subtree_ids,
+    update_product_counts,
+)
+from product.facets import FACET_FIELDS, refresh_product_facets
+from product.inventory import clear_stock_totals, update_stock_totals
+from product.search import SEARCH_FIELDS, update_search_vector
 
 
 def update_product_stats(product):
@@ -12,7 +52,48 @@ def update_product_stats(product):
     )
     product.review_count = stats['count']
     product.average_rating = round(stats['avg_rating'] or 0.0, 2)
-    product.save()
+    product.save(update_fields=['review_count', 'average_rating'])
+
+
+def _deleting_product(origin):
+    """Whether a deletion cascades from products being deleted."""
+    return isinstance(origin, Product) or (
+        isinstance(origin, QuerySet) and origin.model is Product)
+
+
+def update_product_summary(products):
+    """Recompute the price and image summary of products in one UPDATE.
+
+    ``products`` is a product ID, a list of IDs or a Product queryset.
+    """
+    if isinstance(products, int):
+        products = [products]
+    if not isinstance(products, QuerySet):
+        products = Product.objects.filter(pk__in=products)
+
+    details = ProductDetail.objects.filter(
+        product=OuterRef('pk')).order_by()
+    cheapest = details.order_by(F('price').asc(nulls_last=True), 'id')
+    image = ProductImage.objects.filter(
+        product=OuterRef('pk')).order_by('-is_primary', 'id')
+    zero = Value(
+        Decimal('0.00'),
+        output_field=DecimalField(max_digits=100, decimal_places=2))
+
+    def sale_price(aggregate):
+        return Subquery(
+            details.values('product').annotate(
+                value=aggregate('sale_price')).values('value'))
+
+    return products.update(
+        min_price=Coalesce(Subquery(cheapest.values('price')[:1]), zero),
+        min_price_sale_price=Coalesce(
+            Subquery(cheapest.values('sale_price')[:1]), zero),
+        min_sale_price=Coalesce(sale_price(Min), zero),
+        max_sale_price=Coalesce(sale_price(Max), zero),
+        primary_image_url=Coalesce(
+            Subquery(image.values('url')[:1]), Value('')),
+    )
 
 
 @receiver(post_save, sender=Review)
@@ -25,3 +106,183 @@ def update_product_review_stats(sender, instance, created, **kwargs):
 def update_product_review_stats_on_delete(sender, instance, **kwargs):
     """Update product's stats after a review is deleted."""
     update_product_stats(instance.product)
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def update_product_summary_on_change(sender, instance, **kwargs):
+    """Update product's price and image summary after a change."""
+    if _deleting_product(kwargs.get('origin')):
+        return
+    update_product_summary(instance.product_id)
+    if sender is ProductDetail:
+        refresh_product_facets([instance.product_id])
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductDetailInformation)
+@receiver(post_delete, sender=ProductDetailInformation)
+def bump_product_version_on_change(sender, instance, **kwargs):
+    """Invalidate the cached detail of a product after a change."""
+    if not _deleting_product(kwargs.get('origin')):
+        bump_versions([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def bump_product_version(sender, instance, created, **kwargs):
+    """Invalidate the cached detail of a changed product."""
+    if not created:
+        bump_versions([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_product_facets_on_variant(sender, instance, **kwargs):
+    """Update product's colors and sizes after a variant change."""
+    if not _deleting_product(kwargs.get('origin')):
+        refresh_product_facets([instance.product_id])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_product_stock_on_variant(sender, instance, **kwargs):
+    """Roll a changed variant's stock up to its product."""
+    if not _deleting_product(kwargs.get('origin')):
+        update_stock_totals([instance.product_id])
+        if kwargs['signal'] is post_delete:
+            clear_stock_totals([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def update_product_facets(sender, instance, update_fields, **kwargs):
+    """Update product's facet values after its fields changed."""
+    if update_fields is None or set(update_fields) & set(FACET_FIELDS):
+        refresh_product_facets([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, update_fields, **kwargs):
+    """Update product's search document after its text changed."""
+    if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        update_search_vector(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def update_search_vector_on_categories(
+        sender, instance, action, reverse, pk_set, **kwargs):
+    """Update search documents and facets after products change category."""
+    if reverse and action == 'pre_clear':
+        # Remember the products that are about to lose this category.
+        instance._cleared_product_ids = list(
+            instance.products.values_list('pk', flat=True))
+        return
+    elif action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    elif not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = instance.__dict__.pop('_cleared_product_ids')
+    else:
+        product_ids = list(pk_set)
+    update_search_vector(product_ids)
+    refresh_product_facets(product_ids)
+
+
+@receiver(post_save, sender=Category)
+def update_search_vector_on_category(sender, instance, created, **kwargs):
+    """Update search documents of a renamed category's products."""
+    if not created:
+        update_search_vector(Product.objects.filter(category=instance))
+
+
+@receiver(post_init, sender=Category)
+def remember_category_parent(sender, instance, **kwargs):
+    """Keep the loaded parent to detect moves on save."""
+    instance._loaded_parent_id = instance.parent_category_id
+
+
+@receiver(pre_save, sender=Category)
+def check_category_move(sender, instance, **kwargs):
+    """Refuse to move a category below one of its own subcategories."""
+    parent_id = instance.parent_category_id
+    if instance.pk and parent_id is not None \
+            and parent_id != instance._loaded_parent_id \
+            and parent_id in subtree_ids(instance.pk):
+        raise ValueError(
+            "A category cannot be moved below its own subcategory.")
+
+
+@receiver(post_save, sender=Category)
+def update_category_closure(sender, instance, created, **kwargs):
+    """Link a new or moved category into the category tree."""
+    if not created and \
+            instance.parent_category_id == instance._loaded_parent_id:
+        return
+    old_ancestors = [] if created else ancestor_ids([instance.pk])
+    attach(instance, created)
+    if not created:
+        update_product_counts(
+            set(old_ancestors) | set(ancestor_ids([instance.pk])))
+        refresh_product_facets(Product.objects.filter(
+            in_subtree(instance.pk)).values_list('pk', flat=True))
+    instance._loaded_parent_id = instance.parent_category_id
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def update_category_counts_on_products(
+        sender, instance, action, reverse, pk_set, **kwargs):
+    """Recount the categories whose products changed."""
+    if not reverse and action == 'pre_clear':
+        # Remember the categories that are about to lose this product.
+        instance._cleared_category_ids = list(
+            instance.category.values_list('pk', flat=True))
+    elif action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    elif reverse:
+        update_product_counts(ancestor_ids([instance.pk]))
+    elif action == 'post_clear':
+        update_product_counts(ancestor_ids(
+            instance.__dict__.pop('_cleared_category_ids')))
+    else:
+        update_product_counts(ancestor_ids(pk_set))
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_categories(sender, instance, **kwargs):
+    """Keep the categories of a product that is being deleted."""
+    instance._deleted_category_ids = list(
+        instance.category.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    """Recount the categories of a deleted product."""
+    category_ids = instance.__dict__.pop('_deleted_category_ids', [])
+    if category_ids:
+        update_product_counts(ancestor_ids(category_ids))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_ancestors(sender, instance, **kwargs):
+    """Keep the ancestors and products of a category being deleted."""
+    instance._deleted_ancestor_ids = ancestor_ids([instance.pk])
+    instance._deleted_product_ids = list(Product.objects.filter(
+        in_subtree(instance.pk)).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def update_category_counts_on_category_delete(sender, instance, **kwargs):
+    """Recount the ancestors and refresh the products of a category."""
+    category_ids = instance.__dict__.pop('_deleted_ancestor_ids', [])
+    if category_ids:
+        update_product_counts(category_ids)
+    product_ids = instance.__dict__.pop('_deleted_product_ids', [])
+    if product_ids:
+        refresh_product_facets(product_ids)
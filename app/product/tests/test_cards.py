@@ -0,0 +1,99 @@
+"""
+Tests for the product card store.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Cart,
+    CartItem,
+    Product,
+    ProductDetail,
+    ProductImage,
+    UserWatchedProduct,
+)
+from product.cards import get_product_cards, product_cards
+
+
+CART_URL = reverse('cart:cart-item-list')
+WATCHED_URL = reverse('watched_list:user-watched-product-list')
+
+
+def create_products(count):
+    products = []
+    for i in range(count):
+        product = Product.objects.create(name=f'Card {i}')
+        ProductDetail.objects.create(product=product, price=10, sale_price=8)
+        ProductImage.objects.create(
+            product=product, url=f'https://example.com/{i}.jpg')
+        products.append(product)
+    return products
+
+
+class ProductCardTests(TestCase):
+    """Test cards are shared, fetched in bulk and follow changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cards_follow_product_version(self):
+        """Test cached cards are served until the product changes."""
+        product, = create_products(1)
+        card = get_product_cards([product.id])[product.id]
+        self.assertEqual(card['thumbnail'], 'https://example.com/0.jpg')
+
+        with self.assertNumQueries(1):
+            get_product_cards([product.id, 0])
+
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(
+            get_product_cards([product.id])[product.id]['name'], 'Renamed')
+        product.refresh_from_db()
+        self.assertEqual(product_cards([product])[0]['name'], 'Renamed')
+
+    def test_cart_queries_constant(self):
+        """Test a cart lists its products' cards with a fixed query count."""
+        cart = Cart.objects.get(user=self.user)
+        for product in create_products(3):
+            CartItem.objects.create(
+                cart=cart, product_detail=product.product_details.first())
+        self.client.get(CART_URL)
+        with self.assertNumQueries(6):
+            self.client.get(CART_URL)
+
+        for product in create_products(6):
+            CartItem.objects.create(
+                cart=cart, product_detail=product.product_details.first())
+        self.client.get(CART_URL)
+        with self.assertNumQueries(6):
+            res = self.client.get(CART_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        product_ids = {
+            item['generic_product_info']['id']
+            for item in res.data['results']
+        }
+        self.assertEqual(len(product_ids), 9)
+
+    def test_watched_list_uses_cards(self):
+        """Test watched products are shown with their cards."""
+        products = create_products(4)
+        for product in products:
+            UserWatchedProduct.objects.create(user=self.user, product=product)
+
+        res = self.client.get(WATCHED_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {item['shown_product']['id'] for item in res.data['results']},
+            {product.id for product in products})
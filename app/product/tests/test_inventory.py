@@ -0,0 +1,191 @@
+"""
+Tests for the product inventory.
+"""
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Product, ProductVariant
+from product.inventory import (
+    InsufficientStock,
+    adjust_stock,
+    in_stock_ids,
+    set_stock,
+    split_stock,
+)
+from recommendation.services import RecommendationService
+
+
+PRODUCTS_URL = reverse('product:product-generic-list')
+
+
+class InventoryTests(TestCase):
+    """Test variant stock changes roll up to products."""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Tee')
+        self.red = ProductVariant.objects.create(
+            product=self.product, color='Red', stock_quantity=2)
+        self.blue = ProductVariant.objects.create(
+            product=self.product, color='Blue', stock_quantity=3)
+
+    def stock(self):
+        return Product.objects.values_list(
+            'stock_quantity', 'in_stock').get(pk=self.product.pk)
+
+    def test_variants_roll_up(self):
+        """Test saved variants give the product total and flag."""
+        self.assertEqual(self.stock(), (5, True))
+
+        self.red.delete()
+        self.blue.stock_quantity = 0
+        self.blue.save()
+
+        self.assertEqual(self.stock(), (0, False))
+
+    def test_outdated_product_keeps_total(self):
+        """Test saving a product loaded before a variant change."""
+        stale = Product.objects.create(name='Cap')
+        ProductVariant.objects.create(product=stale, stock_quantity=5)
+
+        stale.name = 'Blue cap'
+        stale.save()
+
+        self.assertEqual(
+            Product.objects.values_list('stock_quantity', 'in_stock').get(
+                pk=stale.pk), (5, True))
+
+    def test_stock_of_product_with_variants_is_refused(self):
+        """Test setting the total of a product with variants fails."""
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock_quantity = 50
+
+        with self.assertRaises(ValidationError) as raised:
+            product.full_clean()
+        self.assertIn('stock_quantity', raised.exception.message_dict)
+        with self.assertRaises(ValueError):
+            product.save()
+        self.assertEqual(self.stock(), (5, True))
+
+    def test_save_without_stock_edit_checks_no_variants(self):
+        """Test a plain save does not look the variants up."""
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = 'Shirt'
+
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query['sql'].startswith(
+                'SELECT 1 AS "a" FROM "core_productvariant"')])
+
+        mug = Product.objects.create(name='Mug', stock_quantity=4)
+        mug.stock_quantity = 0
+        mug.save()
+        self.assertFalse(Product.objects.get(pk=mug.pk).in_stock)
+
+    def test_last_variant_deleted(self):
+        """Test a product without variants left has no stock."""
+        self.red.delete()
+        self.assertEqual(self.stock(), (3, True))
+
+        self.blue.delete()
+
+        self.assertEqual(self.stock(), (0, False))
+
+    def test_adjust_stock(self):
+        """Test relative changes update the variant and the total."""
+        version = Product.objects.get(pk=self.product.pk).version
+
+        self.assertEqual(adjust_stock(self.red.pk, -2), 0)
+        self.assertEqual(adjust_stock(self.blue.pk, 4), 7)
+
+        self.assertEqual(self.stock(), (7, True))
+        self.assertEqual(
+            Product.objects.get(pk=self.product.pk).version, version + 2)
+        self.assertEqual(adjust_stock(self.blue.pk, -7), 0)
+        self.assertEqual(self.stock(), (0, False))
+
+    def test_insufficient_stock(self):
+        """Test taking more than the stock changes nothing."""
+        with self.assertRaises(InsufficientStock):
+            adjust_stock(self.red.pk, -3)
+        with self.assertRaises(ProductVariant.DoesNotExist):
+            adjust_stock(0, 1)
+
+        self.red.refresh_from_db()
+        self.assertEqual(self.red.stock_quantity, 2)
+        self.assertEqual(self.stock(), (5, True))
+
+    def test_set_stock(self):
+        """Test setting a counted stock keeps the total consistent."""
+        set_stock(self.red.pk, 10)
+
+        self.assertEqual(self.stock(), (13, True))
+
+    def test_product_without_variants(self):
+        """Test products without variants keep their own stock."""
+        product = Product.objects.create(name='Mug', stock_quantity=4)
+        self.assertTrue(product.in_stock)
+
+        product.stock_quantity = 0
+        product.save(update_fields=['stock_quantity'])
+
+        self.assertFalse(Product.objects.get(pk=product.pk).in_stock)
+
+    def test_reconcile_command(self):
+        """Test drifted totals and flags are fixed in batches."""
+        mug = Product.objects.create(name='Mug', stock_quantity=4)
+        Product.objects.filter(pk=self.product.pk).update(
+            stock_quantity=1, in_stock=False)
+        Product.objects.filter(pk=mug.pk).update(in_stock=False)
+        out = StringIO()
+
+        call_command(
+            'reconcile_inventory', batch_size=1, workers=1, stdout=out)
+
+        self.assertIn('Fixed the stock of 2 products', out.getvalue())
+        self.assertEqual(self.stock(), (5, True))
+        self.assertTrue(Product.objects.get(pk=mug.pk).in_stock)
+
+    def test_split_stock(self):
+        """Test a quantity is spread evenly over variants."""
+        self.assertEqual(split_stock(7, 3), [3, 2, 2])
+        self.assertEqual(sum(split_stock(5, 10)), 5)
+
+    def test_list_filter(self):
+        """Test the product list filters in-stock products."""
+        sold_out = Product.objects.create(name='Cap')
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+
+        res = client.get(PRODUCTS_URL, {'in_stock': 'true'})
+
+        ids = [card['id'] for card in res.data['results']]
+        self.assertEqual(ids, [self.product.pk])
+        self.assertTrue(res.data['results'][0]['in_stock'])
+        self.assertNotIn(sold_out.pk, ids)
+
+    def test_recommendations_masked(self):
+        """Test out-of-stock products are masked out of recommendations."""
+        sold_out = Product.objects.create(name='Cap')
+        self.assertEqual(
+            in_stock_ids([sold_out.pk, self.product.pk]), [self.product.pk])
+
+        service = RecommendationService(
+            model_dir=tempfile.gettempdir(), in_stock_only=True)
+        service.recommend_ids = lambda user_id, top_n: [
+            sold_out.pk, self.product.pk][:top_n]
+
+        self.assertEqual(
+            service.get_user_recomm_ids('1', top_n=1), [self.product.pk])
@@ -0,0 +1,829 @@
+"""
+Tests for product API endpoints.
+"""
+import json
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Category,
+    CategoryClosure,
+    Product,
+    ProductDetail,
+    ProductFacet,
+    ProductImage,
+    ProductVariant,
+)
+from core.metrics import metrics
+from product.facets import FacetEngine, FacetIndex, facet_engine
+from product.autocomplete import (
+    Autocomplete,
+    PrefixIndex,
+    autocomplete,
+    trigram_available,
+)
+
+
+PRODUCTS_URL = reverse('product:product-generic-list')
+AUTOCOMPLETE_URL = reverse('product:product-generic-autocomplete')
+BATCH_URL = reverse('product:product-generic-batch')
+CATEGORIES_URL = reverse('product:category-list')
+
+
+def detail_url(product_id):
+    return reverse('product:product-generic-detail', args=[product_id])
+
+
+def create_product(name='Product', prices=((10, 8), (5, 4)), images=1):
+    """Create a product with details given as (price, sale_price)."""
+    product = Product.objects.create(name=name)
+    for price, sale_price in prices:
+        ProductDetail.objects.create(
+            product=product, price=price, sale_price=sale_price)
+    for i in range(images):
+        ProductImage.objects.create(
+            product=product, url=f'https://example.com/{name}/{i}.jpg')
+    product.refresh_from_db()
+    return product
+
+
+class ProductSummaryTests(TestCase):
+    """Test the denormalized price and image summary."""
+
+    def test_summary_follows_details_and_images(self):
+        """Test the summary is updated on detail and image writes."""
+        product = create_product(prices=((10, 8), (5, 4), (20, 3)))
+
+        self.assertEqual(product.min_price, Decimal('5'))
+        self.assertEqual(product.min_price_sale_price, Decimal('4'))
+        self.assertEqual(product.min_sale_price, Decimal('3'))
+        self.assertEqual(product.max_sale_price, Decimal('8'))
+        self.assertEqual(
+            product.primary_image_url, 'https://example.com/Product/0.jpg')
+
+        ProductImage.objects.create(
+            product=product, url='https://example.com/main.jpg',
+            is_primary=True)
+        product.product_details.filter(price=5).delete()
+        product.refresh_from_db()
+
+        self.assertEqual(product.min_price, Decimal('10'))
+        self.assertEqual(product.min_price_sale_price, Decimal('8'))
+        self.assertEqual(
+            product.primary_image_url, 'https://example.com/main.jpg')
+
+    def test_backfill_command(self):
+        """Test the backfill recomputes summaries of imported products."""
+        product = create_product()
+        Product.objects.update(min_price=0, primary_image_url='')
+
+        call_command('backfill_product_summary', stdout=StringIO())
+
+        product.refresh_from_db()
+        self.assertEqual(product.min_price, Decimal('5'))
+        self.assertTrue(product.primary_image_url)
+
+    def test_outdated_instance_keeps_summary(self):
+        """Test saving a product loaded before a detail change."""
+        stale = Product.objects.create(name='Stale')
+        ProductDetail.objects.create(product=stale, price=10, sale_price=8)
+        ProductImage.objects.create(
+            product=stale, url='https://example.com/stale.jpg')
+
+        stale.name = 'Renamed'
+        stale.save()
+
+        product = Product.objects.get(pk=stale.pk)
+        self.assertEqual(product.name, 'Renamed')
+        self.assertEqual(product.min_price, Decimal('10'))
+        self.assertEqual(product.max_sale_price, Decimal('8'))
+        self.assertEqual(
+            product.primary_image_url, 'https://example.com/stale.jpg')
+
+
+class PrivateProductApiTests(TestCase):
+    """Test the product API for authenticated users."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_list_prices(self):
+        """Test listed products show the cheapest detail's prices."""
+        create_product()
+
+        res = self.client.get(PRODUCTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        item = res.data['results'][0]
+        self.assertEqual(item['original_price'], Decimal('5'))
+        self.assertEqual(item['sale_price'], Decimal('4'))
+        self.assertEqual(
+            item['thumbnail'], 'https://example.com/Product/0.jpg')
+
+    def test_list_query_count_constant(self):
+        """Test the number of queries does not grow with the page size."""
+        for i in range(2):
+            create_product(name=f'P{i}', images=2)
+        facet_engine.reload()
+        cache.clear()
+        with self.assertNumQueries(2):
+            self.client.get(PRODUCTS_URL)
+
+        for i in range(2, 10):
+            create_product(name=f'P{i}', images=2)
+        with self.assertNumQueries(2):
+            res = self.client.get(PRODUCTS_URL)
+        self.assertEqual(len(res.data['results']), 10)
+
+        # Cached cards only need the page query.
+        with self.assertNumQueries(1):
+            self.client.get(PRODUCTS_URL)
+
+    def test_keyset_pages_by_price(self):
+        """Test cursors walk all products in a stable price order."""
+        prices = [3, 1, 2, 1, 3, 2, 1]
+        products = [
+            create_product(name=f'P{i}', prices=((price, price),), images=0)
+            for i, price in enumerate(prices)]
+        expected = [
+            p.id for p in sorted(products, key=lambda p: (p.min_price, p.id))]
+
+        seen, pages = [], []
+        url = f'{PRODUCTS_URL}?ordering=price&page_size=3'
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data)
+            seen.extend(item['id'] for item in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(seen, expected)
+        self.assertIsNone(pages[0]['previous'])
+        res = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], expected[3:6])
+
+    def test_newest_first_with_total(self):
+        """Test the default order is newest first with a total estimate."""
+        products = [create_product(name=f'P{i}') for i in range(3)]
+
+        res = self.client.get(PRODUCTS_URL, {'include_total': 'true'})
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [p.id for p in reversed(products)])
+        self.assertIn('approximate_count', res.data)
+
+    def test_invalid_cursor_and_ordering(self):
+        """Test bad cursors and orderings are rejected."""
+        res = self.client.get(PRODUCTS_URL, {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        res = self.client.get(PRODUCTS_URL, {'ordering': 'name'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_full_text_search(self):
+        """Test search matches any product text, best match first."""
+        shoes = Category.objects.create(name='Shoes')
+        boot = create_product(name='Leather boot', images=0)
+        boot.category.add(shoes)
+        wallet = create_product(name='Wallet', images=0)
+        Product.objects.filter(pk=wallet.pk).update(review_count=0)
+        wallet.description = 'Soft leather wallet'
+        wallet.save()
+        create_product(name='Cotton shirt', images=0)
+
+        res = self.client.get(PRODUCTS_URL, {'search': 'leather'})
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [boot.id, wallet.id])
+
+        res = self.client.get(PRODUCTS_URL, {'search': 'shoes -wallet'})
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [boot.id])
+
+    def test_search_pages_by_relevance(self):
+        """Test search results page with cursors in relevance order."""
+        products = [
+            create_product(name=f'Linen shirt {i}', images=0)
+            for i in range(5)]
+
+        seen = []
+        url = f'{PRODUCTS_URL}?search=linen&page_size=2'
+        while url:
+            res = self.client.get(url)
+            seen.extend(item['id'] for item in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(sorted(seen), [p.id for p in products])
+        self.assertEqual(len(seen), 5)
+
+
+class AutocompleteTests(TestCase):
+    """Test typeahead suggestions."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.boot = create_product(name='Leather boot', images=1)
+        self.belt = create_product(name='Leather belt', images=0)
+        Product.objects.filter(pk=self.belt.pk).update(review_count=50)
+        self.shirt = create_product(name='Cotton shirt', images=0)
+        self.category = Category.objects.create(name='Leather goods')
+        autocomplete.rebuild()
+
+    def test_prefix_index_ranks_popular_products(self):
+        """Test word prefixes match, most reviewed products first."""
+        index = PrefixIndex.build(100)
+
+        self.assertEqual(
+            [p['id'] for p in index.products_for('lea', 5)],
+            [self.belt.id, self.boot.id])
+        self.assertEqual(
+            [p['id'] for p in index.products_for('leather bo', 5)],
+            [self.boot.id])
+        self.assertEqual(index.products_for('shirt lea', 5), [])
+        self.assertEqual(
+            index.categories_for('goo', 5),
+            [{'id': self.category.id, 'name': 'Leather goods'}])
+
+    def test_autocomplete_endpoint(self):
+        """Test suggestions hold only ID, name and thumbnail."""
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'leather b'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['products'][1], {
+            'id': self.boot.id,
+            'name': 'Leather boot',
+            'thumbnail': 'https://example.com/Leather boot/0.jpg',
+        })
+        self.assertEqual(res.data['categories'], [])
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': ''})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_database_completes_unpopular_products(self):
+        """Test products missing from the prefix index are found."""
+        suggester = Autocomplete(prefix_size=1)
+
+        suggestions = suggester.suggest('cotton')
+
+        self.assertEqual(
+            [p['id'] for p in suggestions['products']], [self.shirt.id])
+
+    def test_typos_tolerated(self):
+        """Test misspelled text still finds the product."""
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        suggestions = Autocomplete(prefix_size=0).suggest('lether boot')
+
+        self.assertEqual(suggestions['products'][0]['id'], self.boot.id)
+
+
+class CategoryTreeTests(TestCase):
+    """Test subtree filtering and product counts."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.root = Category.objects.create(name='Fashion')
+        self.shoes = Category.objects.create(
+            name='Shoes', parent_category=self.root)
+        self.boots = Category.objects.create(
+            name='Boots', parent_category=self.shoes)
+        self.bags = Category.objects.create(name='Bags')
+        self.boot = create_product(name='Boot', images=0)
+        self.boot.category.add(self.boots, self.shoes)
+        self.sandal = create_product(name='Sandal', images=0)
+        self.sandal.category.add(self.shoes)
+        self.bag = create_product(name='Bag', images=0)
+        self.bag.category.add(self.bags)
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'product_count'))
+
+    def test_filter_includes_subcategories(self):
+        """Test a parent category lists its subtree's products once."""
+        res = self.client.get(PRODUCTS_URL, {'category_id': self.root.id})
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [self.sandal.id, self.boot.id])
+
+    def test_product_counts(self):
+        """Test counts cover subtrees and follow product changes."""
+        self.assertEqual(self.counts(), {
+            'Fashion': 2, 'Shoes': 2, 'Boots': 1, 'Bags': 1})
+
+        self.sandal.delete()
+        self.bag.category.clear()
+
+        self.assertEqual(self.counts(), {
+            'Fashion': 1, 'Shoes': 1, 'Boots': 1, 'Bags': 0})
+
+    def test_move_subtree(self):
+        """Test moving a category takes its subtree along."""
+        self.shoes.parent_category = self.bags
+        self.shoes.save()
+
+        res = self.client.get(PRODUCTS_URL, {'category_id': self.bags.id})
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertEqual(self.counts(), {
+            'Fashion': 0, 'Shoes': 2, 'Boots': 1, 'Bags': 3})
+
+        self.bags.parent_category = self.boots
+        with self.assertRaises(ValueError):
+            self.bags.save()
+        self.root.parent_category = self.root
+        with self.assertRaises(ValueError):
+            self.root.save()
+
+    def test_rebuild_command(self):
+        """Test rebuilding gives the incrementally maintained tree."""
+        links = set(CategoryClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth'))
+        Category.objects.update(product_count=0)
+
+        call_command('rebuild_category_tree', stdout=StringIO())
+
+        self.assertEqual(set(CategoryClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth')), links)
+        self.assertEqual(len(links), 7)
+        self.assertEqual(self.counts()['Fashion'], 2)
+
+
+class FacetTests(TestCase):
+    """Test faceted filtering and facet counts."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.shoes = Category.objects.create(name='Shoes')
+        self.tee = create_product(name='Tee', prices=((20, 15),))
+        self.jeans = create_product(name='Jeans', prices=((60, 40),))
+        self.boot = create_product(name='Boot', prices=((150, 120),))
+        self.boot.category.add(self.shoes)
+        for product, colors, sizes in (
+                (self.tee, ['Red', 'Blue'], ['M', 'L']),
+                (self.jeans, ['Blue'], ['M']),
+                (self.boot, ['red '], ['42'])):
+            for color, size in zip(colors, sizes):
+                ProductVariant.objects.create(
+                    product=product, color=color, size=size)
+        Product.objects.filter(pk=self.tee.pk).update(material='Cotton')
+        self.tee.refresh_from_db()
+        self.tee.average_rating = Decimal('4.5')
+        self.tee.save(update_fields=['average_rating'])
+        facet_engine.reload()
+
+    def facets(self, product):
+        return set(ProductFacet.objects.filter(
+            product=product).values_list('facet', 'value'))
+
+    def test_facet_values_follow_changes(self):
+        """Test facet rows are derived from variants, prices and ratings."""
+        self.assertEqual(self.facets(self.tee), {
+            ('price', '0-25'), ('color', 'red'), ('color', 'blue'),
+            ('size', 'M'), ('size', 'L'), ('rating', '4'),
+            ('rating', '3'), ('rating', '2'), ('rating', '1'),
+            ('material', 'cotton'), ('currency', 'USD'),
+        })
+        self.assertIn(('category', str(self.shoes.pk)), self.facets(
+            self.boot))
+
+        ProductDetail.objects.create(
+            product=self.boot, price=30, sale_price=25)
+        self.boot.variants.all().delete()
+        self.boot.category.clear()
+        self.assertEqual(self.facets(self.boot), {
+            ('price', '25-50'), ('currency', 'USD')})
+
+    def test_filters_and_counts(self):
+        """Test values of a facet are alternatives and facets combine."""
+        res = self.client.get(PRODUCTS_URL, {
+            'color': 'red,blue', 'price': '50-100,100-200'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [self.boot.id, self.jeans.id])
+        facets = res.data['facets']
+        # A facet's own filter does not narrow its counts.
+        self.assertEqual(facets['color'], {'blue': 1, 'red': 1})
+        self.assertEqual(
+            facets['price'], {'0-25': 1, '50-100': 1, '100-200': 1})
+        self.assertEqual(facets['size'], {'42': 1, 'M': 1})
+
+    def test_values_in_raw_query_string(self):
+        """Test facet values need no escaping in a query string."""
+        create_product(name='Ring', prices=((250, 240),))
+        facet_engine.reload()
+
+        res = self.client.get(f"{PRODUCTS_URL}?price=0-25,200-&rating=4")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [self.tee.id])
+        self.assertEqual(res.data['facets']['price'], {'0-25': 1})
+        self.assertEqual(res.data['facets']['rating'], {
+            '1': 1, '2': 1, '3': 1, '4': 1})
+
+    def test_counts_follow_search_and_category(self):
+        """Test counts only include products matching the other filters."""
+        res = self.client.get(PRODUCTS_URL, {'name': 'ee'})
+        self.assertEqual(res.data['facets']['color'], {'blue': 1, 'red': 1})
+
+        res = self.client.get(PRODUCTS_URL, {'category_id': self.shoes.id})
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['facets']['color'], {'red': 1})
+
+    def test_base_bitmaps_expire(self):
+        """Test stock-filtered counts are reused only for a while."""
+        engine = FacetEngine(base_seconds=60)
+        engine.reload()
+        in_stock = Product.objects.filter(in_stock=True)
+        self.assertEqual(engine.counts({}, in_stock)['color'], {})
+
+        Product.objects.filter(pk=self.tee.pk).update(in_stock=True)
+
+        self.assertEqual(engine.counts({}, in_stock)['color'], {})
+        engine.base_seconds = 0
+        self.assertEqual(
+            engine.counts({}, in_stock)['color'], {'blue': 1, 'red': 1})
+
+    def test_index_matches_table(self):
+        """Test bitmaps count the same products as the facet table."""
+        rows = list(ProductFacet.objects.values_list(
+            'product_id', 'facet', 'value'))
+        index = FacetIndex.from_rows(*map(list, zip(*rows)))
+
+        self.assertEqual(
+            index.counts({})['color'], {'blue': 2, 'red': 2})
+        self.assertEqual(
+            index.counts({'size': ['M']})['color'], {'blue': 2, 'red': 1})
+
+    def test_rebuild_command(self):
+        """Test rebuilding gives the incrementally maintained rows."""
+        rows = set(ProductFacet.objects.values_list(
+            'product_id', 'facet', 'value'))
+        ProductFacet.objects.all().delete()
+
+        call_command('rebuild_product_facets', stdout=StringIO())
+
+        self.assertEqual(set(ProductFacet.objects.values_list(
+            'product_id', 'facet', 'value')), rows)
+
+
+class ProductDetailCacheTests(TestCase):
+    """Test the versioned product detail cache."""
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.product = create_product(name='Tee')
+        self.variant = ProductVariant.objects.create(
+            product=self.product, color='Red', size='M')
+
+    def test_repeated_requests_hit_cache(self):
+        """Test a cached detail costs only the version lookup."""
+        res = self.client.get(detail_url(self.product.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(detail_url(self.product.id))
+
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(
+            metrics.snapshot()['hit_rates']['product_detail_cache'], 0.5)
+
+    def test_changes_invalidate(self):
+        """Test product and related row writes serve fresh details."""
+        self.client.get(detail_url(self.product.id))
+
+        self.variant.color = 'Blue'
+        self.variant.save()
+        res = self.client.get(detail_url(self.product.id))
+        self.assertEqual(res.data['colors'], ['Blue'])
+
+        self.product.name = 'T-shirt'
+        self.product.save()
+        res = self.client.get(detail_url(self.product.id))
+        self.assertEqual(res.data['name'], 'T-shirt')
+
+        ProductImage.objects.filter(product=self.product).delete()
+        res = self.client.get(detail_url(self.product.id))
+        self.assertEqual(res.data['images'], [])
+        self.assertEqual(metrics.counter('product_detail_cache.hit'), 0)
+
+    def test_unknown_product(self):
+        """Test a missing product is not found."""
+        self.assertEqual(
+            self.client.get(detail_url(0)).status_code,
+            status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and Last-Modified revalidation of catalog responses."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.product = create_product(name='Tee')
+        self.category = Category.objects.create(name='Shirts')
+
+    def test_product_detail(self):
+        """Test a current copy gets 304 from the version lookup alone."""
+        url = detail_url(self.product.id)
+        res = self.client.get(url)
+        etag, last_modified = res['ETag'], res['Last-Modified']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        ProductVariant.objects.create(product=self.product, color='Red')
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_product_list(self):
+        """Test a list page is revalidated by its products' versions."""
+        facet_engine.reload()
+        res = self.client.get(PRODUCTS_URL)
+        etag = res['ETag']
+
+        res = self.client.get(PRODUCTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        res = self.client.get(
+            PRODUCTS_URL, {'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.product.name = 'T-shirt'
+        self.product.save()
+        res = self.client.get(PRODUCTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'T-shirt')
+
+    def test_categories(self):
+        """Test category list and detail revalidation."""
+        res = self.client.get(CATEGORIES_URL)
+        etag = res['ETag']
+        with self.assertNumQueries(1):
+            res = self.client.get(CATEGORIES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse('product:category-detail', args=[self.category.id])
+        res = self.client.get(url)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product.category.add(self.category)
+        res = self.client.get(CATEGORIES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['product_count'], 1)
+
+
+class ListJsonInDatabaseTests(TestCase):
+    """Test the product list built as JSON by the database."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        create_product(name='Tee', images=2)
+        create_product(name='Hat', prices=((12.5, 9.99),), images=0)
+        Product.objects.create(name='Bare')
+        cache.clear()
+        facet_engine.reload()
+
+    def assertSameResponses(self, params):
+        expected = self.client.get(PRODUCTS_URL, params)
+        with override_settings(PRODUCT_LIST_JSON_IN_DATABASE=True):
+            res = self.client.get(PRODUCTS_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(res.json(), expected.json())
+        self.assertEqual(res['ETag'], expected['ETag'])
+        return res
+
+    def test_pages_match_serializers(self):
+        """Test every page equals the serializer output exactly."""
+        res = self.assertSameResponses({'page_size': 2, 'include_total': 1})
+        self.assertEqual(len(res.json()['results']), 2)
+        query = parse_qs(urlsplit(res.json()['next']).query)
+        res = self.assertSameResponses({**query, 'page_size': 2})
+        self.assertEqual(len(res.json()['results']), 1)
+        self.assertSameResponses({'ordering': 'price'})
+        self.assertSameResponses({'search': 'tee'})
+
+    def test_no_model_instances(self):
+        """Test a page is a single query returning JSON texts."""
+        with override_settings(PRODUCT_LIST_JSON_IN_DATABASE=True):
+            with self.assertNumQueries(1):
+                self.client.get(PRODUCTS_URL)
+
+
+class SparseFieldsetTests(TestCase):
+    """Test fields and expand on the product list and detail."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.product = create_product(name='Tee', images=2)
+        ProductVariant.objects.create(product=self.product, color='Red')
+        cache.clear()
+        facet_engine.reload()
+
+    def test_list_ids_and_names(self):
+        """Test a sparse page reads neither images nor cards."""
+        with self.assertNumQueries(1):
+            res = self.client.get(PRODUCTS_URL, {'fields': 'id,name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'], [{'id': self.product.id, 'name': 'Tee'}])
+        self.assertIn('facets', res.data)
+
+    def test_list_images(self):
+        """Test images are image IDs unless expanded."""
+        res = self.client.get(PRODUCTS_URL, {'fields': 'images'})
+        self.assertEqual(
+            res.data['results'][0]['images'],
+            sorted(self.product.images.values_list('id', flat=True)))
+
+        full = self.client.get(PRODUCTS_URL).data['results'][0]
+        res = self.client.get(
+            PRODUCTS_URL, {'fields': 'id', 'expand': 'images'})
+        self.assertEqual(
+            res.data['results'][0],
+            {'id': full['id'], 'images': full['images']})
+
+    def test_detail(self):
+        """Test a sparse detail skips unrendered relations."""
+        url = detail_url(self.product.id)
+        with self.assertNumQueries(3):
+            res = self.client.get(url, {'fields': 'id,colors,price'})
+
+        self.assertEqual(set(res.data), {'id', 'colors', 'price'})
+        self.assertEqual(res.data['colors'], ['Red'])
+        etag = res['ETag']
+        self.assertNotEqual(etag, self.client.get(url)['ETag'])
+        res = self.client.get(
+            url, {'fields': 'id,colors,price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(
+            url, {'fields': 'name', 'expand': 'product_details'})
+        self.assertEqual(len(res.data['product_details']), 2)
+        self.assertIn('detail_variant', res.data['product_details'][0])
+
+
+class ProductBatchTests(TestCase):
+    """Test fetching several products by ID."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.products = [
+            create_product(name=f'Batch {i}', images=2) for i in range(5)]
+
+    def test_batch_in_request_order(self):
+        """Test products come in ID order with nulls for unknown IDs."""
+        ids = [p.id for p in reversed(self.products)]
+        query = ','.join(map(str, [ids[0], 0, *ids[1:], ids[0]]))
+
+        with self.assertNumQueries(3):
+            res = self.client.get(BATCH_URL, {'ids': query})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [card and card['id'] for card in res.data['products']],
+            [ids[0], None, *ids[1:], ids[0]])
+        self.assertEqual(res.data['count'], 6)
+        self.assertEqual(
+            res.data['products'][0],
+            self.client.get(PRODUCTS_URL).data['results'][0])
+
+        with self.assertNumQueries(1):
+            self.client.get(BATCH_URL, {'ids': query})
+
+    def test_batch_fields(self):
+        """Test sparse batches are serialized from a lean query."""
+        with self.assertNumQueries(1):
+            res = self.client.get(BATCH_URL, {
+                'ids': f'{self.products[1].id},99999999999999999999',
+                'fields': 'name',
+            })
+
+        self.assertEqual(res.data['products'], [{'name': 'Batch 1'}, None])
+
+    def test_batch_invalid(self):
+        """Test missing, malformed and oversized ID lists are rejected."""
+        for ids in ('', '1,x', ','.join(['1'] * 251)):
+            res = self.client.get(BATCH_URL, {'ids': ids})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def deduplicated_tables(sql):
+    """Tables whose rows are deduplicated (Unique or grouping) in a plan."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    def scanned(node):
+        tables = {node.get('Relation Name')} - {None}
+        for child in node.get('Plans', []):
+            tables |= scanned(child)
+        return tables
+
+    def deduplicated(node):
+        tables = set()
+        if node['Node Type'] == 'Unique' or (
+                node['Node Type'] == 'Aggregate'
+                and node.get('Strategy') != 'Plain'):
+            tables |= scanned(node)
+        for child in node.get('Plans', []):
+            tables |= deduplicated(child)
+        return tables
+
+    return deduplicated(plan[0]['Plan'])
+
+
+class CatalogPlanTests(TestCase):
+    """Pin the plan shape of filtered product list queries."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.root = Category.objects.create(name='Fashion')
+        shoes = Category.objects.create(
+            name='Shoes', parent_category=self.root)
+        boots = Category.objects.create(name='Boots', parent_category=shoes)
+        for i in range(3):
+            product = create_product(name=f'Boot {i}', images=0)
+            # Linked to two categories of the subtree: a join would
+            # return it twice.
+            product.category.add(shoes, boots)
+            ProductVariant.objects.create(product=product, color='Red')
+            ProductVariant.objects.create(product=product, color='Black')
+        facet_engine.reload()
+
+    def test_filters_are_semi_joins(self):
+        """Test category and facet filters need no DISTINCT."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(PRODUCTS_URL, {
+                'category_id': self.root.id,
+                'color': 'red,black',
+                'include_total': 'true',
+            })
+
+        self.assertEqual(len(res.data['results']), 3)
+        # The page and the row estimate of include_total
+        product_queries = [
+            query['sql'].removeprefix('EXPLAIN (FORMAT JSON) ')
+            for query in queries if 'FROM "core_product"' in query['sql']]
+        self.assertEqual(len(product_queries), 2)
+        for sql in product_queries:
+            self.assertNotIn('DISTINCT', sql)
+            self.assertEqual(sql.count('EXISTS'), 2)
+            self.assertNotIn('core_product', deduplicated_tables(sql))
+
+    def test_distinct_join_detected(self):
+        """Test the plan check flags a deduplicated join."""
+        queryset = Product.objects.filter(
+            category__in=Category.objects.all()).distinct().order_by('-id')
+
+        self.assertIn(
+            'core_product', deduplicated_tables(str(queryset[:11].query)))
@@ -1,24 +1,55 @@
-from rest_framework import (
-    viewsets,
-    pagination,
-)
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Prefetch
+from django.http import Http404
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from product.serializers import (
     ProductSerializer,
     ProductGenericSerializer,
     CategorySerializer,
 )
+from core.fieldsets import FIELDSET_PARAMETERS, SparseFieldsViewMixin
 from core.models import (
     Product,
     Category,
+    ProductImage,
 )
+from product.autocomplete import autocomplete
+from product.cache import get_product_detail
+from product.card_json import paginated_response, with_card_json
+from product.cards import get_product_cards, product_cards
+from product.categories import in_subtree
+from product.conditional import not_modified, set_validators, timestamp
+from product.facets import facet_engine, filter_products, parse_filters
+from product.pagination import ProductCursorPagination
+from product.search import search_products
+from recommendation.similarity import similar_products_index
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
 
-class ProductListView(viewsets.ReadOnlyModelViewSet):
+class ProductListView(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """List products API View."""
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    pagination_class = pagination.PageNumberPagination
+    pagination_class = ProductCursorPagination
+    # Columns of sparse list pages besides the rendered ones: the
+    # pagination keys and the version of the page ETag.
+    list_key_columns = ('version', 'min_price', 'average_rating',
+                        'review_count')
+    # Prefetches of the ProductSerializer fields, as (expanded, collapsed)
+    detail_prefetches = {
+        'product_details': ('product_details__detail_variant',
+                            'product_details'),
+        'images': ('images', 'images'),
+        'detail_information': ('detail_information', 'detail_information'),
+        'colors': ('variants', 'variants'),
+        'sizes': ('variants', 'variants'),
+    }
+    fieldset_actions = ('list', 'retrieve', 'batch')
+    batch_max_ids = 250
 
     @extend_schema(
         parameters=[
@@ -26,7 +57,7 @@ class ProductListView(viewsets.ReadOnlyModelViewSet):
                 name='category_id',
                 type=int,
                 location=OpenApiParameter.QUERY,
-                description='Filter by category ID'
+                description='Filter by category ID, including subcategories'
             ),
             OpenApiParameter(
                 name='name',
@@ -34,26 +65,180 @@ class ProductListView(viewsets.ReadOnlyModelViewSet):
                 location=OpenApiParameter.QUERY,
                 description='Filter by product name (case-insensitive)'
             ),
+            OpenApiParameter(
+                name='in_stock',
+                type=bool,
+                location=OpenApiParameter.QUERY,
+                description='Only products with stock left'
+            ),
+            OpenApiParameter(
+                name='search',
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description=(
+                    'Full-text search over name, description, material, '
+                    'style and categories ("quoted phrases", or, -word); '
+                    'results are ordered by relevance by default'
+                )
+            ),
+            *(
+                OpenApiParameter(
+                    name=facet,
+                    type=str,
+                    location=OpenApiParameter.QUERY,
+                    description=description,
+                )
+                for facet, description in (
+                    ('price', 'Price ranges, e.g. 0-25,25-50,200-'),
+                    ('color', 'Variant colors, e.g. red,blue'),
+                    ('size', 'Variant sizes, e.g. S,M'),
+                    ('rating', 'Minimum rating, e.g. 4'),
+                    ('material', 'Materials, e.g. cotton'),
+                    ('currency', 'Currencies, e.g. USD'),
+                )
+            ),
+            *FIELDSET_PARAMETERS,
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        """List a page of products with the counts of every facet value.
 
-    def get_queryset(self):
-        """Retrieve products."""
+        Values of one facet are alternatives, facets are combined. Counts
+        of a facet apply the other facets' filters but not its own.
+
+        With ``PRODUCT_LIST_JSON_IN_DATABASE`` the cards are built by
+        the database and returned as raw JSON, see product.card_json.
+        Sparse fieldsets are serialized from their own lean query.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        fieldset = self.get_fieldset()
+        in_database = fieldset is None and getattr(
+            settings, 'PRODUCT_LIST_JSON_IN_DATABASE', False)
+        if in_database:
+            queryset = with_card_json(queryset)
+        page = self.paginate_queryset(queryset)
+        facet_engine.index()
+        etag = self.page_etag(page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        filters = parse_filters(request.query_params)
+        category_id = request.query_params.get('category_id')
+        if category_id:
+            filters['category'] = [category_id]
+        products = None
+        if request.query_params.get('name') \
+                or request.query_params.get('search') \
+                or self.in_stock_only():
+            products = self.get_base_queryset()
+        facets = facet_engine.counts(filters, products)
+        if in_database:
+            response = paginated_response(self.paginator, page, facets=facets)
+        elif fieldset is not None:
+            response = self.get_paginated_response(
+                self.get_serializer(page, many=True).data)
+            response.data['facets'] = facets
+        else:
+            response = self.get_paginated_response(product_cards(page))
+            response.data['facets'] = facets
+        return set_validators(response, etag)
+
+    def page_etag(self, page):
+        """Validator of a list page from the versions of its products.
+
+        It has no Last-Modified: a product leaving the page does not make
+        the page newer. Facet counts are revalidated with the facet index.
+        """
+        paginator = self.paginator
+        key = (
+            self.request.get_full_path(),
+            [(row['id'], row['version']) if isinstance(row, dict)
+             else (row.pk, row.version) for row in page],
+            paginator.has_next,
+            paginator.has_previous,
+            paginator.total,
+            facet_engine.generation,
+        )
+        return "products-" + hashlib.md5(repr(key).encode()).hexdigest()
+
+    @extend_schema(parameters=FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        """Get a product's details, served from the versioned cache.
+
+        Sparse fieldsets are not cached; their query leaves out the
+        relations they do not render.
+        """
+        pk = kwargs.get('pk')
+        if not str(pk).isdigit():
+            raise Http404
+        row = Product.objects.filter(pk=pk).values_list(
+            'version', 'updated_at').first()
+        if row is None:
+            raise Http404
+        version, updated_at = row
+        etag = f"product-{pk}-{version}"
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            etag += "-" + hashlib.md5(str(fieldset).encode()).hexdigest()
+        response = not_modified(request, etag, updated_at)
+        if response is not None:
+            return response
+
+        if fieldset is not None:
+            return set_validators(
+                super().retrieve(request, *args, **kwargs), etag, updated_at)
+        data = get_product_detail(
+            int(pk),
+            version,
+            lambda: dict(super(ProductListView, self).retrieve(
+                request, *args, **kwargs).data))
+        return set_validators(Response(data), etag, updated_at)
+
+    def in_stock_only(self):
+        return self.action == 'list' and self.request.query_params.get(
+            'in_stock') in ('1', 'true')
+
+    def get_base_queryset(self):
+        """Products matching the name, search text and stock filter."""
         queryset = self.queryset
-        category_id = self.request.query_params.get('category_id')
         name = self.request.query_params.get('name')
+        search = self.request.query_params.get('search')
         if name:
             queryset = queryset.filter(name__icontains=name)
+        if search and self.action == 'list':
+            queryset = search_products(queryset, search)
+        if self.in_stock_only():
+            queryset = queryset.filter(in_stock=True)
+        return queryset
+
+    def get_queryset(self):
+        """Retrieve products."""
+        queryset = self.get_base_queryset()
+        category_id = self.request.query_params.get('category_id')
         if category_id:
-            queryset = queryset.filter(category__id=category_id)
+            # Products of the category and all its subcategories
+            queryset = queryset.filter(in_subtree(category_id))
 
+        fieldset = self.get_fieldset()
         if self.action == 'list':
-            # Optimize for ProductGenericSerializer
-            queryset = queryset.prefetch_related(
-                'product_details__detail_variant'
-            )
+            queryset = filter_products(
+                queryset, parse_filters(self.request.query_params))
+            if fieldset is None:
+                # Cards come from the card cache, see product.cards
+                queryset = queryset.defer('search_vector')
+            else:
+                queryset = self.get_sparse_card_queryset(queryset)
+        elif fieldset is not None:
+            queryset = queryset.prefetch_related(*sorted({
+                expanded if fieldset.expands(name) else collapsed
+                for name, (expanded, collapsed)
+                in self.detail_prefetches.items()
+                if fieldset.includes(name)
+            }))
+            columns = self.get_fieldset_columns()
+            if columns is not None:
+                queryset = queryset.only(*columns)
         else:
             # Optimize for ProductSerializer (retrieve)
             queryset = queryset.prefetch_related(
@@ -63,17 +248,171 @@ class ProductListView(viewsets.ReadOnlyModelViewSet):
                 'detail_information',
                 'variants'
             )
-        return queryset.distinct()
+        return queryset
+
+    def get_sparse_card_queryset(self, queryset):
+        """Products with the columns and images of a sparse fieldset."""
+        fieldset = self.get_fieldset()
+        columns = self.get_fieldset_columns()
+        if columns is None:
+            queryset = queryset.defer('search_vector')
+        else:
+            queryset = queryset.only(*columns, *self.list_key_columns)
+        if fieldset.includes('images'):
+            queryset = queryset.prefetch_related(
+                'images' if fieldset.expands('images') else Prefetch(
+                    'images', ProductImage.objects.only('product')))
+        return queryset
 
     def get_serializer_class(self):
         """Return appropriate serializer class."""
-        if self.action == 'list':
+        if self.action in ('list', 'similar', 'batch'):
             return ProductGenericSerializer
         return self.serializer_class
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='limit',
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description='Number of similar products (default 10)'
+            ),
+        ]
+    )
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def similar(self, request, pk=None):
+        """List products most often viewed together with this one."""
+        if not str(pk).isdigit():
+            raise Http404
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+        except ValueError:
+            limit = 10
+
+        index = similar_products_index.get()
+        neighbours = index.similar(pk, limit) if index is not None else []
+        products = Product.objects.prefetch_related('images').in_bulk(
+                [product_id for product_id, _ in neighbours])
+        serializer = self.get_serializer(
+            [products[product_id] for product_id, _ in neighbours
+             if product_id in products],
+            many=True)
+        return Response({
+            'product_id': int(pk),
+            'similar': serializer.data,
+            'count': len(serializer.data),
+        })
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='ids',
+                type=str,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description='Comma-separated product IDs (at most 250)'
+            ),
+            *FIELDSET_PARAMETERS,
+        ]
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def batch(self, request):
+        """Get several products' cards, in the order of ``ids``.
+
+        Unknown IDs give null entries. Cards come from the card cache;
+        sparse fieldsets are serialized from their own query.
+        """
+        try:
+            ids = [
+                int(pk) for pk in request.query_params.get(
+                    'ids', '').split(',') if pk.strip()
+            ]
+        except ValueError:
+            return Response(
+                {"error": "ids must be comma-separated integers"},
+                status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > self.batch_max_ids:
+            return Response(
+                {"error": f"ids takes 1 to {self.batch_max_ids} IDs"},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        # IDs out of the primary key range cannot exist
+        lookup = {pk for pk in ids if 0 < pk < 2 ** 63}
+        if self.get_fieldset() is None:
+            cards = get_product_cards(lookup)
+        else:
+            products = self.get_sparse_card_queryset(
+                Product.objects.all()).in_bulk(lookup)
+            cards = dict(zip(products, self.get_serializer(
+                products.values(), many=True).data))
+        products = [cards.get(pk) for pk in ids]
+        return Response({
+            'products': products,
+            'count': sum(card is not None for card in products),
+        })
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='q',
+                type=str,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description='Text typed so far (typos are tolerated)'
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description='Number of products (default 8, max 20)'
+            ),
+        ]
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def autocomplete(self, request):
+        """Suggest products (ID, name, thumbnail) and categories."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {"error": "q is required"},
+                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 8)), 20)
+        except ValueError:
+            limit = 8
+
+        suggestions = autocomplete.suggest(text[:100], limit=max(limit, 1))
+        return Response({'query': text, **suggestions})
+
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     """Retrieve all and a single product"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        """List all categories, answering revalidations with 304."""
+        stats = Category.objects.aggregate(
+            count=Count('id'), updated_at=Max('updated_at'))
+        etag = "categories-{}-{}".format(
+            stats['count'],
+            timestamp(stats['updated_at']) if stats['updated_at'] else 0)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        return set_validators(
+            super().list(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Get a category, answering revalidations with 304."""
+        category = self.get_object()
+        etag = f"category-{category.pk}-{timestamp(category.updated_at)}"
+        response = not_modified(request, etag, category.updated_at)
+        if response is not None:
+            return response
+        return set_validators(
+            Response(self.get_serializer(category).data),
+            etag,
+            category.updated_at)
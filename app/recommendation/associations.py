@@ -0,0 +1,228 @@
+"""
+"Frequently bought together" association rules mined from order baskets.
+
+Every order is a basket of products (Order -> OrderItem ->
+ProductDetail.product). Pair counts come from the sparse product of the
+basket x product matrix with itself and are kept in a state file together
+with the item counts, the number of baskets and the last mined order, so
+later runs only add the orders placed since. Only pending orders can still
+be cancelled, so the state also lists the pending orders counted; a later
+run takes out the baskets of those cancelled since. Order IDs are taken
+before their transaction commits, so an order may appear after one with
+a higher ID was mined: runs read again the last ``late_window`` IDs
+below the last mined order and skip the ones the state lists as counted.
+Support, confidence and lift of every pair are derived from those counts
+and the best pairs per product are written to a NeighbourIndex file for
+the cart API.
+"""
+import os
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+
+from core.models import Order, OrderItem
+from recommendation.similarity import (
+    IndexLoader,
+    NeighbourIndex,
+    incidence_matrix,
+    top_k_entries,
+)
+
+
+RANK_METRICS = ('confidence', 'lift', 'support')
+
+
+class BasketCounts:
+    """Item and pair counts over all mined baskets."""
+
+    def __init__(self, product_ids, pair_counts, num_baskets, last_order_id,
+                 pending_order_ids=None, recent_order_ids=None):
+        # pair_counts[i, i] is the number of baskets holding product i.
+        self.product_ids = product_ids
+        self.pair_counts = pair_counts
+        self.num_baskets = num_baskets
+        self.last_order_id = last_order_id
+        # Orders counted while pending, which may still be cancelled
+        self.pending_order_ids = np.array([], dtype=np.int64) \
+            if pending_order_ids is None else pending_order_ids
+        # Orders counted near last_order_id, where late orders may appear
+        self.recent_order_ids = np.array([], dtype=np.int64) \
+            if recent_order_ids is None else recent_order_ids
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.array([], dtype=np.int64),
+            sparse.csr_matrix((0, 0), dtype=np.float64),
+            0,
+            0)
+
+    @classmethod
+    def load(cls, path):
+        """Load counts written by ``save``, or empty counts if missing."""
+        if not path or not os.path.exists(path):
+            return cls.empty()
+        with np.load(path) as data:
+            size = len(data['product_ids'])
+            pair_counts = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']),
+                shape=(size, size))
+            return cls(
+                data['product_ids'],
+                pair_counts,
+                int(data['num_baskets']),
+                int(data['last_order_id']),
+                *(data[name] if name in data.files else None
+                  for name in ('pending_order_ids', 'recent_order_ids')))
+
+    def save(self, path):
+        """Atomically write the counts to ``path``."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            product_ids=self.product_ids,
+            data=self.pair_counts.data,
+            indices=self.pair_counts.indices,
+            indptr=self.pair_counts.indptr,
+            num_baskets=self.num_baskets,
+            last_order_id=self.last_order_id,
+            pending_order_ids=self.pending_order_ids,
+            recent_order_ids=self.recent_order_ids,
+        )
+        os.replace(tmp_path, path)
+
+    def add(self, order_ids, product_ids):
+        """Add baskets given as parallel (order_id, product_id) arrays."""
+        if len(order_ids) == 0:
+            return
+        self._merge(order_ids, product_ids, 1)
+        self.last_order_id = max(self.last_order_id, int(order_ids.max()))
+
+    def remove(self, order_ids, product_ids):
+        """Take out baskets counted by an earlier ``add``."""
+        if len(order_ids) == 0:
+            return
+        self._merge(order_ids, product_ids, -1)
+        self.pair_counts.eliminate_zeros()
+
+    def _merge(self, order_ids, product_ids, sign):
+        basket, basket_products = incidence_matrix(order_ids, product_ids)
+        delta = (basket.T @ basket).tocsr()
+
+        merged_ids = np.union1d(self.product_ids, basket_products)
+        size = len(merged_ids)
+        self.pair_counts = (
+            _remap(self.pair_counts, self.product_ids, merged_ids, size)
+            + sign * _remap(delta, basket_products, merged_ids, size)
+        ).tocsr()
+        self.product_ids = merged_ids
+        self.num_baskets += sign * basket.shape[0]
+
+    def rules(self, k=10, min_count=2, rank_by='confidence'):
+        """Return the top-k association rules per product.
+
+        The result is a NeighbourIndex scored by ``rank_by`` with
+        ``support``, ``confidence`` and ``lift`` extras.
+        """
+        if rank_by not in RANK_METRICS:
+            raise ValueError(f"rank_by must be one of {RANK_METRICS}")
+        pairs = self.pair_counts.tocoo()
+        item_counts = self.pair_counts.diagonal()
+        keep = (pairs.row != pairs.col) & (pairs.data >= min_count)
+        rows, cols, both = pairs.row[keep], pairs.col[keep], pairs.data[keep]
+
+        support = both / max(self.num_baskets, 1)
+        confidence = both / item_counts[rows]
+        lift = confidence / (item_counts[cols] / max(self.num_baskets, 1))
+        metrics = {
+            'support': support,
+            'confidence': confidence,
+            'lift': lift,
+        }
+
+        indptr, positions = top_k_entries(
+            rows, cols, metrics[rank_by], len(self.product_ids), k)
+        return NeighbourIndex(
+            self.product_ids,
+            indptr,
+            cols[positions].astype(np.int32),
+            metrics[rank_by][positions].astype(np.float32),
+            extras={
+                name: values[positions].astype(np.float32)
+                for name, values in metrics.items()
+            },
+        )
+
+
+def _remap(matrix, product_ids, merged_ids, size):
+    """Re-index a square count matrix onto ``merged_ids``."""
+    coo = matrix.tocoo()
+    positions = np.searchsorted(merged_ids, product_ids)
+    return sparse.csr_matrix(
+        (coo.data, (positions[coo.row], positions[coo.col])),
+        shape=(size, size))
+
+
+def _baskets(items):
+    rows = np.array(
+        items.values_list('order_id', 'product_detail__product_id'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def read_baskets(after_order_id=0):
+    """Return parallel (order_id, product_id) arrays for new orders."""
+    return _baskets(OrderItem.objects.filter(
+        order_id__gt=after_order_id,
+    ).exclude(
+        order__order_status='cancelled',
+    ))
+
+
+def update_counts(counts, late_window=1000):
+    """Add the orders placed since the last run and drop cancelled ones.
+
+    Pending orders counted by earlier runs are looked up again: the
+    cancelled ones are removed, the still pending ones kept for the next
+    run. New orders are read with their status in one query, so an order
+    cancelled meanwhile is either skipped or remembered as pending.
+    Orders committed late are counted if their ID is at most
+    ``late_window`` below the last mined order. Returns the numbers of
+    baskets added and removed.
+    """
+    statuses = dict(Order.objects.filter(
+        pk__in=counts.pending_order_ids.tolist(),
+    ).values_list('pk', 'order_status'))
+    cancelled = [pk for pk, status in statuses.items()
+                 if status == 'cancelled']
+    previous = counts.num_baskets
+    counts.remove(*_baskets(OrderItem.objects.filter(order_id__in=cancelled)))
+    removed = previous - counts.num_baskets
+
+    counted = set(counts.recent_order_ids.tolist())
+    rows = [row for row in OrderItem.objects.filter(
+        order_id__gt=max(counts.last_order_id - late_window, 0),
+    ).exclude(
+        order__order_status='cancelled',
+    ).values_list(
+        'order_id', 'product_detail__product_id', 'order__order_status',
+    ) if row[0] not in counted]
+    previous = counts.num_baskets
+    counts.add(
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.int64))
+    pending = {pk for pk, status in statuses.items() if status == 'pending'}
+    pending.update(row[0] for row in rows if row[2] == 'pending')
+    counts.pending_order_ids = np.array(sorted(pending), dtype=np.int64)
+    counted.update(row[0] for row in rows)
+    counts.recent_order_ids = np.array(sorted(
+        pk for pk in counted if pk > counts.last_order_id - late_window),
+        dtype=np.int64)
+    return counts.num_baskets - previous, removed
+
+
+frequently_bought_together_index = IndexLoader(
+    getattr(settings, 'FREQUENTLY_BOUGHT_TOGETHER_INDEX_PATH', None))
@@ -0,0 +1,265 @@
+"""
+Content vectors for cold-start products.
+
+Products without UserAction history are unknown to the NCF model. Their
+catalog text (name, description, material, style, node name, category
+ancestry and detail information) is hashed into sparse TF-IDF features,
+reduced with a truncated SVD and stored as a memory-mapped float32 matrix
+of L2-normalized rows, so similarity to any set of products is a single
+matrix-vector product.
+"""
+import multiprocessing
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from core.models import Category, Product, ProductDetailInformation
+from recommendation.similarity import IndexLoader
+
+VECTORIZER = HashingVectorizer(
+    n_features=2 ** 20,
+    ngram_range=(1, 2),
+    stop_words='english',
+    alternate_sign=False,
+    norm=None,
+)
+
+
+def ids_path(vectors_path):
+    """Path of the product ID array stored next to the vectors."""
+    root, ext = os.path.splitext(vectors_path)
+    return f"{root}_ids{ext}"
+
+
+def category_paths():
+    """Return ``{category_id: 'Parent > Child'}`` for every category."""
+    categories = dict(
+        (pk, (name, parent)) for pk, name, parent in
+        Category.objects.values_list('id', 'name', 'parent_category_id'))
+    paths = {}
+    for pk in categories:
+        names, current, seen = [], pk, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            name, current = categories[current]
+            names.append(name)
+        paths[pk] = ' > '.join(reversed(names))
+    return paths
+
+
+def product_documents(product_ids, paths):
+    """Build one text document per product, in ``product_ids`` order."""
+    fields = Product.objects.filter(id__in=product_ids).values_list(
+        'id', 'name', 'description', 'material', 'style', 'node_name')
+    parts = defaultdict(list)
+    for pk, *values in fields:
+        parts[pk].extend(v for v in values if v)
+    for pk, category_id in Product.category.through.objects.filter(
+            product_id__in=product_ids).values_list(
+                'product_id', 'category_id'):
+        parts[pk].append(paths.get(category_id, ''))
+    for pk, name, value in ProductDetailInformation.objects.filter(
+            product_id__in=product_ids).values_list(
+                'product_id', 'detail_name', 'detail_value'):
+        parts[pk].append(f"{name} {value or ''}")
+    return ['\n'.join(parts[pk]) for pk in product_ids]
+
+
+# Model parameters shared with forked batch workers.
+_SHARED = {}
+
+
+def _hash_documents(documents):
+    return VECTORIZER.transform(documents).tocsr()
+
+
+def _tfidf(features, columns, idf):
+    """Log-scaled, IDF-weighted, L2-normalized features of ``columns``."""
+    features = features[:, columns]
+    features.data = np.log1p(features.data)
+    return normalize(features.multiply(idf).tocsr())
+
+
+def _embed_documents(documents):
+    if not len(_SHARED['columns']):
+        return np.zeros(
+            (len(documents), _SHARED['components'].shape[0]),
+            dtype=np.float32)
+    features = _tfidf(
+        _hash_documents(documents), _SHARED['columns'], _SHARED['idf'])
+    vectors = features @ _SHARED['components'].T
+    return normalize(vectors).astype(np.float32)
+
+
+def _ordered_map(pool, function, iterable, window):
+    """Like ``pool.map`` but with at most ``window`` batches in flight."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def build_content_vectors(
+        path,
+        dimensions=128,
+        batch_size=2000,
+        workers=1,
+        svd_sample=50000,
+        min_df=2,
+        max_features=100000,
+        log=None):
+    """Build and store the content matrix, returning the product count.
+
+    Documents are read in batches and hashed by ``workers`` forked
+    processes. A first pass gathers document frequencies and the SVD
+    training sample, a second pass writes the reduced vectors.
+    """
+    log = log or (lambda message: None)
+    product_ids = np.array(
+        Product.objects.order_by('id').values_list('id', flat=True),
+        dtype=np.int64)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not len(product_ids):
+        np.save(ids_path(path), product_ids)
+        np.save(path, np.zeros((0, 1), dtype=np.float32))
+        return 0
+    paths = category_paths()
+    context = multiprocessing.get_context('fork')
+
+    def documents():
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size].tolist()
+            yield product_documents(batch, paths)
+
+    document_freq = np.zeros(VECTORIZER.n_features, dtype=np.int64)
+    sample = []
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        for done, features in enumerate(
+                _ordered_map(
+                    pool, _hash_documents, documents(), workers * 2),
+                start=1):
+            document_freq += np.bincount(
+                features.indices, minlength=VECTORIZER.n_features)
+            if sum(m.shape[0] for m in sample) < svd_sample:
+                sample.append(features)
+            log(f"Hashed batch {done} of "
+                f"{-(-len(product_ids) // batch_size)}")
+
+    # Keep the most common hashed terms seen in at least min_df products.
+    columns = np.flatnonzero(document_freq >= min_df)
+    if not len(columns):
+        # Too few products to share terms; fall back to every term.
+        columns = np.flatnonzero(document_freq)
+    columns = np.sort(columns[np.argsort(
+        -document_freq[columns], kind='stable')[:max_features]])
+    idf = np.log((1 + len(product_ids)) / (1 + document_freq[columns])) + 1
+    training = _tfidf(sparse.vstack(sample).tocsr(), columns, idf) \
+        if sample and len(columns) else sparse.csr_matrix((0, len(columns)))
+    if training.shape[0] and len(columns) > 1:
+        svd = TruncatedSVD(
+            n_components=min(dimensions, len(columns) - 1),
+            random_state=42)
+        components = svd.fit(training).components_.astype(np.float32)
+    else:
+        components = np.zeros((1, len(columns)), dtype=np.float32)
+
+    _SHARED.update(columns=columns, idf=idf, components=components)
+    tmp_path = f"{path}.tmp.npy"
+    vectors = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.float32,
+        shape=(len(product_ids), components.shape[0]))
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            start = 0
+            for batch_vectors in _ordered_map(
+                    pool, _embed_documents, documents(), workers * 2):
+                vectors[start:start + len(batch_vectors)] = batch_vectors
+                start += len(batch_vectors)
+                log(f"Embedded {start} of {len(product_ids)} products")
+        vectors.flush()
+    finally:
+        _SHARED.clear()
+        del vectors
+
+    np.save(f"{ids_path(path)}.tmp.npy", product_ids)
+    os.replace(f"{ids_path(path)}.tmp.npy", ids_path(path))
+    os.replace(tmp_path, path)
+    return len(product_ids)
+
+
+class ContentIndex:
+    """Memory-mapped content vectors with similarity queries."""
+
+    def __init__(self, product_ids, vectors):
+        self.product_ids = product_ids
+        self.vectors = vectors
+
+    @classmethod
+    def load(cls, path):
+        vectors = np.load(path, mmap_mode='r')
+        product_ids = np.load(ids_path(path))
+        if len(product_ids) != len(vectors):
+            raise ValueError('Content vectors and product IDs differ')
+        return cls(product_ids, vectors)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def subset(self, mask):
+        """Return an in-memory index of the rows where ``mask`` is True.
+
+        Queries then score only those rows instead of paging in and
+        multiplying the whole matrix.
+        """
+        rows = np.flatnonzero(mask)
+        return ContentIndex(
+            self.product_ids[rows], np.ascontiguousarray(self.vectors[rows]))
+
+    def rows(self, product_ids):
+        """Return the matrix rows of the products that are indexed."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        rows = np.searchsorted(self.product_ids, product_ids)
+        rows = np.minimum(rows, max(len(self.product_ids) - 1, 0))
+        found = self.product_ids[rows] == product_ids \
+            if len(self.product_ids) else np.zeros(len(rows), dtype=bool)
+        return rows, found
+
+    def profile(self, product_ids, weights=None):
+        """Return the normalized weighted mean vector of some products."""
+        rows, found = self.rows(product_ids)
+        if not found.any():
+            return None
+        weights = np.ones(len(rows)) if weights is None \
+            else np.asarray(weights, dtype=np.float64)
+        vector = weights[found] @ self.vectors[rows[found]]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def top(self, profile, limit=20, exclude=()):
+        """Return ``{product_id: cosine}`` of the best matching products."""
+        similarity = np.asarray(self.vectors @ profile.astype(np.float32))
+        if len(exclude):
+            rows, found = self.rows(list(exclude))
+            similarity[rows[found]] = -np.inf
+        k = min(limit, len(similarity))
+        if k == 0:
+            return {}
+        top = np.argpartition(-similarity, k - 1)[:k]
+        return {
+            int(self.product_ids[row]): float(similarity[row])
+            for row in top if np.isfinite(similarity[row])
+        }
+
+
+content_index = IndexLoader(
+    getattr(settings, 'CONTENT_VECTORS_PATH', None), ContentIndex.load)
@@ -1,11 +1,22 @@
 import os
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import numpy as np
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from tensorflow.keras.models import load_model
 from tensorflow.keras.losses import mse as mean_squared_error
+from core.metrics import metrics
 from core.models import Product, UserAction
-from django.db.models import Sum
+from product.inventory import in_stock_ids
+from django.db.models import Sum, Case, When
+from recommendation.sessions import session_store
+from recommendation.similarity import similar_products_index
+from recommendation.content import content_index
 import logging
 
 
@@ -13,11 +24,34 @@ logger = logging.getLogger(__name__)
 
 
 class RecommendationService:
-    def __init__(self, model_dir=None):
+    def __init__(
+            self,
+            model_dir=None,
+            sessions=None,
+            neighbours=None,
+            content=None,
+            content_weight=0.5,
+            latency_budget_ms=0,
+            cache_seconds=300,
+            in_stock_only=False):
         self.model = None
         self.user_encoder = None
         self.product_encoder = None
+        self.product_embeddings = None
+        self.product_positions = {}
         self.model_dir = model_dir
+        self.sessions = sessions
+        self.neighbours = neighbours
+        self.content = content
+        self.content_weight = content_weight
+        self._cold_indexes = (None, None)
+        self.latency_budget = latency_budget_ms / 1000
+        self.cache_seconds = cache_seconds
+        self.in_stock_only = in_stock_only
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='recommendation')
+        self._pending = {}
+        self._lock = threading.Lock()
         self._load_models()
 
     def _load_models(self):
@@ -62,58 +96,329 @@ class RecommendationService:
                 logger.warning(
                     f"Product encoder not found at {product_encoder_path}")
 
+            if self.model is not None and self.product_encoder is not None:
+                self._load_product_embeddings()
+
         except Exception as e:
             logger.error(f"Error loading recommendation models: {e}")
 
-    def get_user_recomm(self, user_id, top_n=20):
-        """Get product recommendations for a user"""
-        if not all([
-                self.model, self.user_encoder, self.product_encoder]):
-            logger.warning("Recommendation models not loaded")
+    def _load_product_embeddings(self):
+        """Cache L2-normalized product embeddings of the trained model"""
+        weights = self.model.get_layer(
+            'product_embedding_gmf').get_weights()[0]
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        self.product_embeddings = (
+            weights / np.maximum(norms, 1e-12)).astype(np.float32)
+        self.product_positions = {
+            product_id: position for position, product_id
+            in enumerate(self.product_encoder.classes_)
+        }
+
+    def _cold_index(self, index):
+        """Content index of the products the NCF model has never seen
+
+        Built once per loaded content index, so requests score only the
+        cold rows.
+        """
+        if self._cold_indexes[0] is not index:
+            known = np.array([], dtype=np.int64)
+            if self.product_encoder is not None:
+                known = np.array([
+                    int(pid) for pid in self.product_encoder.classes_
+                    if str(pid).isdigit()], dtype=np.int64)
+            self._cold_indexes = (
+                index, index.subset(~np.isin(index.product_ids, known)))
+        return self._cold_indexes[1]
+
+    def cold_product_scores(
+            self, product_ids, weights=None, limit=20, exclude=()):
+        """Score cold products by content similarity to some products.
+
+        Only products absent from the NCF product encoder are returned,
+        as ``{product_id: score}`` scaled by the content weight.
+        """
+        index = self.content.get() if self.content else None
+        if index is None or len(product_ids) == 0:
+            return {}
+        profile = index.profile(product_ids, weights)
+        if profile is None:
+            return {}
+        matches = self._cold_index(index).top(
+            profile,
+            limit=limit,
+            exclude=exclude)
+        return {
+            product_id: self.content_weight * score
+            for product_id, score in matches.items()
+        }
+
+    def _user_history(self, user_id, limit=50):
+        """Return the user's latest (product_id, score) interactions"""
+        history = UserAction.objects.filter(
+            user_id=str(user_id),
+            product_id__regex=r'^[0-9]+$',
+            score__gt=0,
+        ).order_by('-event_time').values_list(
+            'product_id', 'score')[:limit]
+        return [(int(pid), score) for pid, score in history]
+
+    @staticmethod
+    def _top_ids(scores, top_n):
+        """Return the IDs of the best scored products, best first"""
+        return sorted(scores, key=scores.get, reverse=True)[:top_n]
+
+    @staticmethod
+    def _ranked_products(product_ids):
+        """Return the products as a queryset in the given order"""
+        if not product_ids:
             return Product.objects.none()
+        return Product.objects.filter(id__in=product_ids).order_by(Case(
+            *[When(id=pid, then=rank) for rank, pid in enumerate(product_ids)]
+        ))
+
+    def _popular_ids(self, top_n):
+        """Return the most purchased products, cached for a while"""
+        key = f"recommendations:popular:{top_n}"
+        product_ids = cache.get(key)
+        if product_ids is None:
+            product_ids = [
+                int(pid) for pid in UserAction.objects.filter(
+                    event_type='purchase',
+                    product_id__regex=r'^[0-9]+$')
+                .values('product_id')
+                .annotate(total_score=Sum('score'))
+                .order_by('-total_score')[:top_n]
+                .values_list('product_id', flat=True)
+            ]
+            cache.set(key, product_ids, self.cache_seconds)
+        return product_ids
+
+    def session_scores(self, product_ids):
+        """Score candidate products for a session of recent products.
+
+        Averages the trained embeddings of the session products and adds
+        the precomputed co-view neighbours of each one, weighting recent
+        products higher. Cold products are scored by content similarity.
+        Returns ``{product_id: score}``.
+        """
+        scores = {}
+        if len(product_ids) == 0:
+            return scores
+        # The newest product weighs 1, older ones decay geometrically.
+        recency = 0.8 ** np.arange(len(product_ids))[::-1]
+
+        if self.product_embeddings is not None:
+            known = [
+                (self.product_positions[str(pid)], weight)
+                for pid, weight in zip(product_ids, recency)
+                if str(pid) in self.product_positions
+            ]
+            if known:
+                positions, weights = map(np.array, zip(*known))
+                session_vector = weights @ self.product_embeddings[positions]
+                similarity = self.product_embeddings @ (
+                    session_vector / max(np.linalg.norm(session_vector),
+                                         1e-12))
+                top = np.argpartition(
+                    -similarity, min(len(similarity) - 1, 200))[:200]
+                for position in top:
+                    product_id = int(self.product_encoder.classes_[position])
+                    scores[product_id] = float(similarity[position])
+
+        index = self.neighbours.get() if self.neighbours else None
+        if index is not None:
+            for product_id, weight in zip(product_ids, recency):
+                for neighbour, score in index.similar(product_id):
+                    scores[neighbour] = scores.get(neighbour, 0.0) \
+                        + weight * score
+
+        for product_id, score in self.cold_product_scores(
+                product_ids, recency, limit=50).items():
+            scores[product_id] = scores.get(product_id, 0.0) + score
+
+        for product_id in set(int(pid) for pid in product_ids):
+            scores.pop(product_id, None)
+        return scores
+
+    def get_session_recomm(self, user_id, top_n=20):
+        """Get real-time recommendations from the user's recent products
+
+        Returns None when the session gives nothing to recommend.
+        """
+        if self.sessions is None:
+            return None
+        product_ids = self._session_ids(self.sessions.recent(user_id), top_n)
+        if not product_ids:
+            return None
+        return self._ranked_products(product_ids)
+
+    def _session_ids(self, session, top_n):
+        with metrics.timer('recommendation.scoring'):
+            scores = self.session_scores(session)
+        with metrics.timer('recommendation.top_k'):
+            return self._top_ids(scores, top_n)
+
+    def recommend_ids(self, user_id, top_n=20):
+        """Compute the recommended product IDs for a user, best first"""
+        models_loaded = all([
+            self.model, self.user_encoder, self.product_encoder])
+        with metrics.timer('recommendation.id_lookup'):
+            known_user = models_loaded \
+                and str(user_id) in self.user_encoder.classes_
+            session = self.sessions.recent(user_id) \
+                if self.sessions is not None and not known_user else []
+
+        if not known_user:
+            # Personalize from the current session before falling back
+            product_ids = self._session_ids(session, top_n)
+            if product_ids:
+                return product_ids
+
+        if not models_loaded:
+            logger.warning("Recommendation models not loaded")
+            return []
 
         print('Found model and encoders, generating recommendations...')
 
         try:
-            if str(user_id) not in self.user_encoder.classes_:
+            if not known_user:
                 # Return popular products based on purchase actions
                 print("Returning popular products for new user...")
-                popular_product_ids = UserAction.objects.filter(
-                    event_type='purchase') \
-                    .values('product_id') \
-                    .annotate(total_score=Sum('score')) \
-                    .order_by('-total_score')[:top_n] \
-                    .values_list('product_id', flat=True)
-
-                return Product.objects.filter(
-                    id__in=[int(pid) for pid in popular_product_ids])
+                return self._popular_ids(top_n)
 
-            user_idx = self.user_encoder.transform([str(user_id)])[0]
-            product_indices = np.arange(
-                len(self.product_encoder.classes_))
-            user_array = np.array([user_idx] * len(product_indices))
+            with metrics.timer('recommendation.id_lookup'):
+                user_idx = self.user_encoder.transform([str(user_id)])[0]
+                product_indices = np.arange(
+                    len(self.product_encoder.classes_))
+                user_array = np.array([user_idx] * len(product_indices))
+                history = self._user_history(user_id)
 
             # Predict scores
-            predictions = self.model.predict(
-                [user_array, product_indices], batch_size=64)
-            predictions = predictions.flatten()
+            with metrics.timer('recommendation.scoring'):
+                predictions = self.model.predict(
+                    [user_array, product_indices], batch_size=64)
+                predictions = predictions.flatten()
 
-            # Get top N products
-            top_indices = np.argsort(predictions)[-top_n:][::-1]
-            recommended_product_ids = self.product_encoder.inverse_transform(
-                top_indices)
+            with metrics.timer('recommendation.top_k'):
+                # Get top N products
+                top_indices = np.argsort(predictions)[-top_n:][::-1]
+                recommended_product_ids = \
+                    self.product_encoder.inverse_transform(top_indices)
+                scores = {
+                    int(pid): float(predictions[idx])
+                    for pid, idx in zip(recommended_product_ids, top_indices)
+                }
 
-            # Return Django Product objects
-            return Product.objects.filter(
-                id__in=recommended_product_ids)
+                # Blend in cold products similar to what the user
+                # interacted with
+                if history:
+                    history_ids, weights = zip(*history)
+                    scores.update(self.cold_product_scores(
+                        history_ids, weights, limit=top_n,
+                        exclude=history_ids))
+                return self._top_ids(scores, top_n)
 
         except Exception as e:
             logger.error(
                 f"Error generating recommendations for user {user_id}: {e}")
-            return Product.objects.none()
+            return []
+
+    @staticmethod
+    def _acted_key(user_id):
+        return f"recommendations:acted:{user_id}"
+
+    def record_action(self, user_id):
+        """Stop serving recommendations computed before a user's action"""
+        cache.set(self._acted_key(user_id), time.time(), self.cache_seconds)
+
+    def _compute(self, key, user_id, top_n):
+        """Compute and cache recommendations in a worker thread
+
+        Results are not cached if the user acted while they were scored.
+        """
+        try:
+            started = time.time()
+            product_ids = self.recommend_ids(user_id, top_n)
+            if cache.get(self._acted_key(user_id), 0) <= started:
+                cache.set(key, (started, product_ids), self.cache_seconds)
+            return product_ids
+        finally:
+            # Worker threads open their own database connection.
+            connection.close()
+
+    def _submit(self, key, user_id, top_n):
+        """Start computing recommendations unless already in progress"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(
+                    self._compute, key, user_id, top_n)
+                self._pending[key] = future
+                future.add_done_callback(
+                    lambda _: self._pending.pop(key, None))
+        return future
+
+    def get_user_recomm_ids(self, user_id, top_n=20):
+        """Get the IDs of the products recommended to a user, best first
+
+        With ``in_stock_only``, out-of-stock products are masked out of
+        twice as many candidates.
+        """
+        if not self.in_stock_only:
+            return self._recomm_ids(user_id, top_n)
+        return in_stock_ids(self._recomm_ids(user_id, top_n * 2))[:top_n]
+
+    def _recomm_ids(self, user_id, top_n):
+        """Get the recommended product IDs within the latency budget
+
+        With a latency budget, cached recommendations are served first and
+        recomputed in the background once older than half of
+        ``cache_seconds``. Only a cache miss scores the user; scoring that
+        does not finish in time is left to complete in the background and
+        fill the cache, while the request gets the popular products.
+        Results computed before the user's last logged action are a miss,
+        so session recommendations follow the first clicks at once.
+        """
+        key = f"recommendations:user:{user_id}:{top_n}"
+        if not self.latency_budget:
+            return self.recommend_ids(user_id, top_n)
+        found = cache.get_many([key, self._acted_key(user_id)])
+        cached = found.get(key)
+        if cached is not None \
+                and cached[0] >= found.get(self._acted_key(user_id), 0):
+            computed_at, product_ids = cached
+            metrics.incr('recommendation.cache_hit')
+            if time.time() - computed_at > self.cache_seconds / 2:
+                self._submit(key, user_id, top_n)
+            return product_ids
+        future = self._submit(key, user_id, top_n)
+        try:
+            return future.result(timeout=self.latency_budget)
+        except FutureTimeoutError:
+            metrics.incr('recommendation.budget_miss')
+            metrics.incr('recommendation.popular_fallback')
+            logger.warning(
+                f"Recommendations for user {user_id} exceeded "
+                f"the {self.latency_budget * 1000:.0f}ms budget")
+            return self._popular_ids(top_n)
+
+    def get_user_recomm(self, user_id, top_n=20):
+        """Get product recommendations for a user"""
+        with metrics.timer('recommendation.request'):
+            product_ids = self.get_user_recomm_ids(user_id, top_n)
+            with metrics.timer('recommendation.hydration'):
+                return list(self._ranked_products(product_ids))
 
 
 # Global instance
 recomm_svc = RecommendationService(
-    model_dir=getattr(settings, 'RECOMMENDATION_MODEL_DIR', None)
+    model_dir=getattr(settings, 'RECOMMENDATION_MODEL_DIR', None),
+    sessions=session_store,
+    neighbours=similar_products_index,
+    content=content_index,
+    content_weight=getattr(settings, 'RECOMMENDATION_CONTENT_WEIGHT', 0.5),
+    latency_budget_ms=getattr(
+        settings, 'RECOMMENDATION_LATENCY_BUDGET_MS', 0),
+    cache_seconds=getattr(settings, 'RECOMMENDATION_CACHE_SECONDS', 300),
+    in_stock_only=getattr(settings, 'RECOMMENDATION_IN_STOCK_ONLY', False),
 )
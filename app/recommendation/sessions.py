@@ -0,0 +1,123 @@
+"""
+Short-term user sessions for real-time recommendations.
+
+Each user gets a bounded ring buffer holding the IDs of the products they
+touched last, fed by LogUserActionView. A buffer that this worker has not
+seen yet (or that went idle) is seeded from the user's latest UserAction
+rows, so sessions survive worker restarts and requests served elsewhere.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import UserAction
+
+
+SESSION_EVENT_TYPES = ('view', 'cart', 'purchase')
+
+
+class RingBuffer:
+    """Fixed-size buffer of the most recent product IDs."""
+
+    __slots__ = ('items', 'count', 'touched')
+
+    def __init__(self, size):
+        self.items = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self.touched = time.monotonic()
+
+    def push(self, product_id):
+        self.items[self.count % len(self.items)] = product_id
+        self.count += 1
+        self.touched = time.monotonic()
+
+    def last(self):
+        """Return the newest product ID, or None when empty."""
+        if not self.count:
+            return None
+        return int(self.items[(self.count - 1) % len(self.items)])
+
+    def recent(self):
+        """Return the stored product IDs, oldest first."""
+        size = len(self.items)
+        if self.count <= size:
+            return self.items[:self.count].copy()
+        start = self.count % size
+        return np.concatenate((self.items[start:], self.items[:start]))
+
+
+class SessionStore:
+    """Per-user ring buffers with LRU eviction and idle expiry."""
+
+    def __init__(self, size=20, max_users=100000, idle_seconds=1800):
+        self.size = size
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, user_id, product_id):
+        """Append a product to the user's session.
+
+        Call this after the UserAction row is saved: a session seeded
+        from the database already ends with it.
+        """
+        product_id = int(product_id)
+        buffer, loaded = self._buffer(str(user_id))
+        with self._lock:
+            if not loaded or buffer.last() != product_id:
+                buffer.push(product_id)
+
+    def recent(self, user_id):
+        """Return the user's session products, oldest first."""
+        buffer, _ = self._buffer(str(user_id))
+        return buffer.recent()
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+    def _buffer(self, user_id):
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None and \
+                    time.monotonic() - buffer.touched < self.idle_seconds:
+                self._buffers.move_to_end(user_id)
+                return buffer, False
+
+        buffer = self._load(user_id)
+        with self._lock:
+            self._buffers[user_id] = buffer
+            self._buffers.move_to_end(user_id)
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+        return buffer, True
+
+    def _load(self, user_id):
+        """Seed a buffer from the user's latest actions."""
+        since = timezone.now() - timezone.timedelta(
+            seconds=self.idle_seconds)
+        product_ids = UserAction.objects.filter(
+            user_id=user_id,
+            event_type__in=SESSION_EVENT_TYPES,
+            event_time__gte=since,
+            product_id__regex=r'^[0-9]+$',
+        ).order_by('-event_time').values_list(
+            'product_id', flat=True)[:self.size]
+
+        buffer = RingBuffer(self.size)
+        for product_id in reversed(list(product_ids)):
+            buffer.push(int(product_id))
+        return buffer
+
+
+# Global instance
+session_store = SessionStore(
+    size=getattr(settings, 'RECOMMENDATION_SESSION_SIZE', 20),
+    idle_seconds=getattr(
+        settings, 'RECOMMENDATION_SESSION_IDLE_SECONDS', 1800),
+)
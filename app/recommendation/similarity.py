@@ -0,0 +1,284 @@
+"""
+Item-to-item similarity from co-viewed products.
+
+An offline job splits view/cart events of UserAction into sessions, builds
+a sparse session x product matrix and multiplies it with itself to count
+how often two products appear in the same session. The counts are
+normalized (cosine or Jaccard) and only the top-K neighbours of each
+product are kept in a CSR-like array file that the API reads directly.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from django.conf import settings
+from django.db import connection
+
+from core.models import UserAction
+
+
+logger = logging.getLogger(__name__)
+
+MEASURES = ('cosine', 'jaccard')
+
+
+class NeighbourIndex:
+    """Top-K neighbours per product stored as CSR-like arrays.
+
+    ``product_ids`` is sorted; the neighbours of ``product_ids[i]`` are
+    ``product_ids[neighbours[indptr[i]:indptr[i + 1]]]`` with matching
+    ``scores``, best first. Extra per-neighbour arrays (for example
+    association-rule statistics) can be stored alongside.
+    """
+
+    def __init__(self, product_ids, indptr, neighbours, scores, extras=None):
+        self.product_ids = product_ids
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.scores = scores
+        self.extras = extras or {}
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by ``save``."""
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        extras = {
+            name[len('extra_'):]: arrays.pop(name)
+            for name in list(arrays) if name.startswith('extra_')
+        }
+        return cls(extras=extras, **arrays)
+
+    def save(self, path):
+        """Atomically write the index to ``path``."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            product_ids=self.product_ids,
+            indptr=self.indptr,
+            neighbours=self.neighbours,
+            scores=self.scores,
+            **{f"extra_{name}": v for name, v in self.extras.items()},
+        )
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def lookup(self, product_id, limit=None):
+        """Return ``(neighbour_ids, slice)`` for a product, best first.
+
+        The slice addresses ``scores`` and ``extras`` for the same rows.
+        """
+        row = np.searchsorted(self.product_ids, int(product_id))
+        if row >= len(self.product_ids) \
+                or self.product_ids[row] != int(product_id):
+            return np.array([], dtype=np.int64), slice(0, 0)
+        start, end = self.indptr[row], self.indptr[row + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.product_ids[self.neighbours[start:end]], slice(start, end)
+
+    def similar(self, product_id, limit=None):
+        """Return ``[(neighbour_id, score), ...]`` for a product."""
+        ids, rows = self.lookup(product_id, limit)
+        return list(zip(ids.tolist(), self.scores[rows].tolist()))
+
+
+class IndexLoader:
+    """Lazily load an index file and reload it when it is rebuilt."""
+
+    def __init__(self, path, load=None):
+        self.path = path
+        self.load = load or NeighbourIndex.load
+        self._index = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current index, or None if it was never built."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except (OSError, TypeError):
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._index = self.load(self.path)
+                        self._mtime = mtime
+                        logger.info(f"Loaded index {self.path}")
+                    except Exception as e:
+                        logger.error(f"Error loading index {self.path}: {e}")
+        return self._index
+
+
+def top_k_entries(rows, cols, scores, num_rows, k):
+    """Select the ``k`` highest scoring entries of each row.
+
+    Takes COO-style parallel arrays and returns ``(indptr, positions)``
+    where ``positions`` index the input arrays grouped by row, best first.
+    """
+    order = np.lexsort((cols, -scores, rows))
+    sorted_rows = rows[order]
+    counts = np.bincount(sorted_rows, minlength=num_rows)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    rank = np.arange(len(order)) - starts[sorted_rows]
+
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.minimum(counts, k), out=indptr[1:])
+    return indptr, order[rank < k]
+
+
+def top_k_per_row(matrix, k):
+    """Keep the ``k`` largest positive entries of each row of a matrix.
+
+    Returns ``(indptr, indices, data)`` with every row sorted by
+    descending value.
+    """
+    coo = matrix.tocoo()
+    keep = coo.data > 0
+    rows, cols, data = coo.row[keep], coo.col[keep], coo.data[keep]
+    indptr, positions = top_k_entries(rows, cols, data, matrix.shape[0], k)
+    return indptr, cols[positions], data[positions]
+
+
+def read_sessions(session_gap=1800, event_types=('view', 'cart')):
+    """Return ``(session_codes, product_ids)`` for the chosen events.
+
+    Events are streamed out of PostgreSQL with COPY. A session ends when
+    the user is idle for more than ``session_gap`` seconds.
+    """
+    table = connection.ops.quote_name(UserAction._meta.db_table)
+    types = ', '.join(f"'{event_type}'" for event_type in event_types)
+    buffer = io.BytesIO()
+    with connection.cursor() as cursor:
+        with cursor.copy(
+                "COPY (SELECT user_id, product_id::bigint, "
+                "extract(epoch FROM event_time) "
+                f"FROM {table} WHERE event_type IN ({types}) "
+                "AND product_id ~ '^[0-9]+$' "
+                "ORDER BY user_id, event_time) "
+                "TO STDOUT WITH (FORMAT csv)") as copy:
+            for block in copy:
+                buffer.write(block)
+    buffer.seek(0)
+    if not buffer.getbuffer().nbytes:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    events = pd.read_csv(
+        buffer,
+        header=None,
+        names=['user_id', 'product_id', 'ts'],
+        dtype={'user_id': str, 'product_id': np.int64, 'ts': np.float64},
+    )
+    user_changed = events['user_id'].ne(events['user_id'].shift())
+    idle = events['ts'].diff().gt(session_gap)
+    sessions = (user_changed | idle).cumsum().to_numpy() - 1
+    return sessions, events['product_id'].to_numpy()
+
+
+def incidence_matrix(rows, product_ids):
+    """Build a binary rows x products CSR matrix.
+
+    Returns ``(matrix, unique_product_ids)``; columns follow the sorted
+    product IDs.
+    """
+    unique_ids, cols = np.unique(product_ids, return_inverse=True)
+    _, rows = np.unique(rows, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(rows.max() + 1 if len(rows) else 0, len(unique_ids)),
+    )
+    # Repeated events of one product within a row count once.
+    matrix.data[:] = 1.0
+    return matrix, unique_ids
+
+
+# Matrices shared with forked shard workers without pickling them.
+_SHARED = {}
+
+
+def _similarity_shard(start, end, k, measure):
+    """Top-K normalized co-occurrence for products ``start:end``."""
+    matrix, by_product, counts = (
+        _SHARED['matrix'], _SHARED['by_product'], _SHARED['counts'])
+    co = (by_product[start:end] @ matrix).tocoo()
+    # A product is not its own neighbour.
+    keep = co.row + start != co.col
+    rows, cols, both = co.row[keep], co.col[keep], co.data[keep]
+    if measure == 'jaccard':
+        scores = both / (counts[rows + start] + counts[cols] - both)
+    else:
+        scores = both / np.sqrt(counts[rows + start] * counts[cols])
+    shard = sparse.csr_matrix(
+        (scores.astype(np.float32), (rows, cols)),
+        shape=(end - start, matrix.shape[1]))
+    return top_k_per_row(shard, k)
+
+
+def build_similarity_index(
+        rows,
+        product_ids,
+        k=20,
+        measure='cosine',
+        shards=1,
+        workers=1):
+    """Build a co-occurrence ``NeighbourIndex`` from (row, product) pairs.
+
+    ``rows`` groups the products that occur together, such as sessions.
+    Products are split into ``shards`` contiguous ranges which are scored
+    in parallel by ``workers`` processes.
+    """
+    if measure not in MEASURES:
+        raise ValueError(f"measure must be one of {MEASURES}")
+    if len(product_ids) == 0:
+        return NeighbourIndex(
+            np.array([], dtype=np.int64),
+            np.zeros(1, dtype=np.int64),
+            np.array([], dtype=np.int32),
+            np.array([], dtype=np.float32))
+    matrix, unique_ids = incidence_matrix(rows, product_ids)
+    num_products = len(unique_ids)
+    _SHARED.update(
+        matrix=matrix,
+        by_product=matrix.T.tocsr(),
+        counts=np.asarray(matrix.sum(axis=0)).ravel(),
+    )
+    bounds = np.linspace(0, num_products, max(shards, 1) + 1).astype(int)
+    ranges = [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    try:
+        if workers > 1 and len(ranges) > 1:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                results = list(pool.map(
+                    _similarity_shard,
+                    *zip(*[(a, b, k, measure) for a, b in ranges])))
+        else:
+            results = [
+                _similarity_shard(a, b, k, measure) for a, b in ranges]
+    finally:
+        _SHARED.clear()
+
+    indptr = np.zeros(num_products + 1, dtype=np.int64)
+    offset = 0
+    for (start, end), (shard_indptr, _, _) in zip(ranges, results):
+        indptr[start + 1:end + 1] = shard_indptr[1:] + offset
+        offset += shard_indptr[-1]
+    neighbours = np.concatenate(
+        [r[1] for r in results] or [np.array([])]).astype(np.int32)
+    scores = np.concatenate(
+        [r[2] for r in results] or [np.array([])]).astype(np.float32)
+    return NeighbourIndex(unique_ids, indptr, neighbours, scores)
+
+
+similar_products_index = IndexLoader(
+    getattr(settings, 'SIMILAR_PRODUCTS_INDEX_PATH', None))
@@ -0,0 +1,192 @@
+"""
+Tests for frequently bought together mining.
+"""
+from unittest.mock import patch
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    CartItem,
+    Order,
+    OrderItem,
+    Product,
+    ProductDetail,
+)
+from recommendation.associations import (
+    BasketCounts,
+    read_baskets,
+    update_counts,
+)
+
+
+FBT_URL = reverse('cart:cart-item-frequently-bought-together')
+
+
+class BasketCountsTests(TestCase):
+    """Test association rule statistics."""
+
+    def test_rules_statistics(self):
+        """Test support, confidence and lift of mined pairs."""
+        counts = BasketCounts.empty()
+        counts.add(
+            np.array([1, 1, 2, 2, 3, 4]),
+            np.array([10, 20, 10, 20, 10, 30]))
+
+        index = counts.rules(k=5, min_count=1)
+        ids, rows = index.lookup(10)
+
+        self.assertEqual(ids.tolist(), [20])
+        self.assertAlmostEqual(index.extras['support'][rows][0], 0.5)
+        self.assertAlmostEqual(
+            index.extras['confidence'][rows][0], 2 / 3, places=5)
+        self.assertAlmostEqual(
+            index.extras['lift'][rows][0], (2 / 3) / 0.5, places=5)
+        self.assertEqual(index.similar(30), [])
+
+    def test_incremental_add_matches_full_build(self):
+        """Test adding baskets in two runs equals one full run."""
+        orders = np.array([1, 1, 2, 2, 2, 3, 3])
+        products = np.array([1, 2, 1, 2, 3, 3, 4])
+        full = BasketCounts.empty()
+        full.add(orders, products)
+
+        incremental = BasketCounts.empty()
+        incremental.add(orders[:2], products[:2])
+        incremental.add(orders[2:], products[2:])
+
+        self.assertEqual(
+            incremental.product_ids.tolist(), full.product_ids.tolist())
+        self.assertEqual(
+            (incremental.pair_counts != full.pair_counts).nnz, 0)
+        self.assertEqual(incremental.num_baskets, 3)
+        self.assertEqual(incremental.last_order_id, 3)
+
+    def test_remove_undoes_add(self):
+        """Test removing a basket equals never adding it."""
+        orders = np.array([1, 1, 2, 2, 2, 3, 3])
+        products = np.array([1, 2, 1, 2, 3, 3, 4])
+        counts = BasketCounts.empty()
+        counts.add(orders, products)
+        without = BasketCounts.empty()
+        without.add(orders[orders != 2], products[orders != 2])
+
+        counts.remove(orders[orders == 2], products[orders == 2])
+
+        self.assertEqual(counts.num_baskets, 2)
+        self.assertEqual(
+            (counts.rules(min_count=1).neighbours
+             != without.rules(min_count=1).neighbours).sum(), 0)
+        self.assertEqual(counts.pair_counts[0, 2], 0)
+
+
+class FrequentlyBoughtTogetherApiTests(TestCase):
+    """Test cart suggestions and basket extraction."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(name=f'P{i}') for i in range(3)]
+        self.details = [
+            ProductDetail.objects.create(product=p, price=10)
+            for p in self.products]
+
+    def _order(self, *details, status='pending'):
+        order = Order.objects.create(user=self.user, order_status=status)
+        for detail in details:
+            OrderItem.objects.create(order=order, product_detail=detail)
+        return order
+
+    def test_read_baskets_skips_old_and_cancelled_orders(self):
+        """Test only new, non-cancelled orders are mined."""
+        old = self._order(self.details[0])
+        self._order(self.details[1], status='cancelled')
+        new = self._order(self.details[1], self.details[2])
+
+        order_ids, product_ids = read_baskets(after_order_id=old.id)
+
+        self.assertEqual(set(order_ids.tolist()), {new.id})
+        self.assertEqual(
+            sorted(product_ids.tolist()),
+            [self.products[1].id, self.products[2].id])
+
+    def test_cancelled_orders_are_taken_out(self):
+        """Test orders cancelled after being mined are removed later."""
+        first = self._order(self.details[0], self.details[1])
+        second = self._order(self.details[0], self.details[1])
+        counts = BasketCounts.empty()
+        self.assertEqual(update_counts(counts), (2, 0))
+        self.assertEqual(
+            counts.pending_order_ids.tolist(), [first.id, second.id])
+
+        Order.objects.filter(pk=first.pk).update(order_status='cancelled')
+        Order.objects.filter(pk=second.pk).update(order_status='shipped')
+        third = self._order(self.details[2])
+
+        self.assertEqual(update_counts(counts), (1, 1))
+        self.assertEqual(counts.num_baskets, 2)
+        self.assertEqual(counts.pending_order_ids.tolist(), [third.id])
+        self.assertEqual(counts.pair_counts.max(), 1)
+
+    def test_late_committed_order_is_counted(self):
+        """Test an order appearing below the last mined ID is counted."""
+        first = self._order(self.details[0], self.details[1])
+        last = Order.objects.create(
+            pk=first.pk + 3, user=self.user, order_status='shipped')
+        OrderItem.objects.create(order=last, product_detail=self.details[0])
+        counts = BasketCounts.empty()
+        self.assertEqual(update_counts(counts), (2, 0))
+
+        late = Order.objects.create(
+            pk=first.pk + 1, user=self.user, order_status='shipped')
+        OrderItem.objects.create(order=late, product_detail=self.details[2])
+
+        self.assertEqual(update_counts(counts), (1, 0))
+        self.assertEqual(update_counts(counts), (0, 0))
+        self.assertEqual(counts.num_baskets, 3)
+        self.assertEqual(counts.last_order_id, last.pk)
+
+    def test_limit_is_clamped(self):
+        """Test a limit below 1 still suggests one product."""
+        for _ in range(2):
+            self._order(self.details[0], self.details[1], self.details[2])
+        counts = BasketCounts.empty()
+        counts.add(*read_baskets())
+        CartItem.objects.create(
+            cart=self.user.cart, product_detail=self.details[0])
+
+        with patch(
+                'cart.views.frequently_bought_together_index.get',
+                return_value=counts.rules(min_count=1)):
+            res = self.client.get(FBT_URL, {'limit': 0})
+
+        self.assertEqual(len(res.data['products']), 1)
+
+    def test_suggestions_for_cart(self):
+        """Test products in the cart are excluded from suggestions."""
+        for _ in range(2):
+            self._order(self.details[0], self.details[1], self.details[2])
+        counts = BasketCounts.empty()
+        counts.add(*read_baskets())
+        CartItem.objects.create(
+            cart=self.user.cart, product_detail=self.details[0])
+        CartItem.objects.create(
+            cart=self.user.cart, product_detail=self.details[1])
+
+        with patch(
+                'cart.views.frequently_bought_together_index.get',
+                return_value=counts.rules(min_count=1)):
+            res = self.client.get(FBT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [p['id'] for p in res.data['products']], [self.products[2].id])
@@ -0,0 +1,105 @@
+"""
+Tests for content vectors of cold-start products.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from django.test import TestCase
+
+from core.models import Category, Product
+from recommendation.content import ContentIndex, build_content_vectors
+from recommendation.services import RecommendationService
+from recommendation.sessions import SessionStore
+
+
+class StaticIndex:
+    """Index loader returning a fixed index."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+
+class ContentVectorTests(TestCase):
+    """Test building and querying content vectors."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'content.npy')
+        shoes = Category.objects.create(name='Shoes')
+        running = Category.objects.create(
+            name='Running', parent_category=shoes)
+        kitchen = Category.objects.create(name='Kitchen')
+        self.sneaker = Product.objects.create(
+            name='Running sneaker', description='Light mesh running shoe')
+        self.trainer = Product.objects.create(
+            name='Trail running shoe', description='Mesh upper shoe')
+        self.pan = Product.objects.create(
+            name='Frying pan', description='Cast iron kitchen pan')
+        self.pot = Product.objects.create(
+            name='Cooking pot', description='Cast iron kitchen pot')
+        self.sneaker.category.add(running)
+        self.trainer.category.add(running)
+        self.pan.category.add(kitchen)
+        self.pot.category.add(kitchen)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_similar_products_share_content(self):
+        """Test products with similar text are nearest to each other."""
+        count = build_content_vectors(
+            self.path, dimensions=4, batch_size=3, min_df=1)
+        index = ContentIndex.load(self.path)
+
+        self.assertEqual(count, 4)
+        self.assertEqual(index.vectors.shape[0], 4)
+        profile = index.profile([self.sneaker.id])
+        top = index.top(profile, limit=1, exclude=[self.sneaker.id])
+        self.assertEqual(list(top), [self.trainer.id])
+
+    def test_subset_scores_only_its_rows(self):
+        """Test a subset index is in memory and matches the full scores."""
+        build_content_vectors(self.path, dimensions=4, min_df=1)
+        index = ContentIndex.load(self.path)
+        profile = index.profile([self.sneaker.id])
+
+        cold = index.subset(index.product_ids != self.trainer.id)
+
+        self.assertNotIsInstance(cold.vectors, np.memmap)
+        self.assertEqual(len(cold), 3)
+        full = index.top(profile, limit=4)
+        top = cold.top(profile, limit=4)
+        self.assertNotIn(self.trainer.id, top)
+        for product_id, score in top.items():
+            self.assertAlmostEqual(score, full[product_id], places=5)
+
+    def test_empty_catalog(self):
+        """Test building without products writes an empty index."""
+        Product.objects.all().delete()
+
+        self.assertEqual(build_content_vectors(self.path), 0)
+        self.assertEqual(len(ContentIndex.load(self.path)), 0)
+
+    def test_cold_products_blended_into_session(self):
+        """Test cold products similar to the session are recommended."""
+        build_content_vectors(self.path, dimensions=4, min_df=1)
+        store = SessionStore()
+        service = RecommendationService(
+            model_dir=tempfile.gettempdir(),
+            sessions=store,
+            content=StaticIndex(ContentIndex.load(self.path)))
+        # The pan is known to the NCF model and is never scored by content.
+        service.product_encoder = type(
+            'Encoder', (), {'classes_': np.array([str(self.pan.id)])})
+        store.record('9', self.sneaker.id)
+
+        scores = service.session_scores(store.recent('9'))
+
+        self.assertNotIn(self.pan.id, scores)
+        self.assertNotIn(self.sneaker.id, scores)
+        self.assertEqual(max(scores, key=scores.get), self.trainer.id)
@@ -0,0 +1,124 @@
+"""
+Tests for the recommendation latency budget.
+"""
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.metrics import metrics
+from core.models import Product, UserAction
+from recommendation.services import RecommendationService
+from recommendation.sessions import SessionStore
+from recommendation.trending import TrendingEngine
+
+
+class LatencyBudgetTests(TestCase):
+    """Test falling back when scoring exceeds the latency budget."""
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.products = [
+            Product.objects.create(name=f'P{i}') for i in range(3)]
+        self.service = RecommendationService(
+            model_dir=tempfile.gettempdir(), latency_budget_ms=50)
+
+    def slow_recommend_ids(self, delay):
+        def recommend_ids(user_id, top_n=20):
+            time.sleep(delay)
+            return [self.products[2].id, self.products[1].id]
+        return recommend_ids
+
+    def wait_for_background(self):
+        for future in list(self.service._pending.values()):
+            future.result()
+
+    def test_fast_scoring_within_budget(self):
+        """Test results that finish in time are returned in rank order."""
+        self.service.recommend_ids = self.slow_recommend_ids(0)
+
+        products = self.service.get_user_recomm('9', top_n=2)
+
+        self.assertEqual(products, [self.products[2], self.products[1]])
+        self.assertEqual(metrics.counter('recommendation.budget_miss'), 0)
+
+    def test_budget_miss_falls_back_to_popular(self):
+        """Test popular products are served while scoring continues."""
+        UserAction.objects.create(
+            user_id='1', product_id=str(self.products[0].id),
+            event_type='purchase', score=5.0)
+        self.service.recommend_ids = self.slow_recommend_ids(0.3)
+
+        products = self.service.get_user_recomm('9', top_n=2)
+
+        self.assertEqual(products, [self.products[0]])
+        self.assertEqual(metrics.counter('recommendation.budget_miss'), 1)
+        self.assertEqual(
+            metrics.counter('recommendation.popular_fallback'), 1)
+
+        # The background computation fills the cache for the next request.
+        self.wait_for_background()
+        products = self.service.get_user_recomm('9', top_n=2)
+        self.assertEqual(products, [self.products[2], self.products[1]])
+        self.assertEqual(metrics.counter('recommendation.budget_miss'), 1)
+        self.assertEqual(metrics.counter('recommendation.cache_hit'), 1)
+
+    def test_cache_served_before_scoring(self):
+        """Test cached results are served and refreshed when old."""
+        self.service.recommend_ids = self.slow_recommend_ids(0.3)
+        key = 'recommendations:user:9:2'
+        cache.set(key, (time.time(), [self.products[0].id]), 300)
+
+        self.assertEqual(
+            self.service.get_user_recomm_ids('9', top_n=2),
+            [self.products[0].id])
+        self.assertEqual(self.service._pending, {})
+
+        cache.set(key, (time.time() - 200, [self.products[0].id]), 300)
+        self.assertEqual(
+            self.service.get_user_recomm_ids('9', top_n=2),
+            [self.products[0].id])
+        self.wait_for_background()
+        self.assertEqual(
+            cache.get(key)[1], [self.products[2].id, self.products[1].id])
+        self.assertEqual(metrics.counter('recommendation.budget_miss'), 0)
+
+    def test_logged_action_skips_cache(self):
+        """Test the first result after a click is computed again."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.service.recommend_ids = self.slow_recommend_ids(0)
+        cache.set(
+            f'recommendations:user:{user.id}:2',
+            (time.time() - 1, [self.products[0].id]), 300)
+        self.assertEqual(
+            self.service.get_user_recomm_ids(user.id, top_n=2),
+            [self.products[0].id])
+
+        # The global engines would write their snapshots and sessions
+        with mock.patch('recommendation.views.trending_engine',
+                        TrendingEngine()), \
+                mock.patch('recommendation.views.session_store',
+                           SessionStore()):
+            client.post(reverse('recommendation:user-action'), {
+                'product_id': self.products[1].id, 'event_type': 'view'})
+
+        self.assertEqual(
+            self.service.get_user_recomm_ids(user.id, top_n=2),
+            [self.products[2].id, self.products[1].id])
+
+    def test_stage_timings_recorded(self):
+        """Test each request records its stage timings."""
+        self.service.get_user_recomm('9')
+
+        timings = metrics.snapshot()['timings']
+        for stage in ('id_lookup', 'scoring', 'top_k', 'hydration'):
+            self.assertIn(f'recommendation.{stage}', timings)
@@ -0,0 +1,95 @@
+"""
+Tests for session-based recommendations.
+"""
+import tempfile
+
+import numpy as np
+
+from django.test import TestCase
+
+from core.models import Product, UserAction
+from recommendation.services import RecommendationService
+from recommendation.sessions import SessionStore
+from recommendation.similarity import NeighbourIndex
+
+
+class StaticIndex:
+    """Index loader returning a fixed index."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+
+class SessionStoreTests(TestCase):
+    """Test per-user ring buffers."""
+
+    def test_ring_buffer_keeps_latest_products(self):
+        """Test only the newest products are kept, oldest first."""
+        store = SessionStore(size=3)
+        for product_id in range(1, 6):
+            store.record('1', product_id)
+
+        self.assertEqual(store.recent('1').tolist(), [3, 4, 5])
+        self.assertEqual(store.recent('2').tolist(), [])
+
+    def test_session_seeded_from_user_actions(self):
+        """Test a new worker picks up the actions already logged."""
+        UserAction.objects.create(
+            user_id='1', product_id='10', event_type='view')
+        UserAction.objects.create(
+            user_id='1', product_id='11', event_type='remove_from_cart')
+        UserAction.objects.create(
+            user_id='1', product_id='12', event_type='cart')
+        store = SessionStore(size=5)
+
+        store.record('1', 12)
+
+        self.assertEqual(store.recent('1').tolist(), [10, 12])
+
+
+class SessionRecommendationTests(TestCase):
+    """Test scoring products for a session."""
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'P{i}') for i in range(4)]
+        self.ids = [p.id for p in self.products]
+        self.store = SessionStore()
+        self.service = RecommendationService(
+            model_dir=tempfile.gettempdir(), sessions=self.store)
+
+    def test_session_recommendations_from_embeddings(self):
+        """Test products close to the session embedding rank first."""
+        self.service.product_embeddings = np.array([
+            [1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.7, 0.7],
+        ], dtype=np.float32)
+        self.service.product_encoder = type(
+            'Encoder', (), {'classes_': np.array([str(i) for i in self.ids])})
+        self.service.product_positions = {
+            str(pid): position for position, pid in enumerate(self.ids)}
+        self.store.record('9', self.ids[0])
+
+        products = list(self.service.get_user_recomm('9', top_n=2))
+
+        self.assertEqual(products, [self.products[1], self.products[3]])
+
+    def test_session_recommendations_from_neighbours(self):
+        """Test co-view neighbours personalize without a trained model."""
+        self.service.neighbours = StaticIndex(NeighbourIndex(
+            product_ids=np.array(self.ids),
+            indptr=np.array([0, 2, 2, 2, 2]),
+            neighbours=np.array([3, 2], dtype=np.int32),
+            scores=np.array([0.8, 0.4], dtype=np.float32),
+        ))
+        self.store.record('9', self.ids[0])
+
+        products = list(self.service.get_user_recomm('9'))
+
+        self.assertEqual(products, [self.products[3], self.products[2]])
+
+    def test_empty_session_without_model(self):
+        """Test nothing is recommended without a session or model."""
+        self.assertEqual(list(self.service.get_user_recomm('9')), [])
@@ -0,0 +1,126 @@
+"""
+Tests for the co-view similarity index.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Product, UserAction
+from recommendation.similarity import (
+    IndexLoader,
+    NeighbourIndex,
+    build_similarity_index,
+    read_sessions,
+)
+
+
+def similar_url(product_id):
+    """Create and return a similar products URL."""
+    return reverse('product:product-generic-similar', args=[product_id])
+
+
+class SimilarityIndexTests(TestCase):
+    """Test building and reading the similarity index."""
+
+    def test_build_index_ranks_co_viewed_products(self):
+        """Test products sharing more sessions are closer neighbours."""
+        sessions = np.array([0, 0, 0, 1, 1, 2, 2, 3])
+        products = np.array([10, 20, 30, 10, 20, 10, 20, 30])
+
+        for workers in (1, 2):
+            index = build_similarity_index(
+                sessions, products, k=5, shards=2, workers=workers)
+            self.assertEqual(index.similar(10)[0][0], 20)
+            self.assertEqual([pid for pid, _ in index.similar(10)], [20, 30])
+            self.assertAlmostEqual(index.similar(10)[0][1], 1.0, places=5)
+            self.assertEqual(index.similar(99), [])
+
+    def test_build_index_keeps_top_k(self):
+        """Test only the best k neighbours are stored."""
+        sessions = np.array([0, 0, 0, 0])
+        products = np.array([1, 2, 3, 4])
+
+        index = build_similarity_index(sessions, products, k=2)
+
+        self.assertEqual(len(index.similar(1)), 2)
+        self.assertEqual(index.indptr[-1], 8)
+
+    def test_save_and_load(self):
+        """Test the index round-trips through its file."""
+        index = build_similarity_index(
+            np.array([0, 0, 1, 1]), np.array([5, 6, 6, 7]), k=3)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'index.npz')
+            index.save(path)
+            loaded = IndexLoader(path).get()
+
+        self.assertEqual(loaded.similar(6), index.similar(6))
+
+    def test_read_sessions_splits_on_idle_gap(self):
+        """Test events further apart than the gap start a new session."""
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for minutes, product_id in ((0, '1'), (5, '2'), (120, '3')):
+            action = UserAction.objects.create(
+                user_id='7', product_id=product_id, event_type='view')
+            UserAction.objects.filter(pk=action.pk).update(
+                event_time=start + timedelta(minutes=minutes))
+        UserAction.objects.create(
+            user_id='7', product_id='4', event_type='purchase')
+
+        sessions, products = read_sessions(session_gap=1800)
+
+        self.assertEqual(products.tolist(), [1, 2, 3])
+        self.assertEqual(sessions.tolist(), [0, 0, 1])
+
+
+class SimilarProductsApiTests(TestCase):
+    """Test the similar products endpoint."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_similar_products(self):
+        """Test similar products are returned in index order."""
+        products = [Product.objects.create(name=f'P{i}') for i in range(3)]
+        ids = np.array([p.id for p in products])
+        index = NeighbourIndex(
+            product_ids=ids,
+            indptr=np.array([0, 2, 2, 2]),
+            neighbours=np.array([2, 1], dtype=np.int32),
+            scores=np.array([0.9, 0.5], dtype=np.float32),
+        )
+
+        with patch(
+                'product.views.similar_products_index.get',
+                return_value=index):
+            res = self.client.get(similar_url(products[0].id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [p['id'] for p in res.data['similar']],
+            [products[2].id, products[1].id])
+
+    def test_similar_products_without_index(self):
+        """Test an empty list is returned before the index is built."""
+        product = Product.objects.create(name='P')
+
+        with patch(
+                'product.views.similar_products_index.get',
+                return_value=None):
+            res = self.client.get(similar_url(product.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['similar'], [])
@@ -0,0 +1,108 @@
+"""
+Tests for the trending products engine.
+"""
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Category, Product
+from recommendation.trending import TrendingEngine
+
+TRENDING_URL = reverse('recommendation:trending-products')
+
+
+class TrendingEngineTests(TestCase):
+    """Test time-decayed trending scores."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp_dir.name, 'trending.npz')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_recent_activity_ranks_higher(self):
+        """Test older events decay faster in the shorter windows."""
+        engine = TrendingEngine()
+        now = time.time()
+        for _ in range(3):
+            engine.record(1, 1.0, at=now - 6 * 3600)
+        engine.record(2, 1.0, at=now)
+
+        self.assertEqual(engine.top('1h', limit=2), [2, 1])
+        self.assertEqual(engine.top('7d', limit=2), [1, 2])
+        self.assertAlmostEqual(
+            engine.scores('1h', now=now)[2], 1.0, places=5)
+
+    def test_category_ranking(self):
+        """Test trending lists can be restricted to a category."""
+        category = Category.objects.create(name='Shoes')
+        shoe = Product.objects.create(name='Sneaker')
+        shoe.category.add(category)
+        other = Product.objects.create(name='Hat')
+        engine = TrendingEngine()
+        engine.record(other.id, 5.0)
+        engine.record(shoe.id, 1.0)
+
+        self.assertEqual(engine.top(category_id=category.id), [shoe.id])
+
+    def test_snapshots_merge_across_engines(self):
+        """Test each engine adds its increments to the shared snapshot."""
+        first = TrendingEngine(snapshot_path=self.snapshot_path)
+        second = TrendingEngine(snapshot_path=self.snapshot_path)
+        first.record(1, 2.0)
+        second.record(2, 3.0)
+        first.flush()
+        second.flush()
+
+        restarted = TrendingEngine(snapshot_path=self.snapshot_path)
+        scores = restarted.scores('24h')
+        self.assertAlmostEqual(scores[1], 2.0, places=3)
+        self.assertAlmostEqual(scores[2], 3.0, places=3)
+        self.assertEqual(restarted.top(limit=2), [2, 1])
+
+
+class TrendingProductsApiTests(TestCase):
+    """Test the trending products endpoint."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'))
+        self.engine = TrendingEngine()
+        self.products = [
+            Product.objects.create(name=f'Product {i}') for i in range(3)]
+        for weight, product in enumerate(self.products, start=1):
+            self.engine.record(product.id, weight)
+
+    def test_limit_is_clamped(self):
+        """Test limits below 1 list one product instead of slicing."""
+        with mock.patch('recommendation.views.trending_engine', self.engine):
+            res = self.client.get(TRENDING_URL, {'limit': -5})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [product['id'] for product in res.data['products']],
+            [self.products[-1].id])
+
+    def test_cards_in_trending_order(self):
+        """Test products come from the card cache in a fixed query count."""
+        with mock.patch('recommendation.views.trending_engine', self.engine):
+            # Versions, then the products and images of the missing cards
+            with self.assertNumQueries(3):
+                res = self.client.get(TRENDING_URL)
+            with self.assertNumQueries(1):
+                cached = self.client.get(TRENDING_URL)
+
+        self.assertEqual(
+            [product['id'] for product in res.data['products']],
+            [product.id for product in reversed(self.products)])
+        self.assertEqual(cached.data, res.data)
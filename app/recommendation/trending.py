@@ -0,0 +1,265 @@
+"""
+Time-decayed trending products.
+
+Every product keeps one exponentially decayed activity score per window
+(1h, 24h, 7d). Scores use forward decay: an event at time ``t`` adds
+``weight * exp((t - landmark) / tau)`` so recording is a single array
+update and ranking never has to touch old events. The arrays are indexed
+by product ID and each worker periodically merges its pending increments
+into a shared snapshot file, which also picks up the activity recorded by
+the other workers and survives restarts.
+"""
+import atexit
+import fcntl
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from core.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {
+    '1h': 3600.0,
+    '24h': 86400.0,
+    '7d': 604800.0,
+}
+WINDOW_NAMES = tuple(WINDOWS)
+TAUS = np.array([WINDOWS[name] for name in WINDOW_NAMES], dtype=np.float64)
+
+# Rebase the landmark before exp((t - landmark) / tau) overflows float32.
+REBASE_AFTER = 24 * 3600.0
+
+
+def _decay_factors(delta):
+    """Multipliers moving scores from one landmark to another."""
+    return np.exp(-delta / TAUS).astype(np.float32)[:, None]
+
+
+def _resize(scores, size):
+    """Grow a (windows, products) score matrix to hold ``size`` products."""
+    if scores.shape[1] >= size:
+        return scores
+    grown = np.zeros(
+        (len(WINDOW_NAMES), max(size, scores.shape[1] * 2)),
+        dtype=np.float32)
+    grown[:, :scores.shape[1]] = scores
+    return grown
+
+
+class TrendingEngine:
+    """In-process trending scores with periodic shared snapshots."""
+
+    def __init__(
+            self,
+            snapshot_path=None,
+            flush_interval=60.0,
+            cache_ttl=5.0,
+            category_ttl=300.0):
+        self.snapshot_path = snapshot_path
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.category_ttl = category_ttl
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.landmark = time.time()
+        # Merged state from the snapshot and increments not yet flushed.
+        self._base = np.zeros((len(WINDOW_NAMES), 0), dtype=np.float32)
+        self._pending = np.zeros((len(WINDOW_NAMES), 0), dtype=np.float32)
+        self._last_flush = time.monotonic()
+        self._rankings = {}
+        self._categories = None
+        self._categories_loaded = 0.0
+        self._load_snapshot()
+
+    def record(self, product_id, weight=1.0, at=None):
+        """Record activity on a product."""
+        product_id = int(product_id)
+        at = time.time() if at is None else at
+        with self._lock:
+            if at - self.landmark > REBASE_AFTER:
+                self._rebase(at)
+            self._pending = _resize(self._pending, product_id + 1)
+            self._pending[:, product_id] += (
+                weight * np.exp((at - self.landmark) / TAUS))
+        self._maybe_flush()
+
+    def scores(self, window='24h', now=None):
+        """Return the decayed scores of every product for a window."""
+        row = WINDOW_NAMES.index(window)
+        now = time.time() if now is None else now
+        with self._lock:
+            combined = self._combined(row)
+            landmark = self.landmark
+        return combined * np.exp(-(now - landmark) / TAUS[row])
+
+    def top(self, window='24h', limit=20, category_id=None):
+        """Return IDs of the highest scoring products, best first."""
+        if window not in WINDOWS:
+            raise ValueError(
+                f"Unknown window {window}. "
+                f"Must be one of {list(WINDOW_NAMES)}.")
+        key = (window, category_id)
+        cached = self._rankings.get(key)
+        if cached is None or time.monotonic() - cached[0] > self.cache_ttl:
+            cached = (time.monotonic(), self._rank(window, category_id))
+            self._rankings[key] = cached
+            self._maybe_flush()
+        return cached[1][:limit].tolist()
+
+    def flush(self):
+        """Merge pending increments into the shared snapshot file."""
+        if not self.snapshot_path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                local_landmark = self.landmark
+                self._pending = np.zeros(
+                    (len(WINDOW_NAMES), 0), dtype=np.float32)
+            try:
+                os.makedirs(
+                    os.path.dirname(self.snapshot_path), exist_ok=True)
+                with open(f"{self.snapshot_path}.lock", 'w') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    stored = self._read_snapshot()
+                    if stored is None:
+                        base = np.zeros(
+                            (len(WINDOW_NAMES), 0), dtype=np.float32)
+                        landmark = local_landmark
+                    else:
+                        base, stored_landmark = stored
+                        landmark = max(local_landmark, stored_landmark)
+                        base = base * _decay_factors(
+                            landmark - stored_landmark)
+                    base = _resize(base, pending.shape[1])
+                    base[:, :pending.shape[1]] += pending * _decay_factors(
+                        landmark - local_landmark)
+                    self._write_snapshot(base, landmark)
+            except Exception as e:
+                logger.error(f"Error writing trending snapshot: {e}")
+                with self._lock:
+                    self._pending = _resize(self._pending, pending.shape[1])
+                    self._pending[:, :pending.shape[1]] += \
+                        pending * _decay_factors(
+                            self.landmark - local_landmark)
+                return
+
+            with self._lock:
+                self._pending = self._pending * _decay_factors(
+                    landmark - self.landmark)
+                self._base = base
+                self.landmark = landmark
+
+    def close(self):
+        """Flush increments that have not reached the snapshot yet."""
+        if self._pending.any():
+            self.flush()
+
+    def replace(self, scores, landmark):
+        """Replace all state, e.g. after rebuilding from history."""
+        with self._lock:
+            self._base = scores.astype(np.float32)
+            self._pending = np.zeros(
+                (len(WINDOW_NAMES), 0), dtype=np.float32)
+            self.landmark = landmark
+            self._rankings = {}
+        if self.snapshot_path:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(f"{self.snapshot_path}.lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._write_snapshot(self._base, landmark)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._last_flush = time.monotonic()
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def _combined(self, row):
+        size = max(self._base.shape[1], self._pending.shape[1])
+        combined = np.zeros(size, dtype=np.float32)
+        combined[:self._base.shape[1]] += self._base[row]
+        combined[:self._pending.shape[1]] += self._pending[row]
+        return combined
+
+    def _rank(self, window, category_id):
+        row = WINDOW_NAMES.index(window)
+        with self._lock:
+            scores = self._combined(row)
+        if category_id is not None:
+            members = self._category_members(category_id)
+            members = members[members < len(scores)]
+            candidates = members[scores[members] > 0]
+        else:
+            candidates = np.flatnonzero(scores > 0)
+        # Keep a bounded ranking; callers never ask for more than this.
+        k = min(len(candidates), 500)
+        if k == 0:
+            return np.array([], dtype=np.int64)
+        top = candidates[
+            np.argpartition(-scores[candidates], k - 1)[:k]]
+        return top[np.argsort(-scores[top], kind='stable')]
+
+    def _category_members(self, category_id):
+        now = time.monotonic()
+        if self._categories is None \
+                or now - self._categories_loaded > self.category_ttl:
+            rows = np.array(
+                Product.category.through.objects.values_list(
+                    'category_id', 'product_id'),
+                dtype=np.int64).reshape(-1, 2)
+            order = np.argsort(rows[:, 0], kind='stable')
+            rows = rows[order]
+            keys, starts = np.unique(rows[:, 0], return_index=True)
+            self._categories = {
+                int(key): rows[start:end, 1]
+                for key, start, end in zip(
+                    keys, starts, list(starts[1:]) + [len(rows)])
+            }
+            self._categories_loaded = now
+        return self._categories.get(
+            int(category_id), np.array([], dtype=np.int64))
+
+    def _rebase(self, at):
+        """Move the landmark forward; caller holds the lock."""
+        factors = _decay_factors(at - self.landmark)
+        self._base = self._base * factors
+        self._pending = self._pending * factors
+        self.landmark = at
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with np.load(self.snapshot_path) as data:
+            return data['scores'].astype(np.float32), float(data['landmark'])
+
+    def _write_snapshot(self, scores, landmark):
+        tmp_path = f"{self.snapshot_path}.tmp.npz"
+        np.savez(tmp_path, scores=scores, landmark=landmark)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _load_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            stored = self._read_snapshot()
+        except Exception as e:
+            logger.error(f"Error loading trending snapshot: {e}")
+            return
+        if stored is not None:
+            self._base, self.landmark = stored
+            logger.info(f"Loaded trending snapshot from {self.snapshot_path}")
+
+
+# Global instance
+trending_engine = TrendingEngine(
+    snapshot_path=getattr(settings, 'TRENDING_SNAPSHOT_PATH', None),
+    flush_interval=getattr(settings, 'TRENDING_FLUSH_SECONDS', 60),
+    cache_ttl=getattr(settings, 'TRENDING_CACHE_SECONDS', 5),
+)
+atexit.register(trending_engine.close)
@@ -17,4 +17,9 @@ urlpatterns = [
         views.RecommendationViewSet.as_view({'get': 'for_user'}),
         name='recommended-products',
     ),
+    path(
+        'trending-products/',
+        views.TrendingProductsView.as_view(),
+        name='trending-products',
+    ),
 ]
@@ -2,15 +2,20 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import viewsets
+from core.metrics import metrics
+from product.cards import get_product_cards
 from recommendation.services import recomm_svc
+from recommendation.trending import trending_engine, WINDOW_NAMES
+from recommendation.sessions import session_store, SESSION_EVENT_TYPES
 from rest_framework import (status, pagination)
 from core.models import UserAction, Product
-import pandas as pd
 from product.serializers import (
     ProductGenericSerializer,
 )
 from recommendation.serializers import (
     UserActionSerializer)
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from django.utils import timezone
 
 
 class LogUserActionView(APIView):
@@ -28,9 +33,8 @@ class LogUserActionView(APIView):
                 status=status.HTTP_400_BAD_REQUEST)
 
         # Validate product_id
-        product_ids = Product.objects.all().values_list(
-            'id', flat=True)
-        if product_id not in product_ids.astype(str):
+        if not str(product_id).isdigit() or not Product.objects.filter(
+                id=product_id).exists():
             return Response(
                 {"error": "Invalid product_id"},
                 status=status.HTTP_400_BAD_REQUEST)
@@ -42,13 +46,18 @@ class LogUserActionView(APIView):
             'remove_from_cart': -1.0}
         score = event_weights.get(event_type, 1.0)
 
-        UserAction.objects.create(
+        action = UserAction.objects.create(
             user_id=user_id,
             product_id=product_id,
             event_type=event_type,
-            event_time=pd.Timestamp.now(),
+            event_time=timezone.now(),
             score=score
         )
+        trending_engine.record(
+            product_id, score, action.event_time.timestamp())
+        if event_type in SESSION_EVENT_TYPES:
+            session_store.record(user_id, product_id)
+        recomm_svc.record_action(user_id)
         return Response(
             {"status": "Action logged"},
             status=status.HTTP_201_CREATED)
@@ -62,16 +71,75 @@ class RecommendationViewSet(viewsets.ViewSet):
     def for_user(self, request):
         """Get recommendations for the authenticated user"""
         user = request.user
-        top_n = int(request.query_params.get('limit', 20))
+        try:
+            top_n = max(
+                1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response(
+                {"error": "limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST)
 
-        recommended_products = recomm_svc.get_user_recomm(
-            user_id=user.id,
-            top_n=top_n
-        )
+        with metrics.timer('recommendation.request'):
+            product_ids = recomm_svc.get_user_recomm_ids(
+                user_id=user.id,
+                top_n=top_n
+            )
+            with metrics.timer('recommendation.hydration'):
+                cards = get_product_cards(product_ids)
+        recommendations = [
+            cards[pid] for pid in product_ids if pid in cards]
+        return Response({
+            'recommendations': recommendations,
+            'count': len(recommendations)
+        })
+
+
+class TrendingProductsView(APIView):
+    """API View to list trending products"""
+    serializer_class = ProductGenericSerializer
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='window',
+                type=str,
+                enum=list(WINDOW_NAMES),
+                description='Activity window (default 24h)'
+            ),
+            OpenApiParameter(
+                name='category_id',
+                type=int,
+                description='Only list products of this category'
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=int,
+                description='Number of products (default 20, max 100)'
+            ),
+        ]
+    )
+    def get(self, request):
+        window = request.query_params.get('window', '24h')
+        category_id = request.query_params.get('category_id')
+        try:
+            limit = max(
+                1, min(int(request.query_params.get('limit', 20)), 100))
+            category_id = int(category_id) if category_id else None
+        except ValueError:
+            return Response(
+                {"error": "limit and category_id must be integers"},
+                status=status.HTTP_400_BAD_REQUEST)
+        if window not in WINDOW_NAMES:
+            return Response(
+                {"error": f"window must be one of {list(WINDOW_NAMES)}"},
+                status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ProductGenericSerializer(
-            recommended_products, many=True)
+        product_ids = trending_engine.top(
+            window=window, limit=limit, category_id=category_id)
+        cards = get_product_cards(product_ids)
+        products = [cards[pid] for pid in product_ids if pid in cards]
         return Response({
-            'recommendations': serializer.data,
-            'count': len(serializer.data)
+            'window': window,
+            'products': products,
+            'count': len(products)
         })
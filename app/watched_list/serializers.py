@@ -1,14 +1,17 @@
 from rest_framework import serializers
 
+from core.fieldsets import SparseFieldsMixin
 from core.models import (
     Product,
     UserWatchedProduct,
 )
 
+from product.cards import ProductCardListSerializer, ProductCardMixin
 from product.serializers import ProductGenericSerializer
 
 
-class UserWatchedProductSerializer(serializers.ModelSerializer):
+class UserWatchedProductSerializer(
+        ProductCardMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for user watched product."""
     # Check if the generic product serializer works fine here
     product = serializers.PrimaryKeyRelatedField(
@@ -25,9 +28,17 @@ class UserWatchedProductSerializer(serializers.ModelSerializer):
             'created_at',
         ]
         read_only_fields = ('id',)
+        list_serializer_class = ProductCardListSerializer
+
+    card_field = 'shown_product'
+    collapsed_fields = {
+        'shown_product': serializers.ReadOnlyField(source='product_id'),
+    }
+    column_sources = {'shown_product': ['product']}
+
+    def card_product_id(self, obj):
+        return obj.product_id
 
     def get_shown_product(self, obj) -> ProductGenericSerializer:
         """Get the product serializer."""
-        product = obj.product
-        serializer = ProductGenericSerializer(product)
-        return serializer.data
+        return self.product_card(obj)
@@ -1,10 +1,17 @@
+from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import viewsets
 
 from watched_list.serializers import UserWatchedProductSerializer
+from core.fieldsets import FIELDSET_PARAMETERS, SparseFieldsViewMixin
 from core.models import UserWatchedProduct
 
 
-class UserWatchedProductViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class UserWatchedProductViewSet(
+        SparseFieldsViewMixin, viewsets.ModelViewSet):
     """Retrieve all and a single product"""
     queryset = UserWatchedProduct.objects.all()
     serializer_class = UserWatchedProductSerializer
@@ -14,11 +21,12 @@ class UserWatchedProductViewSet(viewsets.ModelViewSet):
         queryset = self.queryset
         user = self.request.user
         if user.is_authenticated:
-            queryset = queryset.filter(
-                user=user
-            ).distinct()
+            queryset = queryset.filter(user=user)
         else:
             queryset = queryset.none()
+        columns = self.get_fieldset_columns()
+        if columns is not None:
+            queryset = queryset.only(*columns)
         return queryset
 
     def perform_create(self, serializer):